@@ -11,11 +11,22 @@ import tmlib.controllers.categories_controller
 import tmlib.controllers.notifications_controller
 import tmlib.controllers.tasks_controller
 import tmlib.controllers.task_plans_controller
+from tmlib.storage.engine import get_engine
+from tmlib.storage.unit_of_work import unit_of_work
+from tmlib.scheduler import Scheduler, BATCH_SIZE, MAX_SLEEP
 from tmlib.models.category import Category
 from tmlib.models.task import Task, Status, Priority
 from tmlib.models.task_plan import TaskPlan
 from tmlib.models.notification import Notification, Status as NotificationStatus
-from tmlib.exceptions.exceptions import UserHasNoRightError
+from tmlib.storage.pagination import PageRequest
+from tmlib.storage.task_storage import TASK_ORDERINGS
+from tmlib.exceptions.exceptions import (
+    UserHasNoRightError,
+    InvalidCursorError,
+    SchedulerIsRunningError,
+    TaskDoesNotExistError,
+    InvalidRecurrenceRuleError,
+    InvalidTaskPlanIntervalError)
 
 
 class DefaultHelpParser(argparse.ArgumentParser):
@@ -90,9 +101,35 @@ def init_parser():
         metavar='')
     create_notification_parser(notification_parser)
 
+    scheduler = subparser.add_parser(
+        'scheduler',
+        help='Runs scheduler of notifications and task plans',
+        usage='task_manager scheduler ')
+    create_scheduler_parser(scheduler)
+
     return parser
 
 
+def create_scheduler_parser(parser):
+    parser.add_argument(
+        '-b',
+        '--batch_size',
+        type=int,
+        default=BATCH_SIZE,
+        help='number of notifications or plans processed in one transaction')
+    parser.add_argument(
+        '-s',
+        '--max_sleep',
+        type=int,
+        default=MAX_SLEEP,
+        help='maximal number of seconds between checks of database')
+    parser.add_argument(
+        '-c',
+        '--catch_up',
+        action='store_true',
+        help='creates task for every missed interval of task plan instead of only one')
+
+
 def create_user_parser(parser):
     parser.add_parser('add', help='Adds new user').add_argument(
         'username')
@@ -155,6 +192,12 @@ def create_task_parser(parser):
         '-r',
         '--repeat',
         help="Creates repeated task according to interval. E.g. --repeat 'every 1 week'")
+    optional_add_task_arguments.add_argument(
+        '-ru',
+        '--rule',
+        help="Creates repeated task according to cron-style rule 'minute hour day month weekday'. "
+             "E.g. --rule '0 10 * * 1-5' for every weekday at 10:00, --rule '0 18 * * 5L' for the last friday "
+             "of month")
     optional_add_task_arguments.add_argument(
         '-sa',
         '--start_repeat_at',
@@ -258,6 +301,49 @@ def create_task_parser(parser):
         help="user's ID",
         required=True)
 
+    agenda_parser = parser.add_parser(
+        'agenda', help="Shows tasks and events day by day")
+    agenda_parser.add_argument(
+        '-f',
+        '--from',
+        dest='from_date',
+        help="first day of agenda. E.g. --from 'next monday'. Today by default")
+    agenda_parser.add_argument(
+        '-d',
+        '--days',
+        type=int,
+        default=config.AGENDA_DAYS,
+        help='number of days in agenda')
+    agenda_parser.add_argument(
+        '-o',
+        '--own',
+        action='store_true',
+        help="shows only user's own tasks without assigned and shared ones")
+
+    materialize_parser = parser.add_parser(
+        'materialize', help="Stores occurrence of planned task, so it can be changed apart from other occurrences")
+    materialize_parser.add_argument(
+        '-pid',
+        '--plan_id',
+        help="task plan's ID",
+        required=True)
+    materialize_parser.add_argument(
+        '-at',
+        '--occurrence_at',
+        help="time of occurrence as agenda prints it. E.g. -at '2018-06-04 09:00:00'",
+        required=True)
+
+    search_task_parser = parser.add_parser(
+        'search', help="Searches words in titles and notes of tasks")
+    search_task_parser.add_argument(
+        'query', nargs='+', help='words to search, the last one can be incomplete')
+    search_task_parser.add_argument(
+        '-l',
+        '--limit',
+        type=int,
+        default=config.SEARCH_LIMIT,
+        help='maximal number of found tasks')
+
     rights_parser = parser.add_parser('rights', help="Manages user's rights")
     rights_subparser = rights_parser.add_subparsers(
         dest='rights_action',
@@ -275,7 +361,7 @@ def create_show_task_parser(parser):
         'id',
         help="task's ID")
 
-    parser.add_parser('all', help="Shows all user's tasks")
+    add_page_arguments(parser.add_parser('all', help="Shows all user's tasks"))
 
     show_inner_tasks_parser = parser.add_parser(
         'inner', help="Shows inner tasks by parent task's ID")
@@ -287,20 +373,46 @@ def create_show_task_parser(parser):
         'id',
         help="inner task's ID")
 
-    parser.add_parser('assigned', help="Shows tasks assigned on current user")
+    add_page_arguments(parser.add_parser(
+        'assigned', help="Shows tasks assigned on current user"))
 
-    parser.add_parser('todo', help="Shows user's todo tasks")
-    parser.add_parser('in_progress', help="Shows user's in progress tasks")
-    parser.add_parser('done', help="Shows user's done tasks")
-    parser.add_parser('archived', help="Shows user's archived tasks")
+    add_page_arguments(parser.add_parser('todo', help="Shows user's todo tasks"))
+    add_page_arguments(parser.add_parser(
+        'in_progress', help="Shows user's in progress tasks"))
+    add_page_arguments(parser.add_parser('done', help="Shows user's done tasks"))
+    add_page_arguments(parser.add_parser(
+        'archived', help="Shows user's archived tasks"))
 
-    parser.add_parser(
+    add_page_arguments(parser.add_parser(
         'can_read',
-        help="Shows tasks that current user can read")
+        help="Shows tasks that current user can read"))
 
-    parser.add_parser(
+    add_page_arguments(parser.add_parser(
         'can_write',
-        help="Shows tasks that current user can read and write")
+        help="Shows tasks that current user can read and write"))
+
+
+def add_page_arguments(parser):
+    parser.add_argument(
+        '--order-by',
+        dest='order_by',
+        default='id',
+        choices=list(TASK_ORDERINGS),
+        help='field to order tasks by')
+    parser.add_argument(
+        '--page-size',
+        dest='page_size',
+        type=int,
+        default=config.PAGE_SIZE,
+        help='number of tasks on page')
+    parser.add_argument(
+        '--cursor',
+        help='cursor of page printed after previous command')
+    parser.add_argument(
+        '--desc',
+        dest='descending',
+        action='store_true',
+        help='order tasks in descending order')
 
 
 def create_task_plan_parser(parser):
@@ -310,6 +422,10 @@ def create_task_plan_parser(parser):
         '-r',
         '--repeat',
         help="Creates repeated task according to interval. E.g. --repeat 'every 1 week'")
+    edit_task_plan_parser.add_argument(
+        '-ru',
+        '--rule',
+        help="Cron-style rule 'minute hour day month weekday'. E.g. --rule '0 10 * * 1-5'")
     edit_task_plan_parser.add_argument(
         '-sa',
         '--start_repeat_at',
@@ -317,6 +433,15 @@ def create_task_plan_parser(parser):
 
     parser.add_parser('all', help='Shows all plans')
 
+    preview_task_plan_parser = parser.add_parser('preview', help="Shows plan's next occurrences")
+    preview_task_plan_parser.add_argument('id', help="Plan's ID")
+    preview_task_plan_parser.add_argument(
+        '-n',
+        '--number',
+        type=int,
+        default=config.PREVIEW_OCCURRENCES,
+        help='number of occurrences')
+
 
 def create_rights_parser(parser):
     add_right_parser = parser.add_parser(
@@ -482,25 +607,25 @@ def process_task_action(args, user):
         if args.show_action == 'id':
             show_task(args, user)
         elif args.show_action == 'all':
-            show_all_tasks(user)
+            show_all_tasks(args, user)
         elif args.show_action == 'inner':
             show_inner_tasks(args, user)
         elif args.show_action == 'parent':
             show_parent_task(args, user)
         elif args.show_action == 'assigned':
-            show_assigned_tasks(user)
+            show_assigned_tasks(args, user)
         elif args.show_action == 'todo':
-            show_to_do_tasks(user)
+            show_to_do_tasks(args, user)
         elif args.show_action == 'in_progress':
-            show_in_progress_tasks(user)
+            show_in_progress_tasks(args, user)
         elif args.show_action == 'done':
-            show_done_tasks(user)
+            show_done_tasks(args, user)
         elif args.show_action == 'archived':
-            show_archived_tasks(user)
+            show_archived_tasks(args, user)
         elif args.show_action == 'can_read':
-            show_can_read_tasks(user)
+            show_can_read_tasks(args, user)
         elif args.show_action == 'can_write':
-            show_can_write_tasks(user)
+            show_can_write_tasks(args, user)
     elif args.action == 'set_status':
         if args.set_status_action == 'todo':
             set_task_as_to_do(args, user)
@@ -516,6 +641,12 @@ def process_task_action(args, user):
         create_inner_task(args, user)
     elif args.action == 'assign':
         assign_task_on_user(args, user)
+    elif args.action == 'search':
+        search_tasks(args, user)
+    elif args.action == 'agenda':
+        show_agenda(args, user)
+    elif args.action == 'materialize':
+        materialize_occurrence(args, user)
     elif args.action == 'rights':
         if args.rights_action == 'add':
             if args.rights_add_action == 'read':
@@ -552,6 +683,8 @@ def process_task_plan_action(args, user):
         edit_task_plan(args, user)
     elif args.action == 'all':
         show_all_task_plans(user)
+    elif args.action == 'preview':
+        preview_task_plan(args, user)
 
 
 def add_user(args, user_session):
@@ -650,7 +783,30 @@ def add_task(args, user):
         task.category_id = args.category_id
     if args.priority is not None:
         task.priority = Priority[args.priority.upper()].value
-    if args.repeat is not None:
+    if args.rule is not None:
+        last_created_at = datetime.datetime.now()
+        if args.start_repeat_at is not None:
+            start_date = dateparser.parse(args.start_repeat_at)
+            if start_date is not None:
+                last_created_at = start_date
+        plan = TaskPlan(
+            task_id=None,
+            user_id=user.id,
+            interval=0,
+            last_created_at=last_created_at,
+            is_virtual=True,
+            rule=args.rule)
+        try:
+            occurrences = commands.preview_occurrences(plan, config.PREVIEW_OCCURRENCES, last_created_at)
+        except (InvalidRecurrenceRuleError, InvalidTaskPlanIntervalError) as error:
+            print('Error. {}'.format(error), file=sys.stderr)
+            quit()
+        task.status = Status.TEMPLATE.value
+        plan.task_id = commands.add_task(create_tasks_controller(user), task).id
+        commands.add_task_plan(create_task_plans_controller(user), plan)
+        print('Planned task added, next occurrences:')
+        print_occurrences(occurrences)
+    elif args.repeat is not None:
         parsed_time = dateparser.parse(args.repeat)
         if parsed_time is None:
             print("Error. Repeat time is incorrect", file=sys.stderr)
@@ -673,7 +829,8 @@ def add_task(args, user):
                 task_id=task_id,
                 user_id=user.id,
                 interval=interval,
-                last_created_at=last_created_at)
+                last_created_at=last_created_at,
+                is_virtual=True)
             commands.add_task_plan(create_task_plans_controller(user), plan)
             print('Planned task added')
     else:
@@ -815,61 +972,130 @@ def remove_user_for_write(args, user):
         task_id=args.task_id)
 
 
-def show_all_tasks(user):
+def show_all_tasks(args, user):
     print('Tasks:')
-    tasks = commands.user_tasks(create_tasks_controller(user))
-    print_task_list(tasks, user)
+    print_task_page(
+        get_task_page(args, commands.user_tasks, create_tasks_controller(user)), user)
 
 
-def show_assigned_tasks(user):
+def show_assigned_tasks(args, user):
     print('Assigned tasks:')
-    tasks = commands.assigned_tasks(create_tasks_controller(user))
-    print_task_list(tasks, user)
+    print_task_page(
+        get_task_page(args, commands.assigned_tasks, create_tasks_controller(user)), user)
 
 
-def show_can_read_tasks(user):
+def show_can_read_tasks(args, user):
     print('Can read tasks:')
-    tasks = commands.can_read_tasks(create_tasks_controller(user))
-    print_task_list(tasks, user)
+    print_task_page(
+        get_task_page(args, commands.can_read_tasks, create_tasks_controller(user)), user)
 
 
-def show_can_write_tasks(user):
+def show_can_write_tasks(args, user):
     print('Can write tasks:')
-    tasks = commands.can_write_tasks(create_tasks_controller(user))
-    print_task_list(tasks, user)
+    print_task_page(
+        get_task_page(args, commands.can_write_tasks, create_tasks_controller(user)), user)
+
+
+def show_agenda(args, user):
+    first_day = datetime.date.today()
+    if args.from_date is not None:
+        parsed_date = dateparser.parse(args.from_date)
+        if parsed_date is None:
+            print("Error. Agenda's first day is incorrect", file=sys.stderr)
+            quit()
+        first_day = parsed_date.date()
+    start = datetime.datetime.combine(first_day, datetime.time())
+    tasks = commands.tasks_in_window(
+        create_tasks_controller(user),
+        start,
+        start + datetime.timedelta(days=args.days),
+        include_shared=not args.own)
+    access_levels = commands.get_tasks_access_levels(
+        create_tasks_controller(user), [task.id for task in tasks if not task.is_virtual])
+    for day_number in range(args.days):
+        day = first_day + datetime.timedelta(days=day_number)
+        day_tasks = [task for task in tasks if takes_place_on(task, day)]
+        if day_tasks:
+            print(day.strftime('%A, %d %B %Y:'))
+            for task in day_tasks:
+                print_task(task, user, access_levels.get(task.id))
+
+
+def materialize_occurrence(args, user):
+    occurrence_at = dateparser.parse(args.occurrence_at)
+    if occurrence_at is None:
+        print("Error. Occurrence time is incorrect", file=sys.stderr)
+        quit()
+    try:
+        task = commands.materialize_occurrence(
+            create_tasks_controller(user), int(args.plan_id), occurrence_at)
+    except TaskDoesNotExistError:
+        print("Error. Task plan has no occurrence at this time", file=sys.stderr)
+    except UserHasNoRightError:
+        print("Error. You have no rights to change this task", file=sys.stderr)
+    else:
+        print("Stored task with ID {}".format(task.id))
+
+
+def takes_place_on(task, day):
+    first_day = (task.start_time or task.end_time).date()
+    last_day = (task.end_time or task.start_time).date()
+    return first_day <= day <= last_day
+
+
+def search_tasks(args, user):
+    results = commands.search_tasks(
+        create_tasks_controller(user), ' '.join(args.query), args.limit)
+    print('Found tasks:')
+    access_levels = commands.get_tasks_access_levels(
+        create_tasks_controller(user), [result.task.id for result in results])
+    for result in results:
+        print_task(result.task, user, access_levels[result.task.id])
+        print('    found: {}'.format(result.snippet))
 
 
-def show_to_do_tasks(user):
+def show_to_do_tasks(args, user):
     print('TODO:')
-    tasks = commands.tasks_with_status(
-        create_tasks_controller(user), Status.TODO.value)
-    print_task_list(tasks, user)
+    print_task_page(get_task_page(
+        args,
+        commands.tasks_with_status,
+        create_tasks_controller(user),
+        Status.TODO.value), user)
 
 
-def show_in_progress_tasks(user):
+def show_in_progress_tasks(args, user):
     print('IN_PROGRESS:')
-    tasks = commands.tasks_with_status(
-        create_tasks_controller(user), Status.IN_PROGRESS.value)
-    print_task_list(tasks, user)
+    print_task_page(get_task_page(
+        args,
+        commands.tasks_with_status,
+        create_tasks_controller(user),
+        Status.IN_PROGRESS.value), user)
 
 
-def show_done_tasks(user):
+def show_done_tasks(args, user):
     print('DONE:')
-    tasks = commands.tasks_with_status(
-        create_tasks_controller(user), Status.DONE.value)
-    print_task_list(tasks, user)
+    print_task_page(get_task_page(
+        args,
+        commands.tasks_with_status,
+        create_tasks_controller(user),
+        Status.DONE.value), user)
 
 
-def show_archived_tasks(user):
+def show_archived_tasks(args, user):
     print('ARCHIVED:')
-    tasks = commands.tasks_with_status(
-        create_tasks_controller(user), Status.ARCHIVED.value)
-    print_task_list(tasks, user)
+    print_task_page(get_task_page(
+        args,
+        commands.tasks_with_status,
+        create_tasks_controller(user),
+        Status.ARCHIVED.value), user)
 
 
-def print_task(task, user):
+def print_task(task, user, access_level=None):
     if task is not None:
-        result = "ID: {}".format(task.id)
+        if task.is_virtual:
+            result = "Planned by plan with ID {}, occurrence at: {}".format(task.plan_id, task.occurrence_at)
+        else:
+            result = "ID: {}".format(task.id)
         if task.parent_task_id is not None:
             result += ", parent task's id: {}".format(task.parent_task_id)
         if task.assigned_user_id is not None:
@@ -893,13 +1119,36 @@ def print_task(task, user):
                 task.status).name)
         result += ", created at: {}, updated_at: {}".format(
             task.created_at, task.updated_at)
+        if access_level is not None:
+            result += ", access: {}".format(access_level.name)
         print(result)
 
 
+def get_task_page(args, list_command, *command_args):
+    page_request = PageRequest(
+        args.order_by, args.page_size, args.cursor, args.descending)
+    try:
+        return list_command(*command_args, page=page_request)
+    except InvalidCursorError:
+        print("Error: cursor is invalid for this list or ordering", file=sys.stderr)
+        quit()
+
+
+def print_task_page(page, user):
+    print_task_list(page.items, user)
+    if page.prev_cursor is not None:
+        print('Previous page: --cursor {}'.format(page.prev_cursor))
+    if page.next_cursor is not None:
+        print('Next page: --cursor {}'.format(page.next_cursor))
+
+
 def print_task_list(task_list, user):
     if task_list is not None:
+        task_list = list(task_list)
+        access_levels = commands.get_tasks_access_levels(
+            create_tasks_controller(user), [task.id for task in task_list])
         for task in task_list:
-            print_task(task, user)
+            print_task(task, user, access_levels[task.id])
 
 
 def add_notification(args, user):
@@ -1031,18 +1280,42 @@ def edit_task_plan(args, user):
                               (start_date - datetime.datetime.now()).total_seconds())
                 last_created_at = datetime.datetime.now() - datetime.timedelta(seconds=time_delta)
                 plan.last_created_at = last_created_at
-        commands.update_task_plan(create_task_plans_controller(user), plan)
+        if args.rule is not None:
+            plan.rule = args.rule
+        try:
+            commands.update_task_plan(create_task_plans_controller(user), plan)
+        except (InvalidRecurrenceRuleError, InvalidTaskPlanIntervalError) as error:
+            print('Error. {}'.format(error), file=sys.stderr)
+            return
         print("Updated task plan")
     else:
         print("Error. There is no task plan with such ID", file=sys.stderr)
 
 
+def preview_task_plan(args, user):
+    plan = commands.get_task_plan_by_id(
+        create_task_plans_controller(user), args.id)
+    if plan is not None:
+        print_occurrences(commands.preview_occurrences(plan, args.number))
+    else:
+        print("Error. There is no task plan with such ID", file=sys.stderr)
+
+
+def print_occurrences(occurrences):
+    for occurrence in occurrences:
+        print(occurrence.strftime('%A, %d %B %Y %H:%M'))
+
+
 def show_all_task_plans(user):
     plans = commands.get_task_plans(create_task_plans_controller(user))
     print_task_plan_list(plans)
 
 
 def print_task_plan(plan):
+    if plan.rule is not None:
+        print("ID: {}, task ID: {}, rule: {}, last created at: {}".format(
+            plan.id, plan.task_id, plan.rule, plan.last_created_at))
+        return
     print(
         "ID: {}, task ID: {}, interval: {}, last created at: {}".format(
             plan.id,
@@ -1079,17 +1352,37 @@ def create_task_plans_controller(user, database_name=config.DATABASE):
         user.id, database_name)
 
 
+def run_scheduler(args):
+    scheduler = Scheduler(
+        config.DATABASE,
+        batch_size=args.batch_size,
+        max_sleep=args.max_sleep,
+        catch_up=args.catch_up)
+    print('Scheduler is running, press Ctrl+C to stop it')
+    try:
+        scheduler.run()
+    except SchedulerIsRunningError as error:
+        print('Error. {}'.format(error), file=sys.stderr)
+    except KeyboardInterrupt:
+        scheduler.stop()
+
+
 def handle_commands():
+    parser = init_parser()
+    args = parser.parse_args()
+    if args.object == 'scheduler':
+        # scheduler runs for a long time, so it doesn't use unit of work of command
+        run_scheduler(args)
+        return
+
     user_session = UserSession(
         config_file=config.CONFIG_FILE,
         database_name=config.DATABASE)
     current_user = user_session.get_current_user()
     if current_user is not None:
-        create_notifications_controller(current_user).process_notifications()
-        create_task_plans_controller(current_user).process_plans(
-            create_tasks_controller(current_user))
+        # notifications become pending and plans create tasks in scheduler, commands only show them
         show_pending_notifications(current_user)
 
-    parser = init_parser()
-    args = parser.parse_args()
-    process_object(args, user_session)
+    # one unit of work per command: loaded tasks are cached, updates are written in one transaction
+    with unit_of_work(get_engine(config.DATABASE).database):
+        process_object(args, user_session)
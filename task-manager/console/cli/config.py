@@ -3,6 +3,11 @@ import os
 
 APP_DATA_DIRECTORY = os.path.join(os.environ['HOME'], 'task-manager')
 DATABASE = os.path.join(APP_DATA_DIRECTORY, 'task-manager.db')
+DATABASE_PROFILE = 'balanced'  # 'durable', 'balanced' or 'bulk-load'
+PAGE_SIZE = 50  # number of tasks printed by 'task show' commands
+AGENDA_DAYS = 7  # number of days printed by 'task agenda' command
+PREVIEW_OCCURRENCES = 5  # number of task plan's occurrences printed by 'plan preview' command
+SEARCH_LIMIT = 20  # number of tasks printed by 'task search' command
 CONFIG_FILE = os.path.join(APP_DATA_DIRECTORY, 'config.ini')
 LOGGING_ENABLED = True
 LOGS_DIRECTORY = APP_DATA_DIRECTORY
@@ -2,11 +2,13 @@ import os
 from cli.arg_parser import handle_commands
 import cli.config as config
 from tmlib.logger import setup_lib_logging
+from tmlib.storage.engine import get_engine
 
 
 def main():
     _create_app_data_folder()
     _setup_lib_logging()
+    _setup_storage_engine()
     handle_commands()
 
 
@@ -25,5 +27,9 @@ def _setup_lib_logging():
         log_format=config.LOG_FORMAT)
 
 
+def _setup_storage_engine():
+    get_engine(config.DATABASE, config.DATABASE_PROFILE)
+
+
 if(__name__ == "__main__"):
     main()
@@ -0,0 +1,60 @@
+"""
+Compares speed of decoding selected task rows into tmlib.models.task.Task objects.
+
+    models - peewee model is built for every row and copied into task (previous TaskStorage behaviour)
+    tuples - rows are fetched as tuples and passed to task constructor (TaskStorage.select_tasks)
+
+Run from library directory:
+    $ python3 -m benchmarks.decoding_benchmark [tasks_count]
+"""
+
+
+import os
+import sys
+import tempfile
+import time
+from tmlib.storage.engine import StorageEngine
+from tmlib.storage.storage_models import Task as TaskModel
+from tmlib.storage.task_storage import TaskStorage
+from tmlib.models.task import Task
+
+REPEATS = 3
+
+
+def decode_models(task_storage, user_id):
+    return list(map(task_storage.to_task_instance, list(
+        TaskModel.select().where(TaskModel.user_id == user_id))))
+
+
+def decode_tuples(task_storage, user_id):
+    return task_storage.user_tasks(user_id)
+
+
+def measure(decode, task_storage, tasks_count):
+    best = None
+    for i in range(REPEATS):
+        started_at = time.perf_counter()
+        tasks = decode(task_storage, 1)
+        elapsed = time.perf_counter() - started_at
+        assert len(tasks) == tasks_count
+        best = elapsed if best is None else min(best, elapsed)
+    return tasks_count / best
+
+
+def main():
+    tasks_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    with tempfile.TemporaryDirectory() as directory:
+        engine = StorageEngine(os.path.join(directory, 'decoding.db'))
+        task_storage = TaskStorage(engine=engine)
+        task_storage.bulk_create(
+            Task(title='Task {}'.format(i), note='Benchmark', user_id=1)
+            for i in range(tasks_count))
+        print('{:<12}{:>16}'.format('decoding', 'rows/second'))
+        for name, decode in (('models', decode_models), ('tuples', decode_tuples)):
+            print('{:<12}{:>16.0f}'.format(
+                name, measure(decode, task_storage, tasks_count)))
+        engine.database.close()
+
+
+if __name__ == '__main__':
+    main()
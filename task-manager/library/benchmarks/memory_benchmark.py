@@ -0,0 +1,57 @@
+"""
+Compares memory used by one task object.
+
+    dict - task stores attributes in per-instance dictionary (previous tmlib.models.task.Task)
+    slots - task stores attributes in __slots__ (tmlib.models.task.Task)
+
+Run from library directory:
+    $ python3 -m benchmarks.memory_benchmark [tasks_count]
+"""
+
+
+import datetime
+import sys
+import tracemalloc
+from tmlib.models.task import Task
+
+
+class DictTask:
+    def __init__(self, *args):
+        (self.title,
+         self.note,
+         self.user_id,
+         self.id,
+         self.start_time,
+         self.end_time,
+         self.assigned_user_id,
+         self.parent_task_id,
+         self.is_event,
+         self.category_id,
+         self.priority,
+         self.status,
+         self.plan_id,
+         self.created_at,
+         self.updated_at) = args
+
+
+def measure(task_class, rows):
+    tracemalloc.start()
+    tasks = [task_class(*row) for row in rows]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (size - sys.getsizeof(tasks)) / len(tasks)
+
+
+def main():
+    tasks_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    now = datetime.datetime.now()
+    # values are shared by all rows, so only task objects themselves are measured
+    rows = [('Task', 'Benchmark', 1, i, now, now, None, None, False, None, 2, 0, None, now, now)
+            for i in range(tasks_count)]
+    print('{:<12}{:>16}'.format('storage', 'bytes/task'))
+    for name, task_class in (('dict', DictTask), ('slots', Task)):
+        print('{:<12}{:>16.0f}'.format(name, measure(task_class, rows)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Compares write throughput of database performance profiles.
+
+Every task is created by separate TaskStorage.create call, so every insert is committed in its own transaction.
+
+Run from library directory:
+    $ python3 -m benchmarks.profiles_benchmark [tasks_count]
+"""
+
+
+import os
+import sys
+import tempfile
+import time
+from tmlib.storage.engine import StorageEngine, PROFILES
+from tmlib.storage.task_storage import TaskStorage
+from tmlib.models.task import Task
+
+
+def measure(profile, tasks_count, directory):
+    engine = StorageEngine(
+        os.path.join(directory, '{}.db'.format(profile)), profile)
+    task_storage = TaskStorage(engine=engine)
+    started_at = time.perf_counter()
+    for i in range(tasks_count):
+        task_storage.create(
+            Task(title='Task {}'.format(i), note='Benchmark', user_id=1))
+    elapsed = time.perf_counter() - started_at
+    engine.database.close()
+    return tasks_count / elapsed
+
+
+def main():
+    tasks_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as directory:
+        print('{:<12}{:>16}'.format('profile', 'inserts/second'))
+        for profile in PROFILES:
+            print('{:<12}{:>16.0f}'.format(
+                profile, measure(profile, tasks_count, directory)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Compares speed of searching words in titles and notes of tasks.
+
+    like - filter(Task.title.contains(word) | Task.note.contains(word)), scan of task table
+    fts5 - TaskStorage.search, lookup in FTS5 index with bm25 ranking
+
+Most words are common, but 'quarterly' and 'audit' are used only in every RARE_EVERY-th task.
+LIKE stops early when common word is found in first rows, but it scans the whole table for rare words,
+while FTS5 reads only matching rows. FTS5 ranks all matching rows, so it's slower for very common words.
+
+Run from library directory:
+    $ python3 -m benchmarks.search_benchmark [tasks_count]
+
+Default tasks count is 1000000, so creating database takes a while.
+"""
+
+
+import os
+import random
+import sys
+import tempfile
+import time
+from tmlib.storage.engine import StorageEngine
+from tmlib.storage.storage_models import Task as TaskModel
+from tmlib.storage.task_storage import TaskStorage
+from tmlib.models.task import Task
+
+REPEATS = 5
+LIMIT = 20
+WORDS = ('report', 'meeting', 'invoice', 'release', 'review', 'deploy', 'budget', 'client',
+         'design', 'backup', 'dentist', 'groceries', 'birthday', 'workout', 'taxes', 'lecture')
+RARE_WORDS = ('quarterly', 'audit')
+RARE_EVERY = 10000
+QUERIES = ('invoice', 'dentist birthday', 'quarterly', 'quarterly aud')
+
+
+def search_like(task_storage, text):
+    words = text.split()
+    query = task_storage.filter(*[
+        TaskModel.title.contains(word) | TaskModel.note.contains(word) for word in words])
+    return list(query.limit(LIMIT))
+
+
+def search_fts(task_storage, text):
+    return task_storage.search(1, text, LIMIT)
+
+
+def measure(search, task_storage, text):
+    best = None
+    for i in range(REPEATS):
+        started_at = time.perf_counter()
+        search(task_storage, text)
+        elapsed = time.perf_counter() - started_at
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def generate_tasks(tasks_count):
+    generator = random.Random(0)
+    for i in range(tasks_count):
+        title = generator.sample(WORDS, 2)
+        if i % RARE_EVERY == 0:
+            title.extend(RARE_WORDS)
+        yield Task(
+            title=' '.join(title),
+            note=' '.join(generator.sample(WORDS, 6)),
+            user_id=1)
+
+
+def main():
+    tasks_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    with tempfile.TemporaryDirectory() as directory:
+        engine = StorageEngine(os.path.join(directory, 'search.db'), profile='bulk-load')
+        task_storage = TaskStorage(engine=engine)
+        task_storage.bulk_create(generate_tasks(tasks_count), batch_size=500)
+        print('{:<16}{:>12}{:>12}'.format('query', 'like, ms', 'fts5, ms'))
+        for text in QUERIES:
+            print('{:<16}{:>12.2f}{:>12.2f}'.format(
+                text,
+                measure(search_like, task_storage, text),
+                measure(search_fts, task_storage, text)))
+        engine.database.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -13,11 +13,16 @@ from tmlib.storage.notification_storage import NotificationStorage
 from tmlib.storage.task_storage import TaskStorage
 from tmlib.storage.task_plan_storage import TaskPlanStorage
 from tmlib.models.notification import Status as NotificationStatus
-from tmlib.models.task import Status
+from tmlib.models.task import Status, Priority, AccessLevel
 from tmlib.controllers.categories_controller import CategoriesController
 from tmlib.controllers.notifications_controller import NotificationsController
 from tmlib.controllers.tasks_controller import TasksController
 from tmlib.controllers.task_plans_controller import TaskPlansController
+from tmlib.exceptions.exceptions import (
+    InvalidTaskTimeError, InvalidTaskPlanIntervalError, TaskDoesNotExistError, UserHasNoRightError)
+from tmlib.storage.pagination import PageRequest
+from tmlib.models.task_plan import TaskPlan as TaskPlanInstance
+from tmlib import commands
 from tests.factories import CategoryFactory, TaskFactory, TaskPlanFactory, NotificationFactory
 
 
@@ -147,6 +152,12 @@ class ControllersTest(unittest.TestCase):
             task_id, self.task)
         self.assertEqual(inner_task.parent_task_id, task_id)
 
+    def test_bulk_creates_tasks(self):
+        tasks = [TaskFactory(user_id=None) for i in range(3)]
+        ids = self.tasks_controller.bulk_create(tasks)
+        self.assertEqual(len(self.tasks_controller.user_tasks()), 3)
+        self.assertEqual(ids, [task.id for task in tasks])
+
     def test_returns_inner_tasks(self):
         self.task.parent_task_id = None
         task_id = self.tasks_controller.create(self.task).id
@@ -371,3 +382,199 @@ class ControllersTest(unittest.TestCase):
         self.assertEqual(
             notification_from_db.status,
             NotificationStatus.SHOWN.value)
+
+    # Commands tests
+
+    def test_bulk_adds_tasks(self):
+        parent_task = TaskFactory()
+        tasks = [parent_task, TaskFactory(parent_task_id=parent_task)]
+        ids = commands.bulk_add_tasks(self.tasks_controller, tasks)
+        self.assertEqual(len(ids), 2)
+        self.assertEqual(self.tasks_controller.inner(ids[0])[0].id, ids[1])
+
+    def test_does_not_bulk_add_tasks_if_one_of_them_is_invalid(self):
+        invalid_task = TaskFactory(
+            start_time=datetime.datetime.now(),
+            end_time=datetime.datetime.now() - datetime.timedelta(days=1))
+        with self.assertRaises(InvalidTaskTimeError):
+            commands.bulk_add_tasks(
+                self.tasks_controller, [TaskFactory(), invalid_task])
+        self.assertEqual(Task.select().count(), 0)
+
+    def test_does_not_bulk_add_inner_task_before_its_parent(self):
+        parent_task = TaskFactory()
+        with self.assertRaises(TaskDoesNotExistError):
+            commands.bulk_add_tasks(
+                self.tasks_controller,
+                [TaskFactory(parent_task_id=parent_task), parent_task])
+
+    def test_returns_task_tree(self):
+        task_id = self.tasks_controller.create(self.task).id
+        inner_task_id = self.tasks_controller.create_inner_task(
+            task_id, TaskFactory()).id
+        nodes = commands.get_task_tree(self.tasks_controller, task_id)
+        self.assertEqual(len(nodes), 1)
+        self.assertEqual(nodes[0].task.id, inner_task_id)
+        self.assertEqual(nodes[0].depth, 1)
+
+    def test_does_not_return_task_tree_without_rights(self):
+        task_id = self.tasks_controller.create(self.task).id
+        other_tasks_controller = TasksController(
+            self.user_id + 1, TaskStorage(self.database))
+        with self.assertRaises(UserHasNoRightError):
+            commands.get_task_tree(other_tasks_controller, task_id)
+
+    def test_checks_rights_for_task(self):
+        task_id = self.tasks_controller.create(self.task).id
+        reader = TasksController(self.user_id + 1, TaskStorage(self.database))
+        writer = TasksController(self.user_id + 2, TaskStorage(self.database))
+        self.tasks_controller.add_user_for_read(reader.user_id, task_id)
+        self.tasks_controller.add_user_for_write(writer.user_id, task_id)
+        self.assertTrue(commands.user_can_read_task(reader, task_id))
+        self.assertFalse(commands.user_can_write_task(reader, task_id))
+        self.assertTrue(commands.user_can_write_task(writer, task_id))
+        self.assertEqual(
+            commands.get_task_access_level(self.tasks_controller, task_id),
+            AccessLevel.OWNER)
+
+    def test_returns_permissions_for_tasks(self):
+        task_id = self.tasks_controller.create(self.task).id
+        other_task_id = self.tasks_controller.create(TaskFactory()).id
+        reader = TasksController(self.user_id + 1, TaskStorage(self.database))
+        self.tasks_controller.add_user_for_read(reader.user_id, task_id)
+        self.assertEqual(
+            commands.get_tasks_access_levels(reader, [task_id, other_task_id]),
+            {task_id: AccessLevel.READ, other_task_id: AccessLevel.NONE})
+
+    def test_does_not_return_task_without_rights(self):
+        task_id = self.tasks_controller.create(self.task).id
+        other_tasks_controller = TasksController(
+            self.user_id + 1, TaskStorage(self.database))
+        self.assertIsNone(
+            commands.get_task_by_id(other_tasks_controller, task_id))
+        self.assertEqual(
+            commands.get_task_by_id(self.tasks_controller, task_id).id, task_id)
+
+    def test_does_not_create_inner_task_without_write_rights(self):
+        task_id = self.tasks_controller.create(self.task).id
+        reader = TasksController(self.user_id + 1, TaskStorage(self.database))
+        self.tasks_controller.add_user_for_read(reader.user_id, task_id)
+        with self.assertRaises(UserHasNoRightError):
+            commands.create_inner_task(reader, task_id, TaskFactory())
+        with self.assertRaises(TaskDoesNotExistError):
+            commands.create_inner_task(reader, task_id + 1, TaskFactory())
+
+    def test_sets_task_acl(self):
+        task_id = self.tasks_controller.create(self.task).id
+        commands.set_task_acl(self.tasks_controller, task_id, [2, 3], [3])
+        self.assertEqual(
+            sorted(commands.get_users_can_read_task(self.tasks_controller, task_id)), [2, 3])
+        self.assertEqual(
+            commands.get_users_can_write_task(self.tasks_controller, task_id), [3])
+
+    def test_does_not_set_task_acl_without_write_rights(self):
+        task_id = self.tasks_controller.create(self.task).id
+        other_task_id = self.tasks_controller.create(TaskFactory()).id
+        reader = TasksController(self.user_id + 1, TaskStorage(self.database))
+        self.tasks_controller.add_user_for_read(reader.user_id, task_id)
+        with self.assertRaises(UserHasNoRightError):
+            commands.set_task_acl(reader, task_id, [reader.user_id], [reader.user_id])
+        with self.assertRaises(UserHasNoRightError):
+            commands.set_tasks_acl(
+                self.tasks_controller, [task_id, other_task_id + 1], [], [])
+
+    def test_updates_task_inside_unit_of_work(self):
+        task_id = self.tasks_controller.create(self.task).id
+        with self.tasks_controller.unit_of_work():
+            task = commands.get_task_by_id(self.tasks_controller, task_id)
+            task.priority = Priority.MAX.value
+            commands.update_task(self.tasks_controller, task)
+            commands.set_task_status(
+                self.tasks_controller, task_id, Status.DONE.value)
+        task = self.tasks_controller.get_by_id(task_id)
+        self.assertEqual(task.priority, Priority.MAX.value)
+        self.assertEqual(task.status, Status.DONE.value)
+
+    def test_returns_tasks_by_pages(self):
+        self.tasks_controller.bulk_create(
+            [TaskFactory(priority=i % 5) for i in range(7)])
+        page = commands.user_tasks(
+            self.tasks_controller, page=PageRequest('priority', 5, descending=True))
+        self.assertEqual(
+            [task.priority for task in page.items], [4, 3, 2, 1, 1])
+        next_page = commands.filter_tasks(
+            self.tasks_controller,
+            Task.user_id == self.user_id,
+            page=PageRequest('priority', 5, page.next_cursor, descending=True))
+        self.assertEqual(
+            [task.priority for task in next_page.items], [0, 0])
+        self.assertIsNone(next_page.next_cursor)
+
+    def test_searches_tasks(self):
+        task_id = self.tasks_controller.create(
+            TaskFactory(title='Prepare annual report')).id
+        self.tasks_controller.create(TaskFactory(title='Buy milk'))
+        results = commands.search_tasks(self.tasks_controller, 'annual rep')
+        self.assertEqual([result.task.id for result in results], [task_id])
+        self.assertEqual(commands.search_tasks(self.tasks_controller, '  '), [])
+
+    def test_returns_tasks_in_window(self):
+        start = datetime.datetime(2018, 6, 4)
+        task_id = self.tasks_controller.create(TaskFactory(
+            start_time=start + datetime.timedelta(days=2), end_time=None)).id
+        self.tasks_controller.create(TaskFactory(
+            start_time=start + datetime.timedelta(days=7), end_time=None))
+        self.assertEqual(
+            [task.id for task in commands.tasks_in_window(
+                self.tasks_controller, start, start + datetime.timedelta(days=7))],
+            [task_id])
+
+    def test_updates_virtual_occurrence(self):
+        start = datetime.datetime(2018, 6, 4, 9, 0)
+        day = datetime.timedelta(days=1)
+        template_id = self.tasks_controller.create(TaskFactory(start_time=start, end_time=None)).id
+        plan = self.task_plans_controller.create(TaskPlanFactory(
+            task_id=template_id, interval=day.total_seconds(), last_created_at=start, is_virtual=True))
+        occurrences = commands.plan_occurrences(self.tasks_controller, plan.id, start, start + 3 * day)
+        self.assertEqual([task.start_time for task in occurrences], [start + day, start + 2 * day])
+        task = occurrences[0]
+        task.title = 'Changed'
+        commands.update_task(self.tasks_controller, task)
+        self.assertEqual(self.tasks_controller.get_by_id(task.id).title, 'Changed')
+        self.assertEqual(
+            [task.title for task in commands.plan_occurrences(
+                self.tasks_controller, plan.id, start, start + 3 * day)][0], 'Changed')
+
+        other_controller = TasksController(11, TaskStorage(self.database))
+        self.assertIsNone(commands.get_occurrence(other_controller, plan.id, start + 2 * day))
+        self.tasks_controller.add_user_for_read(11, template_id)
+        with self.assertRaises(UserHasNoRightError):
+            commands.materialize_occurrence(other_controller, plan.id, start + 2 * day)
+        with self.assertRaises(TaskDoesNotExistError):
+            commands.materialize_occurrence(self.tasks_controller, plan.id, start + day / 2)
+
+    def test_previews_task_plan_occurrences(self):
+        plan = TaskPlanInstance(
+            interval=0, user_id=self.user_id, task_id=None,
+            last_created_at=datetime.datetime(2018, 1, 1), rule='0 10 L * *')
+        self.assertEqual(
+            commands.preview_occurrences(plan, 3, start=datetime.datetime(2018, 1, 31, 11, 0)),
+            [datetime.datetime(2018, 2, 28, 10, 0),
+             datetime.datetime(2018, 3, 31, 10, 0),
+             datetime.datetime(2018, 4, 30, 10, 0)])
+        plan.rule = '* * * * *'
+        with self.assertRaises(InvalidTaskPlanIntervalError):
+            commands.preview_occurrences(plan, 3)
+
+    def test_returns_active_tasks_and_tasks_with_category(self):
+        category_id = self.categories_controller.create(self.category).id
+        task_ids = self.tasks_controller.bulk_create([
+            TaskFactory(category_id=category_id),
+            TaskFactory(),
+            TaskFactory(category_id=category_id, status=Status.ARCHIVED.value),
+            TaskFactory(status=Status.TEMPLATE.value)])
+        self.assertEqual(
+            [task.id for task in commands.active_tasks(self.tasks_controller)], task_ids[:2])
+        self.assertEqual(
+            [task.id for task in commands.tasks_with_category(self.tasks_controller, category_id)],
+            task_ids[:1])
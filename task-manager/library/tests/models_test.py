@@ -1,9 +1,13 @@
 import unittest
 import datetime
+import zoneinfo
 
 from tmlib.models.task import Task
 from tmlib.models.category import Category
 from tmlib.models.task_plan import TaskPlan
+from tmlib.models.recurrence import parse_rule
+from tmlib.models.validator import validate_task_plan_rule
+from tmlib.exceptions.exceptions import InvalidRecurrenceRuleError, InvalidTaskPlanIntervalError
 from tmlib.models.notification import Notification
 
 
@@ -77,3 +81,122 @@ class ModelsTest(unittest.TestCase):
         self.assertEqual(plan.user_id, self.user_id)
         self.assertEqual(plan.task_id, self.task_id)
         self.assertEqual(plan.last_created_at, self.last_created_at)
+
+    def test_task_plan_occurrences(self):
+        plan = self.create_task_plan(
+            interval=3600, last_created_at=datetime.datetime(2018, 6, 1, 12, 0))
+        self.assertEqual(
+            list(plan.occurrences(datetime.datetime(2018, 6, 1, 13, 0), datetime.datetime(2018, 6, 1, 15, 0))),
+            [datetime.datetime(2018, 6, 1, 13, 0), datetime.datetime(2018, 6, 1, 14, 0)])
+        self.assertEqual(
+            list(plan.occurrences(datetime.datetime(2018, 5, 1), datetime.datetime(2018, 6, 1, 13, 30))),
+            [datetime.datetime(2018, 6, 1, 13, 0)])
+
+    def test_recurrence_rule_weekdays(self):
+        rule = parse_rule('0 10 * * 1-5')
+        friday_noon = datetime.datetime(2018, 6, 8, 12, 0)
+        self.assertEqual(rule.next_after(friday_noon), datetime.datetime(2018, 6, 11, 10, 0))
+        self.assertEqual(
+            rule.next_after(datetime.datetime(2018, 6, 11, 10, 0)), datetime.datetime(2018, 6, 12, 10, 0))
+        self.assertEqual(
+            parse_rule('0 18 * * 5L').next_after(friday_noon), datetime.datetime(2018, 6, 29, 18, 0))
+        self.assertEqual(
+            parse_rule('0 9 * * 1#1').next_after(friday_noon), datetime.datetime(2018, 7, 2, 9, 0))
+        self.assertIs(parse_rule('0 10 * * 1-5'), rule)
+
+    def test_recurrence_rule_month_end(self):
+        january = datetime.datetime(2018, 1, 31, 12, 0)
+        self.assertEqual(parse_rule('0 0 L * *').next_after(january), datetime.datetime(2018, 2, 28))
+        self.assertEqual(parse_rule('0 0 31 * *').next_after(january), datetime.datetime(2018, 3, 31))
+        self.assertEqual(parse_rule('0 0 29 2 *').next_after(january), datetime.datetime(2020, 2, 29))
+        self.assertEqual(
+            parse_rule('0 0 L * *').next_after(datetime.datetime(2019, 12, 31)), datetime.datetime(2020, 1, 31))
+        self.assertIsNone(parse_rule('0 0 30 2 *').next_after(january))
+
+    def test_recurrence_rule_daylight_saving_time(self):
+        zone = zoneinfo.ZoneInfo('Europe/Berlin')
+        rule = parse_rule('30 2 * * *')
+        # 2:30 doesn't exist on 25 March 2018, clocks jump from 2:00 to 3:00
+        occurrence = rule.next_after(datetime.datetime(2018, 3, 25, 1, 0, tzinfo=zone))
+        self.assertEqual(occurrence.replace(tzinfo=None), datetime.datetime(2018, 3, 25, 3, 30))
+        self.assertEqual(occurrence.utcoffset(), datetime.timedelta(hours=2))
+        # 2:30 happens twice on 28 October 2018, plan occurs once
+        occurrence = rule.next_after(datetime.datetime(2018, 10, 28, 0, 0, tzinfo=zone))
+        self.assertEqual(occurrence.replace(tzinfo=None), datetime.datetime(2018, 10, 28, 2, 30))
+        self.assertEqual(
+            rule.next_after(occurrence).replace(tzinfo=None), datetime.datetime(2018, 10, 29, 2, 30))
+        # naive times are wall clock times
+        self.assertEqual(
+            parse_rule('0 10 * * *').next_after(datetime.datetime(2018, 3, 24, 10, 0)),
+            datetime.datetime(2018, 3, 25, 10, 0))
+
+    def test_invalid_recurrence_rules(self):
+        for rule in ('* * *', '60 * * * *', '0 10 * * 8', '0 10 * * 1#6', 'a b c d e', '*/0 * * * *'):
+            with self.assertRaises(InvalidRecurrenceRuleError):
+                parse_rule(rule)
+
+    def test_recurrence_rule_min_interval(self):
+        self.assertEqual(parse_rule('*/15 * * * *').min_interval(), datetime.timedelta(minutes=15))
+        self.assertEqual(parse_rule('0 10 * * *').min_interval(), datetime.timedelta(minutes=60))
+        # 23:59 is followed by 00:00 of the next day
+        rule = parse_rule('0,59 0,23 * * *')
+        self.assertEqual(rule.min_interval(), datetime.timedelta(minutes=1))
+        self.assertEqual(
+            rule.next_after(datetime.datetime(2018, 6, 1, 23, 59)), datetime.datetime(2018, 6, 2, 0, 0))
+        with self.assertRaises(InvalidTaskPlanIntervalError):
+            validate_task_plan_rule('0,59 0,23 * * *')
+
+    def test_task_plan_occurrences_with_rule(self):
+        plan = TaskPlan(
+            interval=0, user_id=1, task_id=1,
+            last_created_at=datetime.datetime(2018, 6, 1, 10, 0), rule='0 10 * * 1-5')
+        self.assertEqual(
+            list(plan.occurrences(datetime.datetime(2018, 5, 1), datetime.datetime(2018, 6, 6))),
+            [datetime.datetime(2018, 6, 4, 10, 0), datetime.datetime(2018, 6, 5, 10, 0)])
+
+    def test_task_plan_occurs_at(self):
+        plan = TaskPlan(
+            interval=3600, user_id=1, task_id=1, last_created_at=datetime.datetime(2018, 6, 1, 10, 0))
+        self.assertTrue(plan.occurs_at(datetime.datetime(2018, 6, 1, 12, 0)))
+        self.assertFalse(plan.occurs_at(datetime.datetime(2018, 6, 1, 12, 30)))
+        self.assertFalse(plan.occurs_at(datetime.datetime(2018, 6, 1, 9, 0)))
+
+    def test_models_do_not_have_instance_dictionary(self):
+        for model in (self.create_task(), self.create_category(),
+                      self.create_notification(), self.create_task_plan()):
+            self.assertFalse(hasattr(model, '__dict__'))
+
+    def test_clean_model_tracks_changed_fields(self):
+        task = self.create_task()
+        self.assertEqual(set(task.changed_fields()), set(Task.__slots__))
+        task.mark_clean()
+        task.title = self.task_title
+        task.note = 'Other note'
+        self.assertEqual(task.changed_fields(), {'note': 'Other note'})
+        self.assertEqual(task.changed_fields(('title', 'status')), {})
+        self.assertEqual(len(task.copy().changed_fields()), len(Task.__slots__))
+        task.mark_clean()
+        self.assertEqual(task.changed_fields(), {})
+        with self.assertRaises(AttributeError):
+            task.unknown_field = 1
+
+    def test_task_equality(self):
+        self.assertEqual(self.create_task(), self.create_task())
+        self.assertNotEqual(self.create_task(), self.create_task(title="Other title"))
+
+    def test_task_replace(self):
+        task = self.create_task()
+        changed_task = task.replace(title="Other title")
+        self.assertEqual(changed_task.title, "Other title")
+        self.assertEqual(task.title, self.task_title)
+        self.assertEqual(changed_task.note, task.note)
+        self.assertEqual(task.copy(), task)
+        with self.assertRaises(AttributeError):
+            task.replace(unknown_field=1)
+
+    def test_task_to_dict_and_from_row(self):
+        task = self.create_task()
+        values = task.to_dict()
+        self.assertEqual(values['title'], self.task_title)
+        self.assertEqual(Task.from_row(values.values()), task)
+        self.assertEqual(Task(**values), task)
@@ -4,6 +4,7 @@ def run_tests():
     testmodules = [
         'tests.controllers_test',
         'tests.models_test',
+        'tests.scheduler_test',
         'tests.storage_test'
         ]
 
@@ -0,0 +1,87 @@
+import datetime
+import os
+import tempfile
+import unittest
+from tmlib.scheduler import Scheduler, SchedulerLock
+from tmlib.storage.read_cache import ReadCache, LocalCache
+from tmlib.models.task import Status
+from tmlib.exceptions.exceptions import SchedulerIsRunningError
+from tests.factories import TaskFactory, TaskPlanFactory, NotificationFactory
+
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.lock_directory = tempfile.TemporaryDirectory()
+        self.scheduler = Scheduler(
+            ':memory:',
+            batch_size=2,
+            lock_path=os.path.join(self.lock_directory.name, 'scheduler.lock'))
+        self.task_storage = self.scheduler.task_storage
+        self.notification_storage = self.scheduler.notification_storage
+        self.task_plan_storage = self.scheduler.task_plan_storage
+        self.task_storage.create_tables()
+
+    def tearDown(self):
+        self.task_storage.drop_tables()
+        self.lock_directory.cleanup()
+
+    def test_processes_due_notifications_by_batches(self):
+        now = datetime.datetime.now()
+        task_id = self.task_storage.create(TaskFactory(start_time=now)).id
+        future_task_id = self.task_storage.create(
+            TaskFactory(start_time=now + datetime.timedelta(days=1))).id
+        for relative_start_time in (60, 120, 180):
+            self.notification_storage.create(NotificationFactory(
+                task_id=task_id, relative_start_time=relative_start_time))
+        self.notification_storage.create(NotificationFactory(
+            task_id=future_task_id, relative_start_time=60))
+        self.assertEqual(self.scheduler.process_notifications(), 3)
+        self.assertEqual(len(self.notification_storage.created(10)), 1)
+
+    def test_processes_due_plans_by_batches(self):
+        template_task_id = self.task_storage.create(
+            TaskFactory(user_id=1, status=Status.TEMPLATE.value)).id
+        for i in range(3):
+            self.task_plan_storage.create(TaskPlanFactory(
+                user_id=1,
+                task_id=template_task_id,
+                interval=600,
+                last_created_at=datetime.datetime.now() - datetime.timedelta(hours=1)))
+        self.assertEqual(self.scheduler.process_plans(), 3)
+        self.assertEqual(self.task_plan_storage.due_plans(datetime.datetime.now()), [])
+
+    def test_bumps_user_versions_in_shared_backend(self):
+        template_task_id = self.task_storage.create(
+            TaskFactory(user_id=1, status=Status.TEMPLATE.value)).id
+        self.task_plan_storage.create(TaskPlanFactory(
+            user_id=1,
+            task_id=template_task_id,
+            interval=600,
+            last_created_at=datetime.datetime.now() - datetime.timedelta(hours=1)))
+        shared_backend = LocalCache()
+        # client of other process that reads versions from the same backend
+        reader_cache = ReadCache(shared_backend)
+        version = reader_cache.version(1)
+        self.addCleanup(self.task_storage.engine.set_read_cache, None)
+        scheduler = Scheduler(':memory:', read_cache=ReadCache(shared_backend))
+        self.assertIsNot(scheduler.task_storage.read_cache, reader_cache)
+        self.assertEqual(scheduler.process_plans(), 1)
+        self.assertNotEqual(reader_cache.version(1), version)
+
+    def test_sleeps_until_next_due_item(self):
+        template_task_id = self.task_storage.create(
+            TaskFactory(user_id=1, status=Status.TEMPLATE.value)).id
+        self.task_plan_storage.create(TaskPlanFactory(
+            user_id=1,
+            task_id=template_task_id,
+            interval=10,
+            last_created_at=datetime.datetime.now()))
+        self.assertLessEqual(self.scheduler.run_pending(), 10)
+        self.scheduler.max_sleep = 5
+        self.scheduler._heap = []
+        self.assertLessEqual(self.scheduler.run_pending(), 5)
+
+    def test_allows_only_one_scheduler(self):
+        with SchedulerLock(self.scheduler.lock_path):
+            with self.assertRaises(SchedulerIsRunningError):
+                self.scheduler.run()
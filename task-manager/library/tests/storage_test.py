@@ -1,18 +1,34 @@
 import unittest
 import datetime
+import os
+import sqlite3
+import tempfile
+from unittest import mock
+from peewee import IntegrityError, SqliteDatabase
+from tmlib.exceptions.exceptions import (
+    UnknownDatabaseProfileError, UnknownOrderingError, InvalidCursorError, UnitOfWorkIsActiveError)
 from tmlib.storage.storage_models import (
     Task,
     UsersReadTasks,
     UsersWriteTasks,
     Category,
     TaskPlan,
+    CancelledOccurrence,
     Notification,
+    SchemaMigration,
     DatabaseConnector)
+from tmlib.storage.migrations import current_version, latest_version
+from tmlib.storage.engine import get_engine
+from tmlib.storage.pagination import PageRequest
+from tmlib.storage.read_cache import ReadCache, LocalCache
+from tmlib.storage.signals import Action
+from tmlib.storage.unit_of_work import unit_of_work
 from tmlib.storage.category_storage import CategoryStorage
 from tmlib.storage.notification_storage import NotificationStorage
 from tmlib.storage.task_storage import TaskStorage
 from tmlib.storage.task_plan_storage import TaskPlanStorage
-from tmlib.models.task import Status
+from tmlib.models.task import Status, AccessLevel
+from tmlib.models.task_plan import TaskPlan as TaskPlanInstance
 from tmlib.models.notification import Status as NotificationStatus
 from tests.factories import CategoryFactory, TaskFactory, TaskPlanFactory, NotificationFactory
 
@@ -64,6 +80,13 @@ class StorageTest(unittest.TestCase):
         category_from_db = Category.get(Category.id == category_with_id.id)
         self.assertEqual(category_from_db.name, "Movies to watch")
 
+    def test_returns_category_names(self):
+        first_id = self.category_storage.create(CategoryFactory(name='Work')).id
+        second_id = self.category_storage.create(CategoryFactory(name='Home')).id
+        self.assertEqual(
+            self.category_storage.names([first_id, second_id, second_id, None, second_id + 1]),
+            {first_id: 'Work', second_id: 'Home'})
+
     # TaskStorage tests
 
     def test_creates_task(self):
@@ -103,6 +126,35 @@ class StorageTest(unittest.TestCase):
         tasks = self.task_storage.user_tasks(user_id)
         self.assertEqual(len(tasks), 2)
 
+    def test_bulk_creates_tasks(self):
+        tasks = [TaskFactory() for i in range(120)]
+        ids = self.task_storage.bulk_create(tasks, batch_size=50)
+        self.assertEqual(len(ids), 120)
+        self.assertEqual(ids, [task.id for task in tasks])
+        for task in (tasks[0], tasks[60], tasks[119]):
+            self.assertEqual(self.task_storage.get_by_id(task.id).title, task.title)
+
+    def test_bulk_creates_inner_tasks_for_tasks_from_same_batch(self):
+        parent_task = TaskFactory()
+        inner_task = TaskFactory(parent_task_id=parent_task)
+        second_level_inner_task = TaskFactory(parent_task_id=inner_task)
+        self.task_storage.bulk_create(
+            [parent_task, inner_task, second_level_inner_task])
+        self.assertEqual(
+            self.task_storage.get_by_id(inner_task.id).parent_task_id,
+            parent_task.id)
+        self.assertEqual(
+            len(self.task_storage.inner(parent_task.id, True)), 2)
+
+    def test_does_not_bulk_create_inner_task_with_unsaved_parent_from_outside(self):
+        inner_task = TaskFactory(parent_task_id=TaskFactory())
+        with self.assertRaises(ValueError):
+            self.task_storage.bulk_create([TaskFactory(), inner_task])
+        parent_task = TaskFactory()
+        with self.assertRaises(ValueError):
+            self.task_storage.bulk_create([TaskFactory(parent_task_id=parent_task), parent_task])
+        self.assertEqual(Task.select().count(), 0)
+
     def test_returns_inner_tasks(self):
         task_id = self.task_storage.create(self.task).id
         inner_task = TaskFactory()
@@ -122,6 +174,44 @@ class StorageTest(unittest.TestCase):
         inner_tasks = self.task_storage.inner(task_id, True)
         self.assertEqual(len(inner_tasks), 2)
 
+    def test_returns_subtree_with_depth_and_path(self):
+        task_id = self.task_storage.create(self.task).id
+        inner_task_id = self.task_storage.create(
+            TaskFactory(parent_task_id=task_id)).id
+        second_level_inner_task_id = self.task_storage.create(
+            TaskFactory(parent_task_id=inner_task_id)).id
+        nodes = self.task_storage.subtree(task_id)
+        self.assertEqual([node.task.id for node in nodes],
+                         [inner_task_id, second_level_inner_task_id])
+        self.assertEqual([node.depth for node in nodes], [1, 2])
+        self.assertEqual(
+            nodes[1].path, (task_id, inner_task_id, second_level_inner_task_id))
+
+    def test_returns_subtree_not_deeper_than_max_depth(self):
+        parent_task_id = self.task_storage.create(self.task).id
+        task_id = parent_task_id
+        for i in range(5):
+            task_id = self.task_storage.create(
+                TaskFactory(parent_task_id=task_id)).id
+        self.assertEqual(
+            len(self.task_storage.inner(parent_task_id, True, max_depth=2)), 2)
+
+    def test_returns_deep_subtree(self):
+        tasks = [self.task]
+        for i in range(2000):
+            tasks.append(TaskFactory(parent_task_id=tasks[-1]))
+        self.task_storage.bulk_create(tasks)
+        self.assertEqual(len(self.task_storage.inner(self.task.id, True)), 2000)
+
+    def test_returns_subtree_with_cycle(self):
+        task_id = self.task_storage.create(self.task).id
+        inner_task_id = self.task_storage.create(
+            TaskFactory(parent_task_id=task_id)).id
+        Task.update(parent_task_id=inner_task_id).where(
+            Task.id == task_id).execute()
+        inner_tasks = self.task_storage.inner(task_id, True)
+        self.assertEqual([task.id for task in inner_tasks], [inner_task_id])
+
     def test_adds_user_for_read(self):
         user_id = 10
         task_id = self.task_storage.create(self.task).id
@@ -162,6 +252,443 @@ class StorageTest(unittest.TestCase):
                 UsersWriteTasks.task_id == task_id and UsersWriteTasks.user_id == user_id).count(),
             0)
 
+    def test_returns_access_level(self):
+        task_id = self.task_storage.create(
+            TaskFactory(user_id=1, assigned_user_id=2)).id
+        self.task_storage.add_user_for_write(user_id=3, task_id=task_id)
+        self.task_storage.add_user_for_read(user_id=4, task_id=task_id)
+        levels = [self.task_storage.access_level(user_id, task_id) for user_id in range(1, 6)]
+        self.assertEqual(levels, [
+            AccessLevel.OWNER,
+            AccessLevel.ASSIGNEE,
+            AccessLevel.WRITE,
+            AccessLevel.READ,
+            AccessLevel.NONE])
+
+    def test_returns_access_levels_for_list_of_tasks(self):
+        own_task_id = self.task_storage.create(TaskFactory(user_id=1)).id
+        readable_task_id = self.task_storage.create(TaskFactory(user_id=2)).id
+        other_task_id = self.task_storage.create(TaskFactory(user_id=2)).id
+        self.task_storage.add_user_for_read(user_id=1, task_id=readable_task_id)
+        self.assertEqual(
+            self.task_storage.access_levels(
+                1, [own_task_id, readable_task_id, other_task_id, other_task_id + 1]),
+            {own_task_id: AccessLevel.OWNER,
+             readable_task_id: AccessLevel.READ,
+             other_task_id: AccessLevel.NONE,
+             other_task_id + 1: AccessLevel.NONE})
+
+    def test_returns_titles_of_readable_tasks(self):
+        own_task_id = self.task_storage.create(TaskFactory(user_id=1, title='Own')).id
+        readable_task_id = self.task_storage.create(TaskFactory(user_id=2, title='Shared')).id
+        other_task_id = self.task_storage.create(TaskFactory(user_id=2, title='Other')).id
+        self.task_storage.add_user_for_read(user_id=1, task_id=readable_task_id)
+        self.assertEqual(
+            self.task_storage.titles(1, [own_task_id, readable_task_id, other_task_id, None]),
+            {own_task_id: 'Own', readable_task_id: 'Shared'})
+
+    def test_returns_access_levels_for_many_tasks(self):
+        ids = self.task_storage.bulk_create(
+            [TaskFactory(user_id=1) for i in range(1500)])
+        access_levels = self.task_storage.access_levels(1, ids)
+        self.assertEqual(len(access_levels), 1500)
+        self.assertTrue(all(
+            level == AccessLevel.OWNER for level in access_levels.values()))
+
+    def test_replaces_acl_with_difference_only(self):
+        task_id = self.task_storage.create(self.task).id
+        self.task_storage.add_user_for_read(user_id=1, task_id=task_id)
+        self.task_storage.add_user_for_read(user_id=2, task_id=task_id)
+        kept_right_id = UsersReadTasks.get(UsersReadTasks.user_id == 2).id
+        self.task_storage.add_user_for_write(user_id=3, task_id=task_id)
+        self.task_storage.set_acl([task_id], readers=[2, 4], writers=[])
+        self.assertEqual(
+            sorted(self.task_storage.get_users_can_read_task(task_id)), [2, 4])
+        self.assertEqual(
+            self.task_storage.get_users_can_write_task(task_id), [])
+        self.assertEqual(
+            UsersReadTasks.get(UsersReadTasks.user_id == 2).id, kept_right_id)
+
+    def test_sets_acl_for_many_tasks(self):
+        ids = self.task_storage.bulk_create(
+            [TaskFactory(user_id=1) for i in range(1200)])
+        self.task_storage.set_acl(ids, readers=[2, 3], writers=[4])
+        self.assertEqual(UsersReadTasks.select().count(), 2400)
+        self.task_storage.set_acl(ids, readers=[3], writers=[4])
+        self.assertEqual(UsersReadTasks.select().count(), 1200)
+        self.assertEqual(UsersWriteTasks.select().count(), 1200)
+
+    def test_does_not_duplicate_added_user(self):
+        task_id = self.task_storage.create(self.task).id
+        self.task_storage.add_user_for_read(user_id=1, task_id=task_id)
+        self.task_storage.add_user_for_read(user_id=1, task_id=task_id)
+        self.assertEqual(self.task_storage.get_users_can_read_task(task_id), [1])
+
+    def test_decodes_task_rows_with_field_types(self):
+        self.task.is_event = True
+        self.task.start_time = datetime.datetime(2018, 5, 1, 10, 30)
+        task_id = self.task_storage.create(self.task).id
+        for task in (self.task_storage.get_by_id(task_id),
+                     self.task_storage.user_tasks(self.task.user_id)[0]):
+            self.assertEqual(task.id, task_id)
+            self.assertEqual(task.title, self.task.title)
+            self.assertIs(task.is_event, True)
+            self.assertEqual(task.start_time, self.task.start_time)
+            self.assertIsInstance(task.created_at, datetime.datetime)
+
+    def create_tasks_for_pages(self):
+        start_time = datetime.datetime(2018, 5, 1, 10, 0)
+        tasks = []
+        for i in range(11):
+            # NULLs and equal start times check ordering by ID inside equal sort keys
+            task_start_time = None if i % 4 == 0 else start_time + datetime.timedelta(hours=i % 3)
+            tasks.append(TaskFactory(user_id=1, start_time=task_start_time))
+        self.task_storage.bulk_create(tasks)
+        return tasks
+
+    def walk_pages(self, get_page, page_request):
+        pages = []
+        page = get_page(page_request)
+        pages.append(page)
+        while page.next_cursor is not None:
+            page = get_page(page_request._replace(cursor=page.next_cursor))
+            pages.append(page)
+        return pages
+
+    def test_returns_tasks_by_pages(self):
+        tasks = self.create_tasks_for_pages()
+        for descending in (False, True):
+            expected = sorted(
+                tasks,
+                key=lambda task: (task.start_time is not None, task.start_time or 0, task.id),
+                reverse=descending)
+            pages = self.walk_pages(
+                lambda page: self.task_storage.user_tasks(1, page),
+                PageRequest('start_time', 4, descending=descending))
+            self.assertEqual([len(page.items) for page in pages], [4, 4, 3])
+            self.assertEqual(
+                [task.id for page in pages for task in page.items],
+                [task.id for task in expected])
+            self.assertIsNone(pages[0].prev_cursor)
+
+    def test_returns_previous_pages(self):
+        self.create_tasks_for_pages()
+        page_request = PageRequest('start_time', 4)
+        pages = self.walk_pages(
+            lambda page: self.task_storage.user_tasks(1, page), page_request)
+        previous_page = self.task_storage.user_tasks(
+            1, page_request._replace(cursor=pages[2].prev_cursor))
+        self.assertEqual(
+            [task.id for task in previous_page.items],
+            [task.id for task in pages[1].items])
+        first_page = self.task_storage.user_tasks(
+            1, page_request._replace(cursor=previous_page.prev_cursor))
+        self.assertEqual(
+            [task.id for task in first_page.items],
+            [task.id for task in pages[0].items])
+        self.assertIsNone(first_page.prev_cursor)
+
+    def test_raises_errors_for_invalid_pages(self):
+        self.create_tasks_for_pages()
+        page = self.task_storage.user_tasks(1, PageRequest('priority', 4))
+        with self.assertRaises(UnknownOrderingError):
+            self.task_storage.user_tasks(1, PageRequest('title'))
+        with self.assertRaises(InvalidCursorError):
+            self.task_storage.user_tasks(1, PageRequest('priority', 4, cursor='damaged'))
+        with self.assertRaises(InvalidCursorError):
+            self.task_storage.user_tasks(1, PageRequest('created_at', 4, cursor=page.next_cursor))
+
+    def test_returns_notifications_by_pages(self):
+        for i in range(5):
+            self.notification_storage.create(NotificationFactory(user_id=1))
+        pages = self.walk_pages(
+            lambda page: self.notification_storage.all_user_notifications(1, page),
+            PageRequest(page_size=2, descending=True))
+        self.assertEqual(
+            [notification.id for page in pages for notification in page.items],
+            [5, 4, 3, 2, 1])
+
+    def test_filter_returns_lazy_query(self):
+        query = self.task_storage.filter(Task.user_id == 1)
+        self.assertFalse(query)
+        self.task_storage.bulk_create(
+            [TaskFactory(user_id=1, priority=i % 5) for i in range(7)])
+        self.assertTrue(query)
+        self.assertEqual(query.count(), 7)
+        self.assertEqual(query.limit(3).count(), 3)
+        self.assertEqual(
+            [task.priority for task in query.order_by('-priority', 'id').limit(4)],
+            [4, 3, 2, 1])
+        self.assertEqual(query.order_by('priority').first().priority, 0)
+        self.assertFalse(self.task_storage.filter(Task.user_id == 2).exists())
+        with self.assertRaises(UnknownOrderingError):
+            query.order_by('title')
+
+    def test_filter_selects_only_passed_attributes(self):
+        task_id = self.task_storage.create(self.task).id
+        task = self.task_storage.filter(Task.id == task_id).only('title').first()
+        self.assertEqual((task.id, task.title), (task_id, self.task.title))
+        self.assertIsNone(task.note)
+        with self.assertRaises(AttributeError):
+            self.task_storage.filter(Task.id == task_id).only('unknown')
+
+    def test_filter_fetches_tasks_by_batches(self):
+        self.task_storage.bulk_create([TaskFactory(user_id=1) for i in range(25)])
+        batches = list(self.task_storage.filter(Task.user_id == 1).iter_batches(10))
+        self.assertEqual([len(batch) for batch in batches], [10, 10, 5])
+        self.assertEqual(
+            len(list(self.task_storage.filter(Task.user_id == 1))), 25)
+
+    def test_returns_same_task_inside_unit_of_work(self):
+        task_id = self.task_storage.create(self.task).id
+        with self.task_storage.unit_of_work():
+            task = self.task_storage.get_by_id(task_id)
+            self.assertIs(
+                self.task_storage.get_with_access_level(self.task.user_id, task_id)[0], task)
+            self.assertIs(self.task_storage.get_by_id(task_id), task)
+        self.assertIsNot(self.task_storage.get_by_id(task_id), task)
+
+    def test_writes_only_changed_fields_after_unit_of_work(self):
+        task_id = self.task_storage.create(self.task).id
+        with self.task_storage.unit_of_work():
+            task = self.task_storage.get_by_id(task_id)
+            task.title = 'New title'
+            self.task_storage.update(task)
+            Task.update(note='Changed note').where(Task.id == task_id).execute()
+            self.assertNotEqual(Task.get(Task.id == task_id).title, 'New title')
+        task = Task.get(Task.id == task_id)
+        self.assertEqual(task.title, 'New title')
+        self.assertEqual(task.note, 'Changed note')
+
+    def test_flushes_unit_of_work_before_queries(self):
+        task_id = self.task_storage.create(self.task).id
+        with self.task_storage.unit_of_work():
+            task = self.task_storage.get_by_id(task_id)
+            task.status = Status.DONE.value
+            self.task_storage.update(task)
+            self.assertEqual(
+                [task.id for task in self.task_storage.with_status(
+                    self.task.user_id, Status.DONE.value)],
+                [task_id])
+
+    def test_discards_unit_of_work_after_error(self):
+        task_id = self.task_storage.create(self.task).id
+        with self.assertRaises(ValueError):
+            with self.task_storage.unit_of_work():
+                task = self.task_storage.get_by_id(task_id)
+                task.title = 'New title'
+                self.task_storage.update(task)
+                raise ValueError
+        self.assertEqual(self.task_storage.get_by_id(task_id).title, self.task.title)
+
+    def test_does_not_join_unit_of_work_for_another_database(self):
+        with self.task_storage.unit_of_work() as current:
+            with self.task_storage.unit_of_work() as nested:
+                self.assertIs(nested, current)
+            with self.assertRaises(UnitOfWorkIsActiveError):
+                with unit_of_work(SqliteDatabase(':memory:')):
+                    pass
+
+    def test_forgets_access_levels_after_acl_changes_inside_unit_of_work(self):
+        task_id = self.task_storage.create(self.task).id
+        with self.task_storage.unit_of_work():
+            self.assertEqual(
+                self.task_storage.access_level(100, task_id), AccessLevel.NONE)
+            self.task_storage.add_user_for_write(user_id=100, task_id=task_id)
+            self.assertEqual(
+                self.task_storage.access_level(100, task_id), AccessLevel.WRITE)
+            self.task_storage.set_acl([task_id], readers=[100], writers=[])
+            self.assertEqual(
+                self.task_storage.access_level(100, task_id), AccessLevel.READ)
+
+    def test_search_index_follows_task_changes(self):
+        task_id = self.task_storage.create(
+            TaskFactory(user_id=1, title='Buy milk', note='')).id
+        self.assertEqual(
+            [result.task.id for result in self.task_storage.search(1, 'milk')], [task_id])
+        task = self.task_storage.get_by_id(task_id)
+        task.title = 'Buy bread'
+        self.task_storage.update(task)
+        self.assertEqual(self.task_storage.search(1, 'milk'), [])
+        self.assertEqual(len(self.task_storage.search(1, 'bre')), 1)
+        self.task_storage.delete_by_id(task_id)
+        self.assertEqual(self.task_storage.search(1, 'bread'), [])
+
+    def test_search_ranks_title_matches_first(self):
+        note_task_id = self.task_storage.create(
+            TaskFactory(user_id=1, title='Shopping', note='Buy milk and bread')).id
+        title_task_id = self.task_storage.create(
+            TaskFactory(user_id=1, title='Milk', note='')).id
+        results = self.task_storage.search(1, 'milk')
+        self.assertEqual(
+            [result.task.id for result in results], [title_task_id, note_task_id])
+        self.assertEqual(results[1].snippet, 'Buy [milk] and bread')
+
+    def test_search_returns_only_visible_tasks(self):
+        own_task_id = self.task_storage.create(TaskFactory(user_id=1, title='report')).id
+        assigned_task_id = self.task_storage.create(
+            TaskFactory(user_id=2, assigned_user_id=1, title='report')).id
+        shared_task_id = self.task_storage.create(TaskFactory(user_id=2, title='report')).id
+        self.task_storage.create(TaskFactory(user_id=2, title='report'))
+        self.task_storage.add_user_for_read(user_id=1, task_id=shared_task_id)
+        self.assertCountEqual(
+            [result.task.id for result in self.task_storage.search(1, 'report')],
+            [own_task_id, assigned_task_id, shared_task_id])
+        self.assertEqual(self.task_storage.search(1, '"report OR'), [])
+
+    def test_searches_without_index_if_sqlite_has_no_fts5(self):
+        self.assertTrue(self.task_storage.engine.has_search_index)
+        task_id = self.task_storage.create(TaskFactory(user_id=1, title='Buy milk', note='')).id
+        self.task_storage.engine.has_search_index = False
+        self.addCleanup(setattr, self.task_storage.engine, 'has_search_index', True)
+        self.assertEqual(
+            [result.task.id for result in self.task_storage.search(1, 'milk')], [task_id])
+
+    def test_returns_tasks_in_window(self):
+        now = datetime.datetime(2018, 6, 1, 12, 0, 0, 500000)
+        hour = datetime.timedelta(hours=1)
+        long_task_id = self.task_storage.create(TaskFactory(
+            user_id=1, start_time=now - hour, end_time=now + 2 * hour)).id
+        deadline_id = self.task_storage.create(TaskFactory(
+            user_id=1, start_time=None, end_time=now)).id
+        self.task_storage.create(TaskFactory(user_id=1, start_time=None, end_time=None))
+        self.task_storage.create(TaskFactory(
+            user_id=1, start_time=now + 3 * hour, end_time=now + 4 * hour))
+        self.task_storage.create(TaskFactory(user_id=2, start_time=now, end_time=now + hour))
+        self.assertEqual(
+            [task.id for task in self.task_storage.tasks_in_window(1, now, now + hour)],
+            [long_task_id, deadline_id])
+        self.assertEqual(
+            [task.id for task in self.task_storage.tasks_in_window(
+                1, now + datetime.timedelta(microseconds=1), now + hour)],
+            [long_task_id])
+        self.assertEqual(
+            self.task_storage.tasks_in_window(
+                1, now + 2 * hour + datetime.timedelta(seconds=1), now + 3 * hour),
+            [])
+
+    def test_returns_tasks_in_window_without_index_if_sqlite_has_no_rtree(self):
+        self.assertTrue(self.task_storage.engine.has_window_index)
+        now = datetime.datetime(2018, 6, 1, 12, 0)
+        task_id = self.task_storage.create(TaskFactory(user_id=1, start_time=None, end_time=now)).id
+        self.task_storage.engine.has_window_index = False
+        self.addCleanup(setattr, self.task_storage.engine, 'has_window_index', True)
+        self.assertEqual(
+            [task.id for task in self.task_storage.tasks_in_window(1, now, now + datetime.timedelta(hours=1))],
+            [task_id])
+
+    def test_task_window_index_follows_task_changes(self):
+        now = datetime.datetime(2018, 6, 1, 12, 0)
+        week = datetime.timedelta(days=7)
+        task_id = self.task_storage.create(
+            TaskFactory(user_id=1, start_time=now, end_time=now)).id
+        task = self.task_storage.get_by_id(task_id)
+        task.start_time = task.end_time = now + week
+        self.task_storage.update(task)
+        self.assertEqual(self.task_storage.tasks_in_window(1, now, now + week), [])
+        self.assertEqual(
+            len(self.task_storage.tasks_in_window(1, now + week, now + 2 * week)), 1)
+        self.task_storage.delete_by_id(task_id)
+        self.assertEqual(
+            self.task_storage.tasks_in_window(1, now + week, now + 2 * week), [])
+
+    def test_returns_shared_tasks_in_window(self):
+        now = datetime.datetime(2018, 6, 1, 12, 0)
+        shared_task_id = self.task_storage.create(
+            TaskFactory(user_id=2, start_time=now, end_time=now)).id
+        self.task_storage.create(TaskFactory(user_id=2, start_time=now, end_time=now))
+        self.task_storage.add_user_for_read(user_id=1, task_id=shared_task_id)
+        window = (now, now + datetime.timedelta(hours=1))
+        self.assertEqual(
+            [task.id for task in self.task_storage.tasks_in_window(1, *window)],
+            [shared_task_id])
+        self.assertEqual(
+            self.task_storage.tasks_in_window(1, *window, include_shared=False), [])
+
+    def test_returns_virtual_occurrences_in_window(self):
+        now = datetime.datetime(2018, 6, 1, 12, 0)
+        hour = datetime.timedelta(hours=1)
+        template_id = self.task_storage.create(TaskFactory(
+            user_id=1, start_time=now, end_time=now + hour)).id
+        plan_id = self.task_plan_storage.create(TaskPlanFactory(
+            user_id=1, task_id=template_id, interval=24 * 3600,
+            last_created_at=now, is_virtual=True)).id
+        self.assertIsNone(TaskPlan.get(TaskPlan.id == plan_id).next_due_at)
+        tasks = self.task_storage.tasks_in_window(
+            1, now + 2 * hour, now + datetime.timedelta(days=2, minutes=30))
+        self.assertEqual(len(tasks), 2)
+        self.assertTrue(all(task.is_virtual for task in tasks))
+        self.assertEqual(
+            [(task.start_time, task.end_time) for task in tasks],
+            [(now + datetime.timedelta(days=1), now + datetime.timedelta(days=1) + hour),
+             (now + datetime.timedelta(days=2), now + datetime.timedelta(days=2) + hour)])
+        self.assertEqual(self.task_storage.tasks_in_window(2, now, now + 48 * hour), [])
+
+    def test_does_not_return_templates_and_archived_tasks_in_window(self):
+        now = datetime.datetime(2018, 6, 1, 12, 0)
+        day = datetime.timedelta(days=1)
+        template_id = self.task_storage.create(TaskFactory(
+            user_id=1, start_time=now, end_time=None, status=Status.TEMPLATE.value)).id
+        self.task_storage.create(TaskFactory(
+            user_id=1, start_time=now, end_time=None, status=Status.ARCHIVED.value))
+        self.task_plan_storage.create(TaskPlanFactory(
+            user_id=1, task_id=template_id, interval=day.total_seconds(),
+            last_created_at=now - day, is_virtual=True))
+        tasks = self.task_storage.tasks_in_window(1, now, now + day)
+        self.assertEqual([(task.id, task.start_time) for task in tasks], [(None, now)])
+
+    def test_materializes_virtual_occurrence(self):
+        now = datetime.datetime(2018, 6, 1, 12, 0)
+        day = datetime.timedelta(days=1)
+        template_id = self.task_storage.create(TaskFactory(
+            user_id=1, start_time=now, end_time=None)).id
+        self.task_storage.add_user_for_write(user_id=2, task_id=template_id)
+        plan_id = self.task_plan_storage.create(TaskPlanFactory(
+            user_id=1, task_id=template_id, interval=day.total_seconds(),
+            last_created_at=now, is_virtual=True)).id
+        occurrence, access_level = self.task_storage.get_occurrence(2, plan_id, now + day)
+        self.assertTrue(occurrence.is_virtual)
+        self.assertEqual(access_level, AccessLevel.WRITE)
+        self.assertEqual(
+            self.task_storage.get_occurrence(2, plan_id, now + day / 2), (None, AccessLevel.NONE))
+
+        task = self.task_storage.materialize(occurrence)
+        self.assertIsNotNone(task.id)
+        self.assertEqual(self.task_storage.materialize(occurrence).id, task.id)
+        self.assertTrue(self.task_storage.user_can_write(2, task.id))
+        self.assertEqual(self.task_storage.get_occurrence(2, plan_id, now + day)[0].id, task.id)
+        tasks = self.task_storage.tasks_in_window(1, now + day, now + 3 * day)
+        self.assertEqual([task.id for task in tasks], [task.id, None])
+        self.assertEqual(tasks[1].start_time, now + 2 * day)
+
+    def test_does_not_expand_deleted_occurrence_again(self):
+        now = datetime.datetime(2018, 6, 1, 12, 0)
+        day = datetime.timedelta(days=1)
+        template_id = self.task_storage.create(TaskFactory(user_id=1, start_time=now, end_time=None)).id
+        plan_id = self.task_plan_storage.create(TaskPlanFactory(
+            user_id=1, task_id=template_id, interval=day.total_seconds(),
+            last_created_at=now, is_virtual=True)).id
+        occurrence, _ = self.task_storage.get_occurrence(1, plan_id, now + day)
+        self.task_storage.delete_by_id(self.task_storage.materialize(occurrence).id)
+        self.assertEqual(
+            [task.start_time for task in self.task_storage.tasks_in_window(1, now + day, now + 3 * day)],
+            [now + 2 * day])
+        self.assertEqual(self.task_storage.get_occurrence(1, plan_id, now + day), (None, AccessLevel.NONE))
+        self.task_plan_storage.delete_by_id(plan_id)
+        self.assertEqual(CancelledOccurrence.select().count(), 0)
+
+    def test_returns_none_access_level_for_nonexistent_task(self):
+        self.assertEqual(
+            self.task_storage.get_with_access_level(10, 100),
+            (None, AccessLevel.NONE))
+
+    def test_returns_task_with_access_level(self):
+        task_id = self.task_storage.create(self.task).id
+        task, access_level = self.task_storage.get_with_access_level(
+            self.task.user_id, task_id)
+        self.assertEqual(task.id, task_id)
+        self.assertEqual(access_level, AccessLevel.OWNER)
+
     # TaskPlanStorage tests
 
     def test_creates_task_plan(self):
@@ -226,6 +753,80 @@ class StorageTest(unittest.TestCase):
         self.assertEqual(len(self.task_storage.user_tasks(user_id)),
                          before_tasks_count + 1)
 
+    def test_catches_up_missed_task_plan_intervals(self):
+        template_task_id = self.task_storage.create(
+            TaskFactory(user_id=1, status=Status.TEMPLATE.value)).id
+        interval = 3600
+        last_created_at = datetime.datetime.now() - datetime.timedelta(seconds=interval * 5 + 60)
+        plan_id = self.task_plan_storage.create(TaskPlanFactory(
+            user_id=1, task_id=template_task_id, interval=interval,
+            last_created_at=last_created_at)).id
+        self.assertEqual(
+            self.task_plan_storage.process_plans(self.task_storage, catch_up=True), 5)
+        created_tasks = self.task_storage.created_by_task_plan(1, plan_id)
+        self.assertEqual(len(created_tasks), 5)
+        self.assertTrue(all(task.status == Status.TODO.value for task in created_tasks))
+        self.assertEqual(
+            self.task_plan_storage.get_by_id(plan_id).last_created_at,
+            last_created_at + datetime.timedelta(seconds=interval * 5))
+        self.assertEqual(self.task_plan_storage.process_plans(self.task_storage), 0)
+
+    def test_processes_task_plans_with_rule(self):
+        template_task_id = self.task_storage.create(
+            TaskFactory(user_id=1, status=Status.TEMPLATE.value)).id
+        now = datetime.datetime.now()
+        last_created_at = (now - datetime.timedelta(days=3)).replace(hour=10, minute=0, second=0, microsecond=0)
+        plan_id = self.task_plan_storage.create(TaskPlanFactory(
+            user_id=1, task_id=template_task_id, interval=0,
+            last_created_at=last_created_at, rule='0 10 * * *')).id
+        self.assertEqual(
+            TaskPlan.get(TaskPlan.id == plan_id).next_due_at, last_created_at + datetime.timedelta(days=1))
+        missed = 3 if now.hour >= 10 else 2
+        self.assertEqual(
+            self.task_plan_storage.process_plans(self.task_storage, catch_up=True), missed)
+        plan = self.task_plan_storage.get_by_id(plan_id)
+        self.assertEqual(plan.rule, '0 10 * * *')
+        self.assertEqual(plan.last_created_at, last_created_at + datetime.timedelta(days=missed))
+        self.assertGreater(TaskPlan.get(TaskPlan.id == plan_id).next_due_at, now)
+
+    def test_moves_dormant_rule_plan_without_walking_missed_occurrences(self):
+        template_task_id = self.task_storage.create(
+            TaskFactory(user_id=1, status=Status.TEMPLATE.value)).id
+        now = datetime.datetime.now()
+        plan_id = self.task_plan_storage.create(TaskPlanFactory(
+            user_id=1, task_id=template_task_id, interval=0,
+            last_created_at=now - datetime.timedelta(days=3650), rule='*/5 * * * *')).id
+        with mock.patch.object(TaskPlanInstance, 'occurrences') as occurrences:
+            self.assertEqual(self.task_plan_storage.process_plans(self.task_storage), 1)
+        occurrences.assert_not_called()
+        next_due_at = TaskPlan.get(TaskPlan.id == plan_id).next_due_at
+        self.assertGreaterEqual(next_due_at, now)
+        self.assertLessEqual(next_due_at, now + datetime.timedelta(minutes=5))
+
+    def test_catches_up_missed_occurrences_by_batches(self):
+        template_task_id = self.task_storage.create(
+            TaskFactory(user_id=1, status=Status.TEMPLATE.value)).id
+        last_created_at = datetime.datetime.now() - datetime.timedelta(minutes=5 * 10 + 1)
+        self.task_plan_storage.create(TaskPlanFactory(
+            user_id=1, task_id=template_task_id, interval=300, last_created_at=last_created_at))
+        with mock.patch('tmlib.storage.task_plan_storage.MAX_CATCH_UP', 4):
+            self.assertEqual(self.task_plan_storage.process_plans(self.task_storage, catch_up=True), 4)
+            self.assertEqual(self.task_plan_storage.process_plans(self.task_storage, catch_up=True), 4)
+            self.assertEqual(self.task_plan_storage.process_plans(self.task_storage, catch_up=True), 2)
+
+    def test_processes_only_user_task_plans(self):
+        last_created_at = datetime.datetime.now() - datetime.timedelta(seconds=3600)
+        for user_id in (1, 2):
+            template_task_id = self.task_storage.create(
+                TaskFactory(user_id=user_id, status=Status.TEMPLATE.value)).id
+            self.task_plan_storage.create(TaskPlanFactory(
+                user_id=user_id, task_id=template_task_id, interval=600,
+                last_created_at=last_created_at))
+        self.assertEqual(
+            self.task_plan_storage.process_plans(self.task_storage, user_id=1), 1)
+        self.assertEqual(
+            [plan.user_id for plan in self.task_plan_storage.due_plans(datetime.datetime.now())], [2])
+
     # NotificationStorage tests
 
     def test_creates_notification(self):
@@ -317,3 +918,353 @@ class StorageTest(unittest.TestCase):
         self.assertEqual(
             processed_notification.status,
             NotificationStatus.PENDING.value)
+
+    def test_does_not_process_future_notifications(self):
+        self.task.start_time = datetime.datetime.now() + datetime.timedelta(hours=1)
+        self.notification.task_id = self.task_storage.create(self.task).id
+        self.notification.status = NotificationStatus.CREATED.value
+        self.notification.relative_start_time = 600
+        notification_id = self.notification_storage.create(self.notification).id
+        self.assertEqual(self.notification_storage.process_notifications(), 0)
+        self.assertEqual(
+            self.notification_storage.get_by_id(notification_id).status,
+            NotificationStatus.CREATED.value)
+
+    def test_updates_fire_at_after_changes(self):
+        start_time = datetime.datetime(2018, 6, 15, 12, 0)
+        self.task.start_time = start_time
+        task_id = self.task_storage.create(self.task).id
+        self.notification.task_id = task_id
+        self.notification.relative_start_time = 300
+        notification_id = self.notification_storage.create(self.notification).id
+
+        def fire_at():
+            return Notification.get(Notification.id == notification_id).fire_at
+
+        self.assertEqual(fire_at(), start_time - datetime.timedelta(seconds=300))
+        notification = self.notification_storage.get_by_id(notification_id)
+        notification.relative_start_time = 3600
+        self.notification_storage.update(notification)
+        self.assertEqual(fire_at(), start_time - datetime.timedelta(seconds=3600))
+        task = self.task_storage.get_by_id(task_id)
+        task.start_time = start_time + datetime.timedelta(days=1)
+        self.task_storage.update(task)
+        self.assertEqual(
+            fire_at(), start_time + datetime.timedelta(days=1, seconds=-3600))
+
+    def test_processes_notifications_with_negative_offset(self):
+        start_time = datetime.datetime.now().replace(microsecond=0) - datetime.timedelta(hours=2)
+        task_id = self.task_storage.create(TaskFactory(start_time=start_time)).id
+        notification_id = self.notification_storage.create(
+            NotificationFactory(task_id=task_id, relative_start_time=-3600)).id
+        self.assertEqual(
+            Notification.get(Notification.id == notification_id).fire_at,
+            start_time + datetime.timedelta(hours=1))
+        self.assertEqual(self.notification_storage.process_notifications(), 1)
+        self.assertEqual(
+            self.notification_storage.get_by_id(notification_id).status,
+            NotificationStatus.PENDING.value)
+
+    def test_returns_pending_notifications_summary(self):
+        start_time = datetime.datetime(2018, 6, 15, 12, 0)
+        task_id = self.task_storage.create(TaskFactory(start_time=start_time)).id
+        for status in (NotificationStatus.PENDING, NotificationStatus.PENDING,
+                       NotificationStatus.PENDING, NotificationStatus.CREATED):
+            self.notification_storage.create(NotificationFactory(
+                user_id=10, task_id=task_id, status=status.value, relative_start_time=600))
+        self.notification_storage.create(NotificationFactory(
+            user_id=11, task_id=task_id, status=NotificationStatus.CREATED.value, relative_start_time=300))
+        count, notifications = self.notification_storage.pending_summary(10, 2)
+        self.assertEqual(count, 3)
+        self.assertEqual(len(notifications), 2)
+        self.assertEqual(self.notification_storage.pending_summary(12, 2), (0, []))
+        self.assertEqual(
+            self.notification_storage.next_fire_at(10), start_time - datetime.timedelta(seconds=600))
+        self.assertEqual(
+            self.notification_storage.next_fire_at(11), start_time - datetime.timedelta(seconds=300))
+        self.assertEqual(self.notification_storage.user_ids([task_id, task_id + 1]), {10, 11})
+
+    # Migrations tests
+
+    def test_applies_all_migrations(self):
+        self.assertEqual(
+            current_version(self.task_storage.database),
+            latest_version())
+        self.assertEqual(SchemaMigration.select().count(), latest_version())
+
+    def test_creates_indexes(self):
+        index_names = [index.name for index in self.task_storage.database.get_indexes('task')]
+        self.assertIn('task_user_id_status', index_names)
+        self.assertIn('task_parent_task_id', index_names)
+
+    def test_does_not_allow_duplicate_rights(self):
+        task_id = self.task_storage.create(self.task).id
+        UsersReadTasks.create(user_id=10, task_id=task_id)
+        with self.assertRaises(IntegrityError):
+            UsersReadTasks.create(user_id=10, task_id=task_id)
+
+    def test_upgrades_existing_database(self):
+        database_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        database_file.close()
+        connection = sqlite3.connect(database_file.name)
+        connection.executescript("""
+            CREATE TABLE task (id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER, title VARCHAR(255) NOT NULL,
+                note VARCHAR(255) NOT NULL, start_time DATETIME, end_time DATETIME, assigned_user_id INTEGER,
+                parent_task_id INTEGER, is_event INTEGER NOT NULL, category_id INTEGER, priority INTEGER NOT NULL,
+                status INTEGER NOT NULL, created_at DATETIME NOT NULL, updated_at DATETIME NOT NULL, plan_id INTEGER);
+            CREATE TABLE usersreadtasks (id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER, task_id INTEGER NOT NULL);
+            INSERT INTO task VALUES (1, 10, 'title', '', NULL, NULL, NULL, NULL, 0, NULL, 2, 0,
+                '2018-06-15 13:57:00', '2018-06-15 13:57:00', NULL);
+            INSERT INTO task VALUES (2, 10, 'plan task', '', NULL, NULL, NULL, NULL, 0, NULL, 2, 0,
+                '2018-06-15 13:57:00', '2018-06-15 13:57:00', 1);
+            INSERT INTO task VALUES (3, 10, 'plan task', '', NULL, NULL, NULL, NULL, 0, NULL, 2, 0,
+                '2018-06-16 13:57:00', '2018-06-16 13:57:00', 1);
+            INSERT INTO usersreadtasks (user_id, task_id) VALUES (11, 1), (11, 1);
+            UPDATE task SET start_time = '2018-06-16 12:00:00' WHERE id = 1;
+            CREATE TABLE notification (id INTEGER NOT NULL PRIMARY KEY, task_id INTEGER, user_id INTEGER,
+                title VARCHAR(255) NOT NULL, relative_start_time INTEGER NOT NULL, status INTEGER NOT NULL);
+            INSERT INTO notification VALUES (1, 1, 10, 'title', 60, 0), (2, 1, 10, 'title', -60, 0);
+        """)
+        connection.close()
+        try:
+            connector = DatabaseConnector(database_file.name)
+            index_names = [index.name for index in connector.database.get_indexes('usersreadtasks')]
+            self.assertIn('usersreadtasks_user_id_task_id', index_names)
+            self.assertEqual(
+                [name for _, _, name in connector.database.execute_sql(
+                    'PRAGMA index_info(notification_status_fire_at)').fetchall()],
+                ['status', 'fire_at'])
+            self.assertEqual(
+                [name for _, _, name in connector.database.execute_sql(
+                    'PRAGMA index_info(task_plan_id_occurrence_at)').fetchall()],
+                ['plan_id', 'occurrence_at'])
+            self.assertEqual(UsersReadTasks.select().count(), 1)
+            self.assertEqual(Task.get(Task.id == 1).title, 'title')
+            self.assertEqual(
+                Notification.get(Notification.id == 1).fire_at,
+                datetime.datetime(2018, 6, 16, 11, 59))
+            self.assertEqual(
+                Notification.get(Notification.id == 2).fire_at,
+                datetime.datetime(2018, 6, 16, 12, 1))
+            self.assertEqual(current_version(connector.database), latest_version())
+            connector.database.close()
+        finally:
+            os.remove(database_file.name)
+
+    # StorageEngine tests
+
+    def test_storages_share_engine(self):
+        self.assertIs(self.task_storage.engine, self.category_storage.engine)
+        self.assertIs(TaskStorage(self.database).engine, get_engine(self.database))
+
+    def test_creating_storage_does_not_migrate_database_again(self):
+        engine = get_engine(self.database)
+        SchemaMigration.delete().execute()
+        TaskStorage(self.database)
+        NotificationStorage(engine=engine)
+        self.assertEqual(SchemaMigration.select().count(), 0)
+
+    def test_bootstraps_engine_again_after_dropping_tables(self):
+        engine = get_engine(self.database)
+        engine.drop_tables()
+        self.assertFalse(engine.bootstrapped)
+        self.task_storage = TaskStorage(self.database)
+        self.assertTrue(engine.bootstrapped)
+        self.assertEqual(len(self.task_storage.user_tasks(10)), 0)
+
+    def test_applies_database_profile(self):
+        database_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        database_file.close()
+        try:
+            engine = get_engine(database_file.name, 'durable')
+            self.assertEqual(engine.database.pragma('synchronous'), 2)  # FULL
+            self.assertEqual(engine.database.pragma('journal_mode'), 'wal')
+            self.assertIs(get_engine(database_file.name, 'bulk-load'), engine)
+            self.assertEqual(engine.database.pragma('synchronous'), 0)  # OFF
+            engine.database.close()
+        finally:
+            os.remove(database_file.name)
+
+    def test_raises_error_for_unknown_database_profile(self):
+        with self.assertRaises(UnknownDatabaseProfileError):
+            get_engine(self.database, 'fastest')
+
+    # ReadCache tests
+
+    def _enable_read_cache(self):
+        engine = self.task_storage.engine
+        engine.set_read_cache(ReadCache(LocalCache(max_size=100, timeout=60)))
+        self.addCleanup(engine.set_read_cache, None)
+        return engine.read_cache
+
+    def test_caches_user_tasks_until_they_are_changed(self):
+        task = self.task_storage.create(self.task)
+        read_cache = self._enable_read_cache()
+        self.assertEqual(self.task_storage.user_tasks(10), [task])
+        Task.update(title='Changed directly').where(Task.id == task.id).execute()
+        self.assertEqual(self.task_storage.user_tasks(10)[0].title, task.title)
+        self.assertEqual(read_cache.stats(), (1, 1))
+        task.title = 'Changed by storage'
+        self.task_storage.update(task)
+        self.assertEqual(self.task_storage.user_tasks(10)[0].title, 'Changed by storage')
+        self.assertEqual(read_cache.stats(), (1, 2))
+
+    def test_returns_copies_of_cached_tasks(self):
+        self.task_storage.create(self.task)
+        self._enable_read_cache()
+        self.task_storage.user_tasks(10)[0].title = 'Changed in list'
+        self.assertNotEqual(self.task_storage.user_tasks(10)[0].title, 'Changed in list')
+
+    def test_bumps_versions_of_users_affected_by_rights_and_assignment(self):
+        task = self.task_storage.create(self.task)
+        self._enable_read_cache()
+        self.assertEqual(self.task_storage.can_read(11), [])
+        self.task_storage.set_acl([task.id], [11], [])
+        self.assertEqual([task.id for task in self.task_storage.can_read(11)], [task.id])
+        self.assertEqual(self.task_storage.assigned(12), [])
+        with self.task_storage.unit_of_work():
+            task = self.task_storage.get_by_id(task.id)
+            task.assigned_user_id = 12
+            self.task_storage.update(task)
+        self.assertEqual([task.id for task in self.task_storage.assigned(12)], [task.id])
+        self.task_storage.delete_by_id(task.id)
+        self.assertEqual(self.task_storage.can_read(11), [])
+        self.assertEqual(self.task_storage.assigned(12), [])
+
+    def test_bumps_versions_of_notification_owners(self):
+        task = self.task_storage.create(self.task)
+        self._enable_read_cache()
+        self.notification.task_id = task.id
+        self.assertEqual(self.notification_storage.all_user_notifications(10), [])
+        notification = self.notification_storage.create(self.notification)
+        Task.update(start_time=datetime.datetime.now()).where(Task.id == task.id).execute()
+        self.notification_storage.process_notifications()
+        self.assertEqual(
+            [notification.status for notification in self.notification_storage.all_user_notifications(10)],
+            [NotificationStatus.PENDING.value])
+        self.notification_storage.delete_by_id(notification.id)
+        self.assertEqual(self.notification_storage.all_user_notifications(10), [])
+
+    def test_does_not_cache_notifications_that_other_process_promotes(self):
+        database_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        database_file.close()
+        self.addCleanup(os.remove, database_file.name)
+        task_storage = TaskStorage(database_file.name)
+        notification_storage = NotificationStorage(database_file.name)
+        self.addCleanup(task_storage.database.close)
+        task_storage.engine.set_read_cache(ReadCache(LocalCache(max_size=100, timeout=60)))
+        task_id = task_storage.create(TaskFactory(start_time=datetime.datetime.now())).id
+        notification_storage.create(NotificationFactory(task_id=task_id, user_id=1, relative_start_time=60))
+        self.assertEqual(notification_storage.pending_summary(1, 5), (0, []))
+        self.assertEqual(notification_storage.pending(1), [])
+        connection = sqlite3.connect(database_file.name)
+        with connection:
+            connection.execute('UPDATE notification SET status = ?', (NotificationStatus.PENDING.value,))
+        connection.close()
+        self.assertEqual(notification_storage.pending_summary(1, 5)[0], 1)
+        self.assertEqual(len(notification_storage.pending(1)), 1)
+        self.assertEqual(notification_storage.created(1), [])
+
+    def test_local_cache_evicts_least_recently_used_and_expired_entries(self):
+        cache = LocalCache(max_size=2, timeout=60)
+        cache.set('first', 1)
+        cache.set('second', 2)
+        cache.get('first')
+        cache.set('third', 3)
+        self.assertEqual(cache.get('first'), 1)
+        self.assertIsNone(cache.get('second'))
+        cache.set('expired', 4, timeout=0)
+        self.assertIsNone(cache.get('expired'))
+        with self.assertRaises(ValueError):
+            cache.incr('second')
+
+    # Signals tests
+
+    def _connect(self, deferred=False):
+        events = []
+        signals = self.task_storage.signals
+        signals.connect(events.append, deferred)
+        self.addCleanup(signals.disconnect, events.append)
+        return events
+
+    def test_sends_events_about_task_writes(self):
+        events = self._connect()
+        task = self.task_storage.create(TaskFactory(assigned_user_id=11))
+        self.task_storage.add_user_for_read(12, task.id)
+        task.title = 'Changed'
+        self.task_storage.update(task)
+        self.task_storage.delete_by_id(task.id)
+        self.assertEqual(
+            [(event.model, event.action, event.ids) for event in events],
+            [(Task, Action.CREATED, (task.id,)),
+             (UsersReadTasks, Action.CREATED, (task.id,)),
+             (Task, Action.UPDATED, (task.id,)),
+             (Task, Action.DELETED, (task.id,))])
+        self.assertEqual(events[0].user_ids, {10, 11})
+        self.assertIn('title', events[2].fields)
+        self.assertEqual(events[3].user_ids, {10, 11, 12})
+
+    def test_sends_changed_fields_of_flushed_tasks(self):
+        task = self.task_storage.create(self.task)
+        events = self._connect()
+        with self.task_storage.unit_of_work():
+            task = self.task_storage.get_by_id(task.id)
+            task.status = Status.DONE.value
+            task.assigned_user_id = 11
+            self.task_storage.update(task)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].fields, {'status', 'assigned_user_id'})
+        self.assertEqual(events[0].user_ids, {10, 11})
+
+    def test_sends_deferred_events_after_commit(self):
+        events = self._connect(deferred=True)
+        with self.task_storage.database.atomic():
+            task_ids = self.task_storage.bulk_create([TaskFactory(), TaskFactory(user_id=11)])
+            self.assertEqual(events, [])
+        self.assertEqual([(event.action, event.ids) for event in events], [(Action.CREATED, tuple(task_ids))])
+        self.assertEqual(events[0].user_ids, {10, 11})
+        with self.assertRaises(ZeroDivisionError):
+            with self.task_storage.database.atomic():
+                self.task_storage.delete_by_id(task_ids[0])
+                1 / 0
+        self.assertEqual(len(events), 1)
+
+    def test_sends_events_about_promoted_notifications(self):
+        task = self.task_storage.create(TaskFactory(start_time=datetime.datetime.now()))
+        notification = self.notification_storage.create(NotificationFactory(task_id=task.id, user_id=11))
+        events = self._connect()
+        self.assertEqual(self.notification_storage.process_notifications(), 1)
+        self.assertEqual(events[0][:4], (Notification, Action.UPDATED, (notification.id,), {'status'}))
+        self.assertEqual(events[0].user_ids, {11})
+
+    def test_writes_only_changed_fields_of_task(self):
+        task = self.task_storage.create(self.task)
+        updated_at = Task.get(Task.id == task.id).updated_at
+        events = self._connect()
+        self.task_storage.update(task)
+        self.assertEqual(events, [])
+        self.assertEqual(Task.get(Task.id == task.id).updated_at, updated_at)
+        task = self.task_storage.get_by_id(task.id)
+        task.priority = 5
+        self.task_storage.update(task)
+        self.assertEqual(events[0].fields, {'priority'})
+        self.task_storage.update(task)
+        self.assertEqual(len(events), 1)
+
+    def test_sets_status_and_assigns_task_without_loading_it(self):
+        task = self.task_storage.create(self.task)
+        events = self._connect()
+        self.task_storage.set_status(task.id, Status.DONE.value)
+        self.task_storage.set_status(task.id, Status.DONE.value)
+        self.task_storage.assign(task.id, 11)
+        self.assertEqual(
+            [(event.action, event.fields, event.user_ids) for event in events],
+            [(Action.UPDATED, {'status'}, {10}),
+             (Action.UPDATED, {'assigned_user_id'}, {10, 11})])
+        task = self.task_storage.get_by_id(task.id)
+        self.assertEqual((task.status, task.assigned_user_id), (Status.DONE.value, 11))
+        with self.task_storage.unit_of_work():
+            task = self.task_storage.get_by_id(task.id)
+            self.task_storage.set_status(task.id, Status.IN_PROGRESS.value)
+            self.assertEqual(task.status, Status.IN_PROGRESS.value)
+        self.assertEqual(Task.get(Task.id == task.id).status, Status.IN_PROGRESS.value)
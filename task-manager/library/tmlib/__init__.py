@@ -30,11 +30,15 @@ Getting all user's tasks:
     >>> tasks_controller = create_tasks_controller(USER_ID, '/your/database/path/database_name')
     >>> tasks_list = tmlib.commands.user_tasks(tasks_controller)
 
+All controllers and storages that work with the same database share one storage engine (see tmlib.storage.engine). Engine is created and database schema is created or upgraded only once per process, so creating controllers is cheap and you can create them whenever you need.
+
 You can create notifications only for task that has filled start_time field.
 When notification created it has default status "CREATED".
 When it is time to show notification, status changes to "PENDING".
 To change status, you should call process_notifications() method in NotificationsController.
 After you have seen pending notification, you can call set_as_shown() function from commands module to change notification's status on "SHOWN".
 
-If you want to create repeated task, firstly you should create template task. You can set this task's status as "TEMPLATE". Also you need to specify interval of repeated task in seconds. Then you have to create TaskPlan object and pass to it template task's ID and interval. To create repeated tasks according to TaskPlan, you should call process_plans() method in TaskPlansController. It will create tasks according to specified interval.
+If you want to create repeated task, firstly you should create template task. You can set this task's status as "TEMPLATE". Also you need to specify interval of repeated task in seconds. Then you have to create TaskPlan object and pass to it template task's ID and interval. To create repeated tasks according to TaskPlan, you should call process_plans() method in TaskPlansController. It will create tasks according to specified interval. If several intervals were missed, it creates one task, or task for every missed interval if you pass catch_up=True.
+
+Instead of calling process_notifications() and process_plans() yourself, you can run scheduler from tmlib.scheduler module. It works in background and does it when notifications and plans are due.
 """
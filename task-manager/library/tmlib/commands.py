@@ -1,7 +1,9 @@
 """This module provides all methods to work with library"""
 
 
-from tmlib.models.task import Task, Status
+import datetime
+from itertools import islice
+from tmlib.models.task import Task, Status, AccessLevel
 from tmlib.models.validator import validate_task, validate_task_plan
 from tmlib.exceptions.exceptions import UserHasNoRightError, TaskDoesNotExistError
 import tmlib.logger as log
@@ -13,12 +15,52 @@ def add_task(tasks_controller, task):
     return tasks_controller.create(task)
 
 
+def bulk_add_tasks(tasks_controller, tasks, batch_size=50):
+    """
+    Validates all tasks, then creates them using multi-row inserts in one transaction.
+    Returns list of created tasks' IDs in the same order.
+
+    Inner task can reference parent task from the same list: pass parent task object as its parent_task_id.
+    Parent task should be placed before inner task in the list.
+
+    Example:
+    project = Task(title='Project')
+    bulk_add_tasks(controller, [project, Task(title='First step', parent_task_id=project)])
+    """
+
+    tasks = list(tasks)
+    positions = {id(task): position for position, task in enumerate(tasks)}
+    for position, task in enumerate(tasks):
+        validate_task(task)
+        parent_task = task.parent_task_id
+        if isinstance(parent_task, Task) and parent_task.id is None and positions.get(
+                id(parent_task), position) >= position:
+            log.get_logger().error('Parent task is not created before inner task')
+            raise TaskDoesNotExistError
+    ids = tasks_controller.bulk_create(tasks, batch_size)
+    log.get_logger().info('Added {} tasks'.format(len(ids)))
+    return ids
+
+
 def add_task_plan(task_plans_controller, plan):
     validate_task_plan(plan)
     log.get_logger().info('Added task plan')
     task_plans_controller.create(plan)
 
 
+def preview_occurrences(plan, n, start=None):
+    """
+    Returns list of times of plan's next n occurrences from start (now by default).
+    Plan can be not created yet, e.g. preview_occurrences(TaskPlan(0, None, None, now, rule='0 10 * * 1-5'), 5)
+    shows the next five weekdays at 10:00
+    """
+
+    validate_task_plan(plan)
+    if start is None:
+        start = datetime.datetime.now()
+    return list(islice(plan.iter_occurrences(start), n))
+
+
 def get_task_plan_by_id(task_plans_controller, plan_id):
     return task_plans_controller.get_by_id(plan_id)
 
@@ -32,7 +74,14 @@ def get_tasks_created_by_task_plan(tasks_controller, plan_id):
 
 
 def update_task(tasks_controller, task):
+    """Updates task. Virtual occurrence of task plan is stored first, so only this occurrence is changed"""
+
     validate_task(task)
+    if task.is_virtual:
+        stored_task = materialize_occurrence(tasks_controller, task.plan_id, task.occurrence_at)
+        task.id = stored_task.id
+        task.created_at = stored_task.created_at
+        task.updated_at = stored_task.updated_at
     if user_can_write_task(tasks_controller, task.id):
         tasks_controller.update(task)
         log.get_logger().info('Updated task')
@@ -49,8 +98,9 @@ def update_task_plan(task_plans_controller, plan):
 
 
 def get_task_by_id(tasks_controller, task_id):
-    if user_can_read_task(tasks_controller, task_id):
-        return tasks_controller.get_by_id(task_id)
+    task, access_level = tasks_controller.get_with_access_level(task_id)
+    if access_level.value >= AccessLevel.READ.value:
+        return task
     else:
         return None
 
@@ -75,12 +125,12 @@ def delete_task_plan(task_plans_controller, task_plan_id):
 def create_inner_task(tasks_controller, parent_task_id, task):
     """Checks if parent task exists, then creates inner task"""
 
-    parent_task = get_task_by_id(tasks_controller, parent_task_id)
-    if parent_task is None:
+    access_level = get_task_access_level(tasks_controller, parent_task_id)
+    if access_level == AccessLevel.NONE:
         log.get_logger().error('Task does not exist')
         raise TaskDoesNotExistError
     validate_task(task)
-    if user_can_write_task(tasks_controller, parent_task_id):
+    if access_level.value >= AccessLevel.WRITE.value:
         tasks_controller.create_inner_task(parent_task_id, task)
         log.get_logger().info(
             'Created inner task for task with ID: {}'.format(task.id))
@@ -90,7 +140,7 @@ def create_inner_task(tasks_controller, parent_task_id, task):
         raise UserHasNoRightError
 
 
-def filter_tasks(tasks_controller, *args):
+def filter_tasks(tasks_controller, *args, page=None):
     """
     Before usage you should import Task from tmlib.storage.storage_models module.
     Then you can pass 2 arguments: tasks_controller and filter query.
@@ -100,16 +150,109 @@ def filter_tasks(tasks_controller, *args):
     filter_tasks(
         controller,
         Task.title.contains('title') & Task.created_at > datetime.datetime.now())
+
+    Returns lazy TaskQuery (see tmlib.storage.task_storage module) that can be ordered, limited and counted
+    before tasks are selected:
+    filter_tasks(controller, Task.status == Status.TODO.value).order_by('-priority').limit(10)
+
+    If page (PageRequest from tmlib.storage.pagination module) is passed, returns Page of tasks.
+    All list commands below accept page in the same way
+    """
+
+    return tasks_controller.filter(*args, page=page)
+
+
+def tasks_in_window(tasks_controller, start, end, include_shared=True):
+    """
+    Returns tasks and events that take place in time window [start, end), ordered by time.
+    Task lasts from start_time to end_time, task with only one of them takes place at that moment.
+    By default returns tasks that user can read (own, assigned and shared ones), with include_shared=False
+    returns only user's own tasks
+    """
+
+    return tasks_controller.tasks_in_window(start, end, include_shared)
+
+
+def get_occurrence(tasks_controller, plan_id, occurrence_at):
+    """
+    Returns occurrence of virtual task plan at occurrence_at if user can read plan's task, otherwise None.
+    Stored occurrence has ID, virtual one has ID == None
+    """
+
+    task, access_level = tasks_controller.get_occurrence(plan_id, occurrence_at)
+    if access_level.value >= AccessLevel.READ.value:
+        return task
+    else:
+        return None
+
+
+def materialize_occurrence(tasks_controller, plan_id, occurrence_at):
+    """
+    Stores occurrence of virtual task plan at occurrence_at, so it can be changed apart from other occurrences.
+    Stored task gets users that can read and write plan's task. Returns stored task
+    """
+
+    task, access_level = tasks_controller.get_occurrence(plan_id, occurrence_at)
+    if task is None:
+        log.get_logger().error('Task plan has no occurrence at {}'.format(occurrence_at))
+        raise TaskDoesNotExistError
+    if access_level.value < AccessLevel.WRITE.value:
+        log.get_logger().error(
+            'User has no rights for changing occurrence of task plan')
+        raise UserHasNoRightError
+    if task.is_virtual:
+        task = tasks_controller.materialize(task)
+        log.get_logger().info('Stored occurrence of task plan with ID {}'.format(plan_id))
+    return task
+
+
+def plan_occurrences(tasks_controller, plan_id, start, end):
+    """
+    Returns tasks of task plan with ID == plan_id in time window [start, end) ordered by time:
+    stored ones and virtual occurrences that weren't stored yet
+    """
+
+    return tasks_controller.tasks_in_window(start, end, plan_id=plan_id)
+
+
+def search_tasks(tasks_controller, query, limit=20):
+    """
+    Searches words from query in titles and notes of tasks that user can read (own, assigned and shared ones).
+    The last word matches as prefix, so 'buy mil' finds 'buy milk'.
+    Returns at most limit SearchResult(task, rank, snippet) ordered by relevance
+    """
+
+    return tasks_controller.search(query, limit)
+
+
+def get_inner_tasks(tasks_controller, task_id, recursive=False, max_depth=None):
+    """
+    Returns inner tasks for task with ID == task_id.
+    If recursive is True, returns all inner tasks but not deeper than max_depth (if it's passed)
+    """
+
+    if user_can_read_task(tasks_controller, task_id):
+        return tasks_controller.inner(task_id, recursive, max_depth)
+    else:
+        log.get_logger().error(
+            'User has no right for getting inner task')
+        raise UserHasNoRightError
+
+
+def get_task_tree(tasks_controller, task_id, max_depth=None):
+    """
+    Returns all inner tasks for task with ID == task_id as list of nodes.
+    Every node has task, depth (1 for direct inner tasks) and path (IDs of tasks from task with ID == task_id)
     """
 
-    return tasks_controller.filter(args)
+    return list(iter_task_tree(tasks_controller, task_id, max_depth))
 
 
-def get_inner_tasks(tasks_controller, task_id, recursive=False):
-    """Returns inner tasks for task with ID == task_id"""
+def iter_task_tree(tasks_controller, task_id, max_depth=None):
+    """Same as get_task_tree, but yields nodes while they are fetched from database"""
 
     if user_can_read_task(tasks_controller, task_id):
-        return tasks_controller.inner(task_id, recursive)
+        return tasks_controller.iter_subtree(task_id, max_depth)
     else:
         log.get_logger().error(
             'User has no right for getting inner task')
@@ -216,6 +359,38 @@ def remove_all_users_for_write(tasks_controller, task_id):
         raise UserHasNoRightError
 
 
+def set_task_acl(tasks_controller, task_id, readers, writers):
+    """
+    Makes users with IDs from readers the only users that can read task with ID == task_id
+    and users with IDs from writers the only users that can read and change it.
+    Only changed rights are written, all in one transaction
+    """
+
+    if user_can_write_task(tasks_controller, task_id):
+        tasks_controller.set_acl([task_id], readers, writers)
+        log.get_logger().info(
+            'Set access rights for task with ID: {}'.format(task_id))
+    else:
+        log.get_logger().error(
+            'User has no right for changing access for this task')
+        raise UserHasNoRightError
+
+
+def set_tasks_acl(tasks_controller, task_ids, readers, writers):
+    """Same as set_task_acl, but applies the same rights to all tasks with IDs from task_ids"""
+
+    access_levels = get_tasks_access_levels(tasks_controller, task_ids)
+    if all(access_level.value >= AccessLevel.WRITE.value
+           for access_level in access_levels.values()):
+        tasks_controller.set_acl(list(access_levels), readers, writers)
+        log.get_logger().info(
+            'Set access rights for {} tasks'.format(len(access_levels)))
+    else:
+        log.get_logger().error(
+            'User has no right for changing access for some of these tasks')
+        raise UserHasNoRightError
+
+
 def get_users_can_read_task(tasks_controller, task_id):
     return tasks_controller.get_users_can_read_task(task_id)
 
@@ -224,24 +399,36 @@ def get_users_can_write_task(tasks_controller, task_id):
     return tasks_controller.get_users_can_write_task(task_id)
 
 
-def user_tasks(tasks_controller):
-    return tasks_controller.user_tasks()
+def user_tasks(tasks_controller, page=None):
+    return tasks_controller.user_tasks(page)
+
 
+def assigned_tasks(tasks_controller, page=None):
+    return tasks_controller.assigned(page)
 
-def assigned_tasks(tasks_controller):
-    return tasks_controller.assigned()
 
+def can_read_tasks(tasks_controller, page=None):
+    return tasks_controller.can_read(page)
 
-def can_read_tasks(tasks_controller):
-    return tasks_controller.can_read()
 
+def can_write_tasks(tasks_controller, page=None):
+    return tasks_controller.can_write(page)
 
-def can_write_tasks(tasks_controller):
-    return tasks_controller.can_write()
 
+def tasks_with_status(tasks_controller, status, page=None):
+    return tasks_controller.with_status(status, page)
 
-def tasks_with_status(tasks_controller, status):
-    return tasks_controller.with_status(status)
+
+def active_tasks(tasks_controller, page=None):
+    """Returns user's tasks that aren't archived and aren't templates"""
+
+    return tasks_controller.active(page)
+
+
+def tasks_with_category(tasks_controller, category_id, page=None):
+    """Returns user's tasks with category that aren't archived and aren't templates"""
+
+    return tasks_controller.with_category(category_id, page)
 
 
 def set_task_status(tasks_controller, task_id, status):
@@ -279,6 +466,15 @@ def get_category_by_id(categories_controller, category_id):
     return categories_controller.get_by_id(category_id)
 
 
+def get_category_names(categories_controller, category_ids):
+    """
+    Returns dictionary {category_id: name} for all passed category IDs in one query.
+    Use it instead of getting every category of list by ID
+    """
+
+    return categories_controller.names(category_ids)
+
+
 def delete_category(categories_controller, category_id):
     category = categories_controller.get_by_id(category_id)
     if category.user_id == categories_controller.user_id:
@@ -286,21 +482,41 @@ def delete_category(categories_controller, category_id):
         log.get_logger().info('Deleted category')
 
 
+def get_task_access_level(tasks_controller, task_id):
+    """
+    Returns AccessLevel of controller's user for task with ID == task_id.
+    Returns AccessLevel.NONE if task doesn't exist
+    """
+
+    return tasks_controller.access_level(task_id)
+
+
+def get_task_titles(tasks_controller, task_ids):
+    """
+    Returns dictionary {task_id: title} for passed tasks that controller's user can read.
+    Use it instead of getting every task of list by ID
+    """
+
+    return tasks_controller.titles(task_ids)
+
+
+def get_tasks_access_levels(tasks_controller, task_ids):
+    """
+    Returns dictionary {task_id: AccessLevel} of controller's user for all passed task IDs.
+    Use it instead of checking rights for every task from list
+    """
+
+    return tasks_controller.permissions_for(task_ids)
+
+
 def user_can_read_task(tasks_controller, task_id):
-    task = tasks_controller.get_by_id(task_id)
-    if task is not None:
-        return (task.user_id == tasks_controller.user_id or
-                task.assigned_user_id == tasks_controller.user_id or
-                tasks_controller.user_can_read(task_id) or
-                tasks_controller.user_can_write(task_id))
+    return get_task_access_level(
+        tasks_controller, task_id).value >= AccessLevel.READ.value
 
 
 def user_can_write_task(tasks_controller, task_id):
-    task = tasks_controller.get_by_id(task_id)
-    if task is not None:
-        return (task.user_id == tasks_controller.user_id or
-                task.assigned_user_id == tasks_controller.user_id or
-                tasks_controller.user_can_write(task_id))
+    return get_task_access_level(
+        tasks_controller, task_id).value >= AccessLevel.WRITE.value
 
 
 def add_notification(tasks_controller, notifications_controller, notification):
@@ -321,8 +537,8 @@ def delete_notification(notifications_controller, notification_id):
     log.get_logger().info('Deleted notification')
 
 
-def user_notifications(notifications_controller):
-    return notifications_controller.all()
+def user_notifications(notifications_controller, page=None):
+    return notifications_controller.all(page)
 
 
 def update_notification(
@@ -337,16 +553,39 @@ def update_notification(
     log.get_logger().info('Updated notification')
 
 
-def pending_notifications(notifications_controller):
-    return notifications_controller.pending()
+def pending_notifications(notifications_controller, page=None):
+    return notifications_controller.pending(page)
+
+
+def pending_notifications_summary(tasks_controller, notifications_controller, limit):
+    """
+    Returns tuple (number of pending notifications, list of (notification, task title) for the first limit of them).
+    Titles of all tasks are loaded by one query, title is None if user can't read task
+    """
+
+    count, notifications = notifications_controller.pending_summary(limit)
+    titles = tasks_controller.titles([notification.task_id for notification in notifications])
+    return count, [(notification, titles.get(notification.task_id)) for notification in notifications]
+
+
+def next_notification_time(notifications_controller):
+    """Returns time when the next user's notification should be shown or None if there are no such notifications"""
+
+    return notifications_controller.next_fire_at()
+
+
+def get_notified_users(notifications_controller, task_ids):
+    """Returns set of IDs of users that have notifications of passed tasks"""
+
+    return notifications_controller.notified_users(task_ids)
 
 
-def user_created_notifications(notifications_controller):
-    return notifications_controller.created()
+def user_created_notifications(notifications_controller, page=None):
+    return notifications_controller.created(page)
 
 
-def user_shown_notifications(notifications_controller):
-    return notifications_controller.shown()
+def user_shown_notifications(notifications_controller, page=None):
+    return notifications_controller.shown(page)
 
 
 def set_notification_as_shown(notifications_controller, notification_id):
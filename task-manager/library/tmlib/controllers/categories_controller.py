@@ -1,9 +1,10 @@
 from tmlib.storage.category_storage import CategoryStorage
+from tmlib.storage.engine import DEFAULT_DATABASE
 from tmlib.controllers.base_controller import BaseController
 
 
-def create_categories_controller(user_id, database_name):
-    return CategoriesController(user_id, CategoryStorage(database_name))
+def create_categories_controller(user_id, database_name=DEFAULT_DATABASE, engine=None):
+    return CategoriesController(user_id, CategoryStorage(database_name, engine=engine))
 
 
 class CategoriesController(BaseController):
@@ -22,3 +23,8 @@ class CategoriesController(BaseController):
 
     def all(self):
         return self.storage.all_user_categories(self.user_id)
+
+    def names(self, category_ids):
+        """Returns dictionary {category_id: name} for all passed category IDs"""
+
+        return self.storage.names(category_ids)
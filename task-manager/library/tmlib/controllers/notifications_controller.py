@@ -1,10 +1,11 @@
 from tmlib.storage.notification_storage import NotificationStorage
+from tmlib.storage.engine import DEFAULT_DATABASE
 from tmlib.models.notification import Status as NotificationStatus
 from tmlib.controllers.base_controller import BaseController
 
 
-def create_notifications_controller(user_id, database_name):
-    return NotificationsController(user_id, NotificationStorage(database_name))
+def create_notifications_controller(user_id, database_name=DEFAULT_DATABASE, engine=None):
+    return NotificationsController(user_id, NotificationStorage(database_name, engine=engine))
 
 
 class NotificationsController(BaseController):
@@ -21,8 +22,8 @@ class NotificationsController(BaseController):
     def get_by_id(self, notification_id):
         return self.storage.get_by_id(notification_id)
 
-    def all(self):
-        return self.storage.all_user_notifications(self.user_id)
+    def all(self, page=None):
+        return self.storage.all_user_notifications(self.user_id, page)
 
     def set_as_shown(self, notification_id):
         """Sets notification's status with ID == notification_id as SHOWN"""
@@ -31,22 +32,40 @@ class NotificationsController(BaseController):
         notification.status = NotificationStatus.SHOWN.value
         self.update(notification)
 
-    def pending(self):
+    def pending(self, page=None):
         """Returns notifications with status PENDING"""
 
-        return self.storage.pending(self.user_id)
+        return self.storage.pending(self.user_id, page)
 
-    def created(self):
+    def pending_summary(self, limit):
+        """Returns tuple (number of notifications with status PENDING, list of the first limit of them)"""
+
+        return self.storage.pending_summary(self.user_id, limit)
+
+    def next_fire_at(self):
+        """Returns time when the next user's notification with status CREATED should be shown or None"""
+
+        return self.storage.next_fire_at(self.user_id)
+
+    def notified_users(self, task_ids):
+        """Returns set of IDs of users that have notifications of passed tasks"""
+
+        return self.storage.user_ids(task_ids)
+
+    def created(self, page=None):
         """Returns notifications with status CREATED"""
 
-        return self.storage.created(self.user_id)
+        return self.storage.created(self.user_id, page)
 
-    def shown(self):
+    def shown(self, page=None):
         """Returns notifications with status SHOWN"""
 
-        return self.storage.shown(self.user_id)
+        return self.storage.shown(self.user_id, page)
 
     def process_notifications(self):
-        """Changes notification status from CREATED to PENDING if it's time to show notification"""
+        """
+        Changes notification status from CREATED to PENDING if it's time to show notification.
+        Returns number of changed notifications
+        """
 
-        self.storage.process_notifications()
+        return self.storage.process_notifications()
@@ -1,9 +1,10 @@
 from tmlib.controllers.base_controller import BaseController
 from tmlib.storage.task_plan_storage import TaskPlanStorage
+from tmlib.storage.engine import DEFAULT_DATABASE
 
 
-def create_task_plans_controller(user_id, database_name):
-    return TaskPlansController(user_id, TaskPlanStorage(database_name))
+def create_task_plans_controller(user_id, database_name=DEFAULT_DATABASE, engine=None):
+    return TaskPlansController(user_id, TaskPlanStorage(database_name, engine=engine))
 
 
 class TaskPlansController(BaseController):
@@ -22,7 +23,14 @@ class TaskPlansController(BaseController):
     def all(self):
         return self.storage.all_user_plans(self.user_id)
 
-    def process_plans(self, tasks_controller):
-        """Creates tasks according to task plans"""
-
-        self.storage.process_plans(tasks_controller.storage)
+    def process_plans(self, tasks_controller, only_own=False, catch_up=False):
+        """
+        Creates tasks according to due task plans and returns number of created tasks.
+        If only_own is True, processes only user's plans.
+        If catch_up is True, creates task for every missed interval instead of only one
+        """
+
+        return self.storage.process_plans(
+            tasks_controller.storage,
+            self.user_id if only_own else None,
+            catch_up)
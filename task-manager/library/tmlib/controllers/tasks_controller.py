@@ -1,17 +1,36 @@
 from tmlib.storage.task_storage import TaskStorage
+from tmlib.storage.engine import DEFAULT_DATABASE
 from tmlib.models.task import Status
 from tmlib.controllers.base_controller import BaseController
 
 
-def create_tasks_controller(user_id, database_name):
-    return TasksController(user_id, TaskStorage(database_name))
+def create_tasks_controller(user_id, database_name=DEFAULT_DATABASE, engine=None):
+    return TasksController(user_id, TaskStorage(database_name, engine=engine))
 
 
 class TasksController(BaseController):
+    def unit_of_work(self):
+        """
+        Returns context manager that caches loaded tasks and access levels and postpones updates
+        until it's finished. Use it for one request or one command:
+
+        with tasks_controller.unit_of_work():
+            ...
+        """
+
+        return self.storage.unit_of_work()
+
     def create(self, task):
         task.user_id = self.user_id
         return self.storage.create(task)
 
+    def bulk_create(self, tasks, batch_size=50):
+        """Creates tasks in one transaction and returns their IDs in the same order"""
+
+        for task in tasks:
+            task.user_id = self.user_id
+        return self.storage.bulk_create(tasks, batch_size)
+
     def update(self, task):
         self.storage.update(task)
 
@@ -19,17 +38,25 @@ class TasksController(BaseController):
         self.storage.delete_by_id(task_id)
 
     def set_status(self, task_id, status):
-        task = self.get_by_id(task_id)
-        task.status = status
-        self.update(task)
+        self.storage.set_status(task_id, status)
+
+    def user_tasks(self, page=None):
+        return self.storage.user_tasks(self.user_id, page)
+
+    def active(self, page=None):
+        """Returns user's tasks that aren't archived and aren't templates"""
+
+        return self.storage.active(self.user_id, page)
 
-    def user_tasks(self):
-        return self.storage.user_tasks(self.user_id)
+    def with_category(self, category_id, page=None):
+        """Returns user's tasks with category that aren't archived and aren't templates"""
 
-    def with_status(self, status):
+        return self.storage.with_category(self.user_id, category_id, page)
+
+    def with_status(self, status, page=None):
         """Returns user's tasks with provided status"""
 
-        return self.storage.with_status(self.user_id, status)
+        return self.storage.with_status(self.user_id, status, page)
 
     def get_by_id(self, task_id):
         return self.storage.get_by_id(task_id)
@@ -38,30 +65,38 @@ class TasksController(BaseController):
         task.parent_task_id = parent_task_id
         return self.create(task)
 
-    def inner(self, task_id, recursive=False):
+    def inner(self, task_id, recursive=False, max_depth=None):
         """Returns inner tasks for task with ID == task_id"""
 
-        return self.storage.inner(task_id, recursive)
+        return self.storage.inner(task_id, recursive, max_depth)
+
+    def subtree(self, task_id, max_depth=None):
+        """Returns all inner tasks for task with ID == task_id with their depth and path"""
+
+        return self.storage.subtree(task_id, max_depth)
+
+    def iter_subtree(self, task_id, max_depth=None):
+        """Yields all inner tasks for task with ID == task_id with their depth and path"""
+
+        return self.storage.iter_subtree(task_id, max_depth)
 
     def assign_task_on_user(self, task_id, user_id):
-        task = self.get_by_id(task_id)
-        task.assigned_user_id = user_id
-        self.update(task)
+        self.storage.assign(task_id, user_id)
 
-    def assigned(self):
+    def assigned(self, page=None):
         """Returns assigned tasks for user"""
 
-        return self.storage.assigned(self.user_id)
+        return self.storage.assigned(self.user_id, page)
 
-    def can_read(self):
+    def can_read(self, page=None):
         """Returns tasks that user can read"""
 
-        return self.storage.can_read(self.user_id)
+        return self.storage.can_read(self.user_id, page)
 
-    def can_write(self):
+    def can_write(self, page=None):
         """Returns tasks that user can read and change"""
 
-        return self.storage.can_write(self.user_id)
+        return self.storage.can_write(self.user_id, page)
 
     def add_user_for_read(self, user_id, task_id):
         """Allows user with ID == user_id to read task with ID == task_id"""
@@ -91,6 +126,11 @@ class TasksController(BaseController):
     def remove_all_users_for_write(self, task_id):
         self.storage.remove_all_users_for_write(task_id=task_id)
 
+    def set_acl(self, task_ids, readers, writers):
+        """Replaces users that can read and users that can read and change tasks with IDs from task_ids"""
+
+        self.storage.set_acl(task_ids, readers, writers)
+
     def get_users_can_read_task(self, task_id):
         return self.storage.get_users_can_read_task(task_id)
 
@@ -113,17 +153,64 @@ class TasksController(BaseController):
 
         return self.storage.user_can_write(self.user_id, task_id)
 
-    def filter(self, *args):
+    def access_level(self, task_id):
+        """Returns user's AccessLevel for task with ID == task_id"""
+
+        return self.storage.access_level(self.user_id, task_id)
+
+    def get_with_access_level(self, task_id):
+        """Returns tuple (task, user's AccessLevel for this task) for task with ID == task_id"""
+
+        return self.storage.get_with_access_level(self.user_id, task_id)
+
+    def permissions_for(self, task_ids):
+        """Returns dictionary {task_id: user's AccessLevel} for all passed task IDs"""
+
+        return self.storage.access_levels(self.user_id, task_ids)
+
+    def titles(self, task_ids):
+        """Returns dictionary {task_id: title} for passed tasks that user can read"""
+
+        return self.storage.titles(self.user_id, task_ids)
+
+    def tasks_in_window(self, start, end, include_shared=True, plan_id=None):
+        """
+        Returns tasks which time overlaps window [start, end) ordered by time, including occurrences
+        of virtual plans. If include_shared is False, returns only tasks created by user
+        """
+
+        return self.storage.tasks_in_window(self.user_id, start, end, include_shared, plan_id)
+
+    def get_occurrence(self, plan_id, occurrence_at):
+        """Returns tuple (task, user's AccessLevel for it) for occurrence of virtual plan at occurrence_at"""
+
+        return self.storage.get_occurrence(self.user_id, plan_id, occurrence_at)
+
+    def materialize(self, task):
+        """Stores virtual occurrence of plan and returns stored task"""
+
+        return self.storage.materialize(task)
+
+    def search(self, text, limit=20):
+        """
+        Returns list of SearchResult(task, rank, snippet) for tasks that user can read
+        and that contain words from text in title or note. Best matches go first
+        """
+
+        return self.storage.search(self.user_id, text, limit)
+
+    def filter(self, *args, page=None):
         """
         Before usage you should import Task from tmlib.storage.storage_models module.
         Then you can pass filter query.
         If you want to filter multiple fields use bitwise operators (& and |) rather than logical operators (and and or).
+        Returns lazy TaskQuery or Page of tasks if page is passed.
 
         Example:
         filter(Task.title.contains('title') & Task.created_at > datetime.datetime.now())
         """
 
-        return self.storage.filter(args)
+        return self.storage.filter(*args, page=page)
 
     def created_by_task_plan(self, plan_id):
         return self.storage.created_by_task_plan(self.user_id, plan_id)
@@ -19,6 +19,13 @@ class InvalidTaskPlanIntervalError(Error):
         super().__init__('Interval should be more than 5 minutes (300 seconds). Your interval is {} seconds'.format(interval))
 
 
+class InvalidRecurrenceRuleError(Error):
+    """Exception that informs that task plan's recurrence rule can't be parsed"""
+
+    def __init__(self, rule):
+        super().__init__('Invalid recurrence rule {!r}'.format(rule))
+
+
 class TaskDoesNotExistError(Error):
     def __init__(self):
         super().__init__('Task does not exist')
@@ -27,3 +34,38 @@ class TaskDoesNotExistError(Error):
 class UserHasNoRightError(Error):
     def __init__(self):
         super().__init__('User has no right for this action')
+
+
+class UnknownDatabaseProfileError(Error):
+    """Exception that informs that there is no database performance profile with such name"""
+
+    def __init__(self, profile):
+        super().__init__('Unknown database profile {}'.format(profile))
+
+
+class UnknownOrderingError(Error):
+    """Exception that informs that list can't be ordered by such field"""
+
+    def __init__(self, order_by):
+        super().__init__('Unknown ordering {}'.format(order_by))
+
+
+class InvalidCursorError(Error):
+    """Exception that informs that page cursor is damaged or was created for another ordering"""
+
+    def __init__(self, cursor):
+        super().__init__('Invalid page cursor {}'.format(cursor))
+
+
+class UnitOfWorkIsActiveError(Error):
+    """Exception that informs that unit of work for another database is already started in current thread"""
+
+    def __init__(self, database):
+        super().__init__('Unit of work for database {} is already started'.format(database.database))
+
+
+class SchedulerIsRunningError(Error):
+    """Exception that informs that another scheduler already works with database"""
+
+    def __init__(self, lock_path):
+        super().__init__('Scheduler is already running, lock file {} is locked'.format(lock_path))
@@ -2,6 +2,7 @@
     This package provides models that are used in library
 
     Modules:
+        base_model.py - base class for compact models
         category.py
         notification.py
         task.py
@@ -0,0 +1,86 @@
+_MISSING = object()
+
+
+class BaseModel:
+    """
+    Base class for all models. Models store attributes in __slots__ instead of per-instance dictionary,
+    so they are compact. __slots__ of every model are listed in order of its constructor arguments.
+
+    Storages mark loaded models as clean, so they can find attributes that were changed later and write
+    only them. Clean model keeps bitmask of changed attributes instead of their loaded values.
+    Copies of models aren't clean
+    """
+
+    __slots__ = ('_changed',)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._field_bits = {name: 1 << index for index, name in enumerate(cls.__slots__)}
+
+    @classmethod
+    def from_row(cls, row):
+        """Creates model from sequence of values in order of __slots__"""
+
+        return cls(*row)
+
+    def __setattr__(self, name, value):
+        try:
+            changed = self._changed
+        except AttributeError:  # model isn't clean, so there is nothing to track
+            object.__setattr__(self, name, value)
+            return
+        old_value = getattr(self, name, _MISSING)
+        object.__setattr__(self, name, value)
+        if old_value != value:
+            object.__setattr__(self, '_changed', changed | self._field_bits[name])
+
+    def __setstate__(self, state):
+        # unpickled attributes aren't changes
+        for name, value in state[1].items():
+            object.__setattr__(self, name, value)
+
+    def mark_clean(self):
+        """Considers current attributes as stored ones"""
+
+        object.__setattr__(self, '_changed', 0)
+
+    def changed_fields(self, names=None):
+        """
+        Returns dictionary {name: value} of attributes from names (all attributes by default) that were changed
+        since model was marked as clean. If model wasn't marked, all attributes are considered changed
+        """
+
+        if names is None:
+            names = self.__slots__
+        changed = getattr(self, '_changed', None)
+        if changed is None:
+            return {name: getattr(self, name) for name in names}
+        return {name: getattr(self, name) for name in names if changed & self._field_bits[name]}
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def copy(self):
+        return self.replace()
+
+    def replace(self, **changes):
+        """Returns copy of model with changed attributes"""
+
+        model = object.__new__(type(self))
+        for name in self.__slots__:
+            setattr(model, name, getattr(self, name))
+        for name, value in changes.items():
+            setattr(model, name, value)
+        return model
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name)
+                   for name in self.__slots__)
+
+    __hash__ = None  # models are mutable
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(name, getattr(self, name)) for name in self.__slots__))
@@ -1,6 +1,11 @@
-class Category:
+from tmlib.models.base_model import BaseModel
+
+
+class Category(BaseModel):
     """Task's category"""
 
+    __slots__ = ('name', 'user_id', 'id')
+
     def __init__(self, name, user_id=None, id=None):
         self.id = id
         self.name = name
@@ -1,4 +1,5 @@
 import enum
+from tmlib.models.base_model import BaseModel
 
 
 class Status(enum.Enum):
@@ -14,9 +15,11 @@ class Status(enum.Enum):
     SHOWN = 2
 
 
-class Notification:
+class Notification(BaseModel):
     """Notification class that is used remind user about task"""
 
+    __slots__ = ('task_id', 'title', 'relative_start_time', 'status', 'id', 'user_id')
+
     def __init__(
             self,
             task_id,
@@ -0,0 +1,201 @@
+"""
+This module provides cron-style recurrence rules of task plans.
+
+Rule consists of five fields separated by spaces: minute, hour, day of month, month and day of week.
+
+    >>> rule = parse_rule('0 10 * * 1-5')  # every weekday at 10:00
+    >>> rule.next_after(datetime.datetime(2018, 6, 8, 12, 0))  # friday
+    datetime.datetime(2018, 6, 11, 10, 0)
+
+Every field is '*', number, range 'a-b' or comma separated list of them. Step is added after '/':
+'*/15' or '9-17/2'. Days of week are numbered from 0 (sunday) to 6 (saturday), 7 is sunday too.
+Days are matched the same way as cron does: if both day of month and day of week are restricted,
+day matching any of them fits.
+
+Besides cron syntax fields support:
+    L in day of month - the last day of month
+    5L in day of week - the last friday of month
+    1#2 in day of week - the second monday of month
+and aliases @hourly, @daily, @weekly, @monthly, @yearly.
+
+Compiled rule computes the next occurrence directly: it skips whole months, days and hours that don't fit
+instead of checking every minute. Naive times are wall clock times, so plan 'every day at 10:00' occurs
+at 10:00 after daylight saving time changes too. Times with tzinfo are handled in their time zone:
+occurrence that falls into skipped hour is moved forward by the length of the gap and occurrence that
+falls into repeated hour happens once.
+"""
+
+
+import bisect
+import calendar
+import datetime
+import functools
+from tmlib.exceptions.exceptions import InvalidRecurrenceRuleError
+
+ALIASES = {
+    '@hourly': '0 * * * *',
+    '@daily': '0 0 * * *',
+    '@weekly': '0 0 * * 0',
+    '@monthly': '0 0 1 * *',
+    '@yearly': '0 0 1 1 *'}
+
+# rule that can occur is found in this number of years: calendar repeats every 28 years
+SEARCH_YEARS = 28
+
+_MINUTE = datetime.timedelta(minutes=1)
+_UTC = datetime.timezone.utc
+
+
+def _parse_field(field, minimum, maximum):
+    """Returns sorted tuple of values that field allows"""
+
+    values = set()
+    for part in field.split(','):
+        part, _, step = part.partition('/')
+        step = int(step) if step else 1
+        if part == '*':
+            first, last = minimum, maximum
+        elif '-' in part:
+            first, last = map(int, part.split('-'))
+        else:
+            first = last = int(part)
+            if step != 1:
+                last = maximum
+        if not minimum <= first <= last <= maximum or step < 1:
+            raise ValueError(field)
+        values.update(range(first, last + 1, step))
+    return tuple(sorted(values))
+
+
+class RecurrenceRule:
+    """Compiled recurrence rule. Create it with parse_rule function"""
+
+    __slots__ = ('text', 'minutes', 'hours', 'days', 'months', 'weekdays',
+                 'last_day', 'last_weekdays', 'nth_weekdays', 'restricts_days', 'restricts_weekdays')
+
+    def __init__(self, text):
+        self.text = text
+        fields = ALIASES.get(text.strip(), text).split()
+        if len(fields) != 5:
+            raise ValueError(text)
+        minute, hour, day, month, weekday = fields
+        self.minutes = _parse_field(minute, 0, 59)
+        self.hours = _parse_field(hour, 0, 23)
+        self.months = frozenset(_parse_field(month, 1, 12))
+
+        day_parts = day.split(',')
+        self.last_day = 'L' in day_parts
+        day_parts = [part for part in day_parts if part != 'L']
+        self.days = frozenset(_parse_field(','.join(day_parts), 1, 31)) if day_parts else frozenset()
+        self.restricts_days = day != '*'
+
+        self.last_weekdays = set()
+        self.nth_weekdays = set()
+        weekday_parts = []
+        for part in weekday.split(','):
+            if part.endswith('L'):
+                number = int(part[:-1])
+                if not 0 <= number <= 7:
+                    raise ValueError(part)
+                self.last_weekdays.add(number % 7)
+            elif '#' in part:
+                number, nth = map(int, part.split('#'))
+                if not 0 <= number <= 7 or not 1 <= nth <= 5:
+                    raise ValueError(part)
+                self.nth_weekdays.add((number % 7, nth))
+            else:
+                weekday_parts.append(part)
+        # cron counts days of week from sunday, datetime.weekday() from monday
+        self.weekdays = frozenset(
+            (value - 1) % 7 for value in _parse_field(','.join(weekday_parts), 0, 7)) if weekday_parts else frozenset()
+        self.last_weekdays = frozenset((value - 1) % 7 for value in self.last_weekdays)
+        self.nth_weekdays = frozenset(((value - 1) % 7, nth) for value, nth in self.nth_weekdays)
+        self.restricts_weekdays = weekday != '*'
+
+    def __repr__(self):
+        return 'RecurrenceRule({!r})'.format(self.text)
+
+    def min_interval(self):
+        """Returns timedelta that time between two occurrences is never less than"""
+
+        minutes = self.minutes
+        gaps = [later - earlier for earlier, later in zip(minutes, minutes[1:])]
+        # the last hour of day is followed by the first hour of the next day
+        next_hours = list(self.hours[1:]) + [self.hours[0] + 24]
+        if any(later - earlier == 1 for earlier, later in zip(self.hours, next_hours)):
+            gaps.append(60 - minutes[-1] + minutes[0])
+        return datetime.timedelta(minutes=min(gaps) if gaps else 60)
+
+    def matches_date(self, date):
+        """True if rule occurs on date"""
+
+        if date.month not in self.months:
+            return False
+        day_matches = date.day in self.days or (
+            self.last_day and date.day == calendar.monthrange(date.year, date.month)[1])
+        weekday = date.weekday()
+        weekday_matches = (
+            weekday in self.weekdays or
+            (weekday in self.last_weekdays and
+             date.day + 7 > calendar.monthrange(date.year, date.month)[1]) or
+            (weekday, (date.day - 1) // 7 + 1) in self.nth_weekdays)
+        if self.restricts_days and self.restricts_weekdays:
+            return day_matches or weekday_matches
+        if self.restricts_days:
+            return day_matches
+        if self.restricts_weekdays:
+            return weekday_matches
+        return True
+
+    def _next_wall_time(self, time):
+        """Returns the first naive time after naive time that fits rule or None if rule never occurs"""
+
+        time = time.replace(second=0, microsecond=0) + _MINUTE
+        last_year = time.year + SEARCH_YEARS
+        while time.year <= last_year:
+            if time.month not in self.months:
+                year, month = divmod(time.month, 12)
+                time = datetime.datetime(time.year + year, month + 1, 1)
+                continue
+            if not self.matches_date(time):
+                time = datetime.datetime.combine(time.date() + datetime.timedelta(days=1), datetime.time())
+                continue
+            position = bisect.bisect_left(self.hours, time.hour)
+            if position == len(self.hours):
+                time = datetime.datetime.combine(time.date() + datetime.timedelta(days=1), datetime.time())
+                continue
+            if self.hours[position] != time.hour:
+                time = time.replace(hour=self.hours[position], minute=self.minutes[0])
+                return time
+            position = bisect.bisect_left(self.minutes, time.minute)
+            if position == len(self.minutes):
+                time = time.replace(minute=0) + datetime.timedelta(hours=1)
+                continue
+            return time.replace(minute=self.minutes[position])
+        return None
+
+    def next_after(self, time):
+        """Returns the first occurrence after time or None if rule never occurs"""
+
+        if time.tzinfo is None:
+            return self._next_wall_time(time)
+        zone = time.tzinfo
+        wall_time = time.replace(tzinfo=None)
+        while True:
+            wall_time = self._next_wall_time(wall_time)
+            if wall_time is None:
+                return None
+            # time that doesn't exist in zone comes back moved by the gap
+            occurrence = wall_time.replace(tzinfo=zone).astimezone(_UTC).astimezone(zone)
+            if occurrence.astimezone(_UTC) > time.astimezone(_UTC):
+                return occurrence
+
+
+@functools.lru_cache(maxsize=256)
+def parse_rule(text):
+    """Returns compiled RecurrenceRule. Raises InvalidRecurrenceRuleError if text isn't valid rule"""
+
+    try:
+        return RecurrenceRule(text)
+    except ValueError:
+        raise InvalidRecurrenceRuleError(text)
@@ -1,4 +1,5 @@
 import enum
+from tmlib.models.base_model import BaseModel
 
 
 class Priority(enum.Enum):
@@ -21,7 +22,42 @@ class Status(enum.Enum):
     TEMPLATE = 4
 
 
-class Task:
+class AccessLevel(enum.Enum):
+    """
+    Enum that stores values of user's access levels for task. Every level includes rights of previous levels
+    NONE - User can't read task
+    READ - User can read task
+    WRITE - User can read and change task
+    ASSIGNEE - Task is assigned on user
+    OWNER - User created task
+    """
+
+    NONE = 0
+    READ = 1
+    WRITE = 2
+    ASSIGNEE = 3
+    OWNER = 4
+
+
+class Task(BaseModel):
+    __slots__ = (
+        'title',
+        'note',
+        'user_id',
+        'id',
+        'start_time',
+        'end_time',
+        'assigned_user_id',
+        'parent_task_id',
+        'is_event',
+        'category_id',
+        'priority',
+        'status',
+        'plan_id',
+        'created_at',
+        'updated_at',
+        'occurrence_at')
+
     def __init__(
             self,
             title,
@@ -38,7 +74,8 @@ class Task:
             status=Status.TODO.value,
             plan_id=None,
             created_at=None,
-            updated_at=None):
+            updated_at=None,
+            occurrence_at=None):
         self.id = id
         self.user_id = user_id
         self.title = title
@@ -54,3 +91,11 @@ class Task:
         self.plan_id = plan_id
         self.created_at = created_at
         self.updated_at = updated_at
+        # time of plan's occurrence that task represents. Task without ID is virtual occurrence of plan
+        self.occurrence_at = occurrence_at
+
+    @property
+    def is_virtual(self):
+        """True if task is occurrence of virtual plan that isn't stored in database"""
+
+        return self.id is None and self.occurrence_at is not None
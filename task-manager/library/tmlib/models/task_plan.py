@@ -1,5 +1,21 @@
-class TaskPlan:
-    """Class that is used to create task from template according to interval"""
+import datetime
+from tmlib.models.base_model import BaseModel
+from tmlib.models.recurrence import parse_rule
+
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+class TaskPlan(BaseModel):
+    """
+    Class that is used to create task from template according to interval or recurrence rule.
+    Plan without rule occurs every interval seconds after last_created_at. Plan with rule occurs when rule does
+    after last_created_at, interval isn't used then (see tmlib.models.recurrence module for rule syntax).
+    Ordinary plan creates tasks when it occurs.
+    Virtual plan doesn't create tasks: its occurrences are computed when tasks are listed and stored only
+    when they are changed
+    """
+
+    __slots__ = ('interval', 'user_id', 'task_id', 'last_created_at', 'id', 'is_virtual', 'rule')
 
     def __init__(
             self,
@@ -7,9 +23,44 @@ class TaskPlan:
             user_id,
             task_id,
             last_created_at,
-            id=None):
+            id=None,
+            is_virtual=False,
+            rule=None):
         self.id = id
         self.user_id = user_id
         self.task_id = task_id
         self.interval = interval
         self.last_created_at = last_created_at
+        self.is_virtual = is_virtual
+        self.rule = rule
+
+    def next_occurrence(self, time):
+        """Returns the first occurrence after time that is not earlier than last_created_at"""
+
+        if time < self.last_created_at:
+            time = self.last_created_at
+        if self.rule is not None:
+            return parse_rule(self.rule).next_after(time)
+        interval = datetime.timedelta(seconds=self.interval)
+        return self.last_created_at + ((time - self.last_created_at) // interval + 1) * interval
+
+    def occurs_at(self, time):
+        """True if plan has occurrence at time"""
+
+        return self.next_occurrence(time - _MICROSECOND) == time
+
+    def iter_occurrences(self, start):
+        """Yields times of plan's occurrences from start without end"""
+
+        occurrence = self.next_occurrence(start - _MICROSECOND)
+        while occurrence is not None:
+            yield occurrence
+            occurrence = self.next_occurrence(occurrence)
+
+    def occurrences(self, start, end):
+        """Yields times of plan's occurrences in window [start, end)"""
+
+        for occurrence in self.iter_occurrences(start):
+            if occurrence >= end:
+                return
+            yield occurrence
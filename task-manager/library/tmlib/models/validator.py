@@ -1,4 +1,5 @@
 import dateparser
+from tmlib.models.recurrence import parse_rule
 from tmlib.exceptions.exceptions import InvalidTaskTimeError, InvalidTaskPlanIntervalError
 
 
@@ -17,9 +18,21 @@ def validate_task_plan_interval(interval):
         raise InvalidTaskPlanIntervalError(interval)
 
 
+def validate_task_plan_rule(rule):
+    """
+    Validates that task plan's recurrence rule can be parsed and doesn't occur more often than every 5 minutes.
+    Otherwise raises exception
+    """
+
+    validate_task_plan_interval(parse_rule(rule).min_interval().total_seconds())
+
+
 def validate_task(task):
     validate_start_time_less_than_end_time(task.start_time, task.end_time)
 
 
 def validate_task_plan(plan):
-    validate_task_plan_interval(plan.interval)
+    if plan.rule is not None:
+        validate_task_plan_rule(plan.rule)
+    else:
+        validate_task_plan_interval(plan.interval)
@@ -0,0 +1,151 @@
+"""
+This module provides scheduler that promotes due notifications and creates tasks from due task plans
+in background, so web requests and CLI commands don't do it.
+
+    >>> from tmlib.scheduler import Scheduler
+    >>> Scheduler('/your/database/path/database_name').run()
+
+Scheduler keeps min-heap of times when every job is due next. It sleeps until the earliest one,
+processes due items in batches and asks storage when the job is due again. Notifications and plans can be
+created by other processes while scheduler sleeps, so it never sleeps longer than max_sleep seconds.
+
+Only one scheduler can work with database: it locks file database_name + '.scheduler.lock' while it runs
+and raises SchedulerIsRunningError if file is already locked.
+
+If other processes cache lists in shared cache (see tmlib.storage.read_cache module), pass ReadCache over
+the same backend to scheduler, so its writes bump versions of affected users there:
+
+    >>> Scheduler('/your/database/path/database_name', read_cache=ReadCache(shared_backend)).run()
+"""
+
+
+import datetime
+import fcntl
+import heapq
+import os
+import threading
+from tmlib.storage.engine import get_engine
+from tmlib.storage.notification_storage import NotificationStorage
+from tmlib.storage.task_plan_storage import TaskPlanStorage
+from tmlib.storage.task_storage import TaskStorage
+from tmlib.exceptions.exceptions import SchedulerIsRunningError
+import tmlib.logger as log
+
+BATCH_SIZE = 500  # number of notifications or plans processed in one transaction
+MAX_SLEEP = 60  # seconds
+
+
+class SchedulerLock:
+    """Exclusive lock of file that is released when process holding it dies"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        lock_file = open(self.path, 'a+')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise SchedulerIsRunningError(self.path)
+        lock_file.truncate(0)
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        self._file = lock_file
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class Scheduler:
+    def __init__(
+            self,
+            database_name,
+            batch_size=BATCH_SIZE,
+            max_sleep=MAX_SLEEP,
+            catch_up=False,
+            lock_path=None,
+            read_cache=None):
+        engine = get_engine(database_name)
+        if read_cache is not None:
+            engine.set_read_cache(read_cache)
+        self.notification_storage = NotificationStorage(engine=engine)
+        self.task_plan_storage = TaskPlanStorage(engine=engine)
+        self.task_storage = TaskStorage(engine=engine)
+        self.batch_size = batch_size
+        self.max_sleep = max_sleep
+        self.catch_up = catch_up
+        self.lock_path = lock_path or engine.database_name + '.scheduler.lock'
+        self.stopped = threading.Event()
+        self._jobs = {
+            'notifications': (self.notification_storage.next_fire_at, self.process_notifications),
+            'plans': (self.task_plan_storage.next_due_at, self.process_plans)}
+        self._heap = []
+
+    def process_notifications(self):
+        """Promotes due notifications by batches. Returns number of promoted notifications"""
+
+        processed = 0
+        while True:
+            count = self.notification_storage.process_notifications(self.batch_size)
+            processed += count
+            if count < self.batch_size:
+                return processed
+
+    def process_plans(self):
+        """Processes due task plans by batches. Returns number of created tasks"""
+
+        created = 0
+        while True:
+            next_due_at = self.task_plan_storage.next_due_at()
+            if next_due_at is None or next_due_at >= datetime.datetime.now():
+                return created
+            created += self.task_plan_storage.process_plans(
+                self.task_storage, catch_up=self.catch_up, limit=self.batch_size)
+
+    def schedule(self, job, now):
+        """Pushes time when job is due next to heap. Job without due items is checked again after max_sleep"""
+
+        due_at = self._jobs[job][0]()
+        latest = now + datetime.timedelta(seconds=self.max_sleep)
+        heapq.heappush(self._heap, (min(due_at, latest) if due_at is not None else latest, job))
+
+    def run_pending(self):
+        """Runs jobs that are due now. Returns seconds until the next due job"""
+
+        now = datetime.datetime.now()
+        if not self._heap:
+            for job in self._jobs:
+                self.schedule(job, now)
+        while self._heap and self._heap[0][0] <= now:
+            job = heapq.heappop(self._heap)[1]
+            count = self._jobs[job][1]()
+            if count:
+                log.get_logger().info('Scheduler processed {} {}'.format(count, job))
+            now = datetime.datetime.now()
+            self.schedule(job, now)
+        return max((self._heap[0][0] - now).total_seconds(), 0)
+
+    def run(self):
+        """Runs jobs until stop is called. Holds lock file all this time"""
+
+        with SchedulerLock(self.lock_path):
+            log.get_logger().info('Scheduler started')
+            self.stopped.clear()
+            while not self.stopped.is_set():
+                self.stopped.wait(self.run_pending())
+            log.get_logger().info('Scheduler stopped')
+
+    def stop(self):
+        self.stopped.set()
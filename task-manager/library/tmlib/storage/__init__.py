@@ -3,9 +3,15 @@
 
     Modules:
         category_storage.py
+        engine.py - storage engine shared by all storages of one database
+        migrations.py - versioned schema migrations
         notification_storage.py
+        pagination.py - keyset pagination of list queries
+        read_cache.py - cache of lists keyed by per-user data versions
+        signals.py - change events sent by storages after writes
         storage_models.py - implements classes to work with peewee ORM
         task_plan_storage.py
         task_storage.py
+        unit_of_work.py - identity map and postponed updates for one request or command
 
 """
\ No newline at end of file
@@ -1,23 +1,42 @@
-from peewee import DoesNotExist
 from tmlib.storage.storage_models import Category, DatabaseConnector
+from tmlib.storage.task_storage import _chunks
+from tmlib.storage.signals import Action
 from tmlib.models.category import Category as CategoryInstance
 
+# columns in order of Category.__slots__, so selected rows are passed to from_row as they are
+CATEGORY_COLUMNS = (Category.name, Category.user_id, Category.id)
+
 
 class CategoryStorage(DatabaseConnector):
+    """Storage of categories. Every write sends change event to signals of engine (see tmlib.storage.signals module)"""
+
+    def _owners(self, category_id):
+        """Returns owners of category. If nobody is subscribed to signals, returns empty list without query"""
+
+        if not self.signals:
+            return []
+        return [user_id for (user_id,) in Category.select(Category.user_id).where(
+            Category.id == category_id).tuples()]
+
     def create(self, category):
-        return self.to_category_instance(
+        created_category = self.to_category_instance(
             Category.create(
                 id=category.id,
                 name=category.name,
                 user_id=category.user_id))
+        self._send(Category, Action.CREATED, [created_category.id], user_ids=[category.user_id])
+        return created_category
 
     def delete_by_id(self, category_id):
+        user_ids = self._owners(category_id)
         Category.delete().where(Category.id == category_id).execute()
+        self._send(Category, Action.DELETED, [category_id], user_ids=user_ids)
 
     def update(self, category):
         Category.update(
             name=category.name).where(
             Category.id == category.id).execute()
+        self._send(Category, Action.UPDATED, [category.id], ('name',), self._owners(category.id))
 
     def to_category_instance(self, category):
         return CategoryInstance(
@@ -26,12 +45,19 @@ class CategoryStorage(DatabaseConnector):
             user_id=category.user_id)
 
     def get_by_id(self, category_id):
-        try:
-            return self.to_category_instance(
-                Category.get(Category.id == category_id))
-        except DoesNotExist:
-            return None
+        row = Category.select(*CATEGORY_COLUMNS).where(
+            Category.id == category_id).tuples().first()
+        return CategoryInstance.from_row(row) if row is not None else None
 
     def all_user_categories(self, user_id):
-        return list(map(self.to_category_instance, list(
-            Category.select().where(Category.user_id == user_id))))
+        return list(map(CategoryInstance.from_row, Category.select(
+            *CATEGORY_COLUMNS).where(Category.user_id == user_id).tuples()))
+
+    def names(self, category_ids):
+        """Returns dictionary {category_id: name} for passed categories. Uses one query per SQLite statement"""
+
+        category_ids = list({int(category_id) for category_id in category_ids if category_id is not None})
+        names = {}
+        for chunk in _chunks(category_ids):
+            names.update(Category.select(Category.id, Category.name).where(Category.id.in_(chunk)).tuples())
+        return names
@@ -0,0 +1,188 @@
+"""
+This module provides storage engine that is shared by all storages working with the same database.
+
+There is only one engine per process and database path. Engine owns connections to database and bootstraps
+its schema once, so creating storages and controllers doesn't touch SQLite.
+
+    >>> from tmlib.storage.engine import get_engine
+    >>> engine = get_engine('/your/database/path/database_name')
+    >>> tasks_controller = TasksController(USER_ID, TaskStorage(engine=engine))
+
+Engine configures SQLite according to performance profile:
+    durable - WAL journal, full fsync on every commit. The safest one
+    balanced - WAL journal, fsync only on checkpoints, memory mapped I/O. Used by default
+    bulk-load - WAL journal without fsync and big caches. Use it for imports only, because last transactions
+        can be lost if machine crashes
+
+    >>> engine = get_engine('/your/database/path/database_name', profile='bulk-load')
+
+Engine can cache lists that storages read (see tmlib.storage.read_cache module):
+
+    >>> engine.set_read_cache(ReadCache(LocalCache(max_size=1024, timeout=60)))
+
+and sends events about every write of its storages (see tmlib.storage.signals module):
+
+    >>> engine.signals.connect(receiver, deferred=True)
+"""
+
+
+import os
+import threading
+from peewee import SqliteDatabase
+from tmlib.storage.storage_models import database_proxy, SchemaMigration, TaskSearch, TaskWindow, DEFAULT_DATABASE
+from tmlib.storage.migrations import migrate, MODELS
+from tmlib.storage.signals import StorageSignals
+from tmlib.exceptions.exceptions import UnknownDatabaseProfileError
+
+PROFILES = {
+    'durable': {
+        'journal_mode': 'wal',
+        'synchronous': 'full',
+        'mmap_size': 0,
+        'cache_size': -8000,  # 8 MB
+        'temp_store': 'default',
+        'busy_timeout': 5000},
+    'balanced': {
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'mmap_size': 64 * 1024 * 1024,
+        'cache_size': -32000,  # 32 MB
+        'temp_store': 'memory',
+        'busy_timeout': 5000},
+    'bulk-load': {
+        'journal_mode': 'wal',
+        'synchronous': 'off',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -128000,  # 128 MB
+        'temp_store': 'memory',
+        'busy_timeout': 30000},
+}
+DEFAULT_PROFILE = 'balanced'
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+class StorageDatabase(SqliteDatabase):
+    """SQLite database that tells its signals when transaction is committed or rolled back"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.signals = StorageSignals(self)
+
+    def commit(self):
+        super().commit()
+        self.signals.committed()
+
+    def rollback(self):
+        super().rollback()
+        self.signals.rolled_back()
+
+
+class StorageEngine:
+    """Owns database connections and schema of one database"""
+
+    def __init__(self, database_name, profile=DEFAULT_PROFILE):
+        self.database_name = database_name
+        self.profile = profile
+        self.database = StorageDatabase(
+            database_name, pragmas=_profile_pragmas(profile))
+        self.read_cache = None
+        self.bootstrapped = False
+        # False if SQLite has no FTS5 or R*Tree, see add_task_search_index and add_task_window_index migrations
+        self.has_search_index = False
+        self.has_window_index = False
+        self._lock = threading.Lock()
+
+    def set_profile(self, profile):
+        """Applies performance profile to opened connection and to all connections opened later"""
+
+        for key, value in _profile_pragmas(profile).items():
+            self.database.pragma(key, value, permanent=True)
+        self.profile = profile
+
+    @property
+    def signals(self):
+        return self.database.signals
+
+    def set_read_cache(self, read_cache):
+        """Makes storages of this engine cache lists in read_cache (ReadCache). Pass None to disable cache"""
+
+        if self.read_cache is not None:
+            self.signals.disconnect(self.read_cache.receive)
+        self.read_cache = read_cache
+        if read_cache is not None:
+            # versions are bumped right after write, so this thread reads new data, and again after commit,
+            # so lists that other threads cached before commit aren't used
+            self.signals.connect(read_cache.receive)
+            self.signals.connect(read_cache.receive, deferred=True)
+
+    def bind(self):
+        """Makes models work with database of this engine"""
+
+        if database_proxy.obj is not self.database:
+            database_proxy.initialize(self.database)
+
+    def activate(self):
+        """Binds models to this engine and bootstraps schema if needed"""
+
+        self.bind()
+        self.bootstrap()
+
+    def bootstrap(self):
+        """Creates and migrates schema if it wasn't done yet in this process"""
+
+        if not self.bootstrapped:
+            with self._lock:
+                if not self.bootstrapped:
+                    self.create_tables()
+
+    def create_tables(self):
+        self.bind()
+        self.database.connect(reuse_if_open=True)
+        migrate(self.database)
+        self.has_search_index = self.database.table_exists(TaskSearch._meta.table_name)
+        self.has_window_index = self.database.table_exists(TaskWindow._meta.table_name)
+        self.bootstrapped = True
+
+    def drop_tables(self):
+        self.bind()
+        self.database.drop_tables([TaskSearch, TaskWindow] + MODELS + [SchemaMigration])
+        self.database.close()
+        self.bootstrapped = False
+        self.has_search_index = False
+        self.has_window_index = False
+
+
+def _profile_pragmas(profile):
+    try:
+        return PROFILES[profile]
+    except KeyError:
+        raise UnknownDatabaseProfileError(profile)
+
+
+def _engine_key(database_name):
+    if database_name == ':memory:':
+        return database_name
+    return os.path.abspath(database_name)
+
+
+def get_engine(database_name=DEFAULT_DATABASE, profile=None):
+    """
+    Returns bootstrapped engine for database with provided name. Engine is created only once per process.
+    If profile is passed, it is applied to engine. Otherwise engine keeps its current profile
+    """
+
+    key = _engine_key(database_name)
+    engine = _engines.get(key)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(key)
+            if engine is None:
+                engine = StorageEngine(
+                    database_name, profile or DEFAULT_PROFILE)
+                _engines[key] = engine
+    if profile is not None and profile != engine.profile:
+        engine.set_profile(profile)
+    engine.activate()
+    return engine
@@ -0,0 +1,300 @@
+"""
+This module provides versioned schema migrations for task manager database.
+
+Every migration is a function decorated with @migration(version, name). Migrations are applied in order of
+their versions, each one in its own transaction, and applied versions are stored in SchemaMigration table.
+So existing databases are upgraded in place and fresh databases get the whole schema.
+
+Migrations should be idempotent against current model definitions, because initial migration creates
+missing tables with all columns and indexes that models declare. Other migrations create only indexes that
+they list themselves, so index over column is created by migration that adds the column.
+"""
+
+
+from peewee import fn, OperationalError
+from tmlib.storage.storage_models import (
+    Category,
+    Notification,
+    Task,
+    TaskPlan,
+    CancelledOccurrence,
+    UsersReadTasks,
+    UsersWriteTasks,
+    TaskSearch,
+    TaskWindow,
+    SchemaMigration)
+import tmlib.logger as log
+
+MODELS = [Category, Task, TaskPlan, CancelledOccurrence, Notification, UsersReadTasks, UsersWriteTasks]
+
+_migrations = []
+
+
+def migration(version, name):
+    """Registers decorated function as migration with provided version"""
+
+    def register(function):
+        _migrations.append((version, name, function))
+        _migrations.sort(key=lambda entry: entry[0])
+        return function
+    return register
+
+
+def latest_version():
+    return _migrations[-1][0]
+
+
+def applied_versions(database):
+    if not database.table_exists(SchemaMigration._meta.table_name):
+        return set()
+    return {version for (version,) in SchemaMigration.select(
+        SchemaMigration.version).tuples()}
+
+
+def current_version(database):
+    """Returns version of the last applied migration or 0 if database wasn't migrated yet"""
+
+    return max(applied_versions(database), default=0)
+
+
+def migrate(database):
+    """Applies all pending migrations to database"""
+
+    SchemaMigration.create_table(True)
+    applied = applied_versions(database)
+    for version, name, function in _migrations:
+        if version in applied:
+            continue
+        with database.atomic():
+            function(database)
+            SchemaMigration.create(version=version, name=name)
+        log.get_logger().info(
+            'Applied migration {} ({})'.format(version, name))
+
+
+def _remove_duplicate_rights(model):
+    """Leaves only the first entry for every (user_id, task_id) pair"""
+
+    first_entries = model.select(fn.MIN(model.id)).group_by(
+        model.user_id, model.task)
+    model.delete().where(model.id.not_in(first_entries)).execute()
+
+
+def _create_index(database, table, columns, unique=False):
+    """
+    Creates index over columns of table. Migrations list their indexes instead of reading models' indexes,
+    because models can declare indexes over columns that are added by later migrations
+    """
+
+    database.execute_sql('CREATE {unique}INDEX IF NOT EXISTS "{table}_{name}" ON "{table}" ({columns})'.format(
+        unique='UNIQUE ' if unique else '', table=table, name='_'.join(columns),
+        columns=', '.join('"{}"'.format(column) for column in columns)))
+
+
+@migration(1, 'initial')
+def create_initial_tables(database):
+    for model in MODELS:
+        if not model.table_exists():
+            model.create_table()
+
+
+@migration(2, 'add_indexes_and_unique_rights')
+def add_indexes_and_unique_rights(database):
+    _remove_duplicate_rights(UsersReadTasks)
+    _remove_duplicate_rights(UsersWriteTasks)
+    _create_index(database, 'category', ['user_id'])
+    _create_index(database, 'task', ['user_id', 'status'])
+    _create_index(database, 'task', ['user_id', 'plan_id'])
+    _create_index(database, 'task', ['assigned_user_id'])
+    _create_index(database, 'task', ['parent_task_id'])
+    _create_index(database, 'taskplan', ['user_id'])
+    _create_index(database, 'notification', ['user_id', 'status'])
+    _create_index(database, 'usersreadtasks', ['user_id', 'task_id'], unique=True)
+    _create_index(database, 'userswritetasks', ['user_id', 'task_id'], unique=True)
+
+
+@migration(3, 'add_ordering_indexes')
+def add_ordering_indexes(database):
+    """Indexes for keyset pagination of user's tasks. SQLite appends ID to every index"""
+
+    for column in ('priority', 'start_time', 'end_time', 'created_at', 'updated_at'):
+        _create_index(database, 'task', ['user_id', column])
+
+
+@migration(4, 'add_task_search_index')
+def add_task_search_index(database):
+    """
+    FTS5 index over titles and notes of tasks. If SQLite is built without FTS5, index isn't created
+    and tasks are searched without it
+    """
+
+    search_table = TaskSearch._meta.table_name
+    task_table = Task._meta.table_name
+    try:
+        database.execute_sql(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS {search} USING fts5("
+            "title, note, content='{task}', content_rowid='id')".format(
+                search=search_table, task=task_table))
+    except OperationalError:
+        log.get_logger().warning('SQLite has no FTS5 extension, task search index is not created')
+        return
+    triggers = {
+        'insert': "AFTER INSERT ON {task} BEGIN "
+                  "INSERT INTO {search}(rowid, title, note) VALUES (new.id, new.title, new.note); END",
+        'delete': "AFTER DELETE ON {task} BEGIN "
+                  "INSERT INTO {search}({search}, rowid, title, note) "
+                  "VALUES ('delete', old.id, old.title, old.note); END",
+        'update': "AFTER UPDATE OF title, note ON {task} BEGIN "
+                  "INSERT INTO {search}({search}, rowid, title, note) "
+                  "VALUES ('delete', old.id, old.title, old.note); "
+                  "INSERT INTO {search}(rowid, title, note) VALUES (new.id, new.title, new.note); END"}
+    for event, body in triggers.items():
+        database.execute_sql('CREATE TRIGGER IF NOT EXISTS {search}_{event} {body}'.format(
+            search=search_table, event=event, body=body.format(search=search_table, task=task_table)))
+    database.execute_sql(
+        "INSERT INTO {search}({search}) VALUES ('rebuild')".format(search=search_table))
+
+
+def _epoch(column):
+    return "CAST(strftime('%s', {}) AS INTEGER)".format(column)
+
+
+@migration(5, 'add_task_window_index')
+def add_task_window_index(database):
+    """
+    R*Tree index over time intervals of tasks for overlap queries. If SQLite is built without R*Tree,
+    index isn't created and tasks are selected by start_time and end_time columns
+    """
+
+    window_table = TaskWindow._meta.table_name
+    task_table = Task._meta.table_name
+    try:
+        database.execute_sql(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS {} USING rtree(id, starts_at, ends_at)'.format(window_table))
+    except OperationalError:
+        log.get_logger().warning('SQLite has no R*Tree extension, task window index is not created')
+        return
+
+    def interval(row, source=''):
+        starts_at = _epoch('COALESCE({row}.start_time, {row}.end_time)'.format(row=row))
+        ends_at = _epoch('COALESCE({row}.end_time, {row}.start_time)'.format(row=row))
+        return ('SELECT {row}.id, MIN({starts_at}, {ends_at}), MAX({starts_at}, {ends_at}) {source}'
+                'WHERE COALESCE({row}.start_time, {row}.end_time) IS NOT NULL').format(
+                    row=row, starts_at=starts_at, ends_at=ends_at, source=source)
+
+    triggers = {
+        'insert': 'AFTER INSERT ON {task} BEGIN INSERT INTO {window} ' + interval('new') + '; END',
+        'delete': 'AFTER DELETE ON {task} BEGIN DELETE FROM {window} WHERE id = old.id; END',
+        'update': 'AFTER UPDATE OF start_time, end_time ON {task} BEGIN '
+                  'DELETE FROM {window} WHERE id = old.id; '
+                  'INSERT INTO {window} ' + interval('new') + '; END'}
+    for event, body in triggers.items():
+        database.execute_sql('CREATE TRIGGER IF NOT EXISTS {window}_{event} {body}'.format(
+            window=window_table, event=event, body=body.format(window=window_table, task=task_table)))
+    database.execute_sql('DELETE FROM {}'.format(window_table))
+    database.execute_sql('INSERT INTO {} {}'.format(
+        window_table, interval(task_table, 'FROM {} '.format(task_table))))
+
+
+def _fire_at(start_time, relative_start_time):
+    """Notification with negative offset is shown after start of task, so modifier is built with its sign"""
+
+    return "strftime('%Y-%m-%d %H:%M:%f', {}, printf('%+d seconds', -{}))".format(
+        start_time, relative_start_time)
+
+
+@migration(6, 'add_notification_fire_at')
+def add_notification_fire_at(database):
+    """
+    Column with time when notification should be shown, so due notifications are found by index.
+    It's updated by triggers when notification is created, when its offset or task is changed
+    and when task's start_time is changed
+    """
+
+    notification_table = Notification._meta.table_name
+    task_table = Task._meta.table_name
+    columns = [column.name for column in database.get_columns(notification_table)]
+    if 'fire_at' not in columns:
+        database.execute_sql('ALTER TABLE {} ADD COLUMN fire_at DATETIME'.format(notification_table))
+    _create_index(database, notification_table, ['status', 'fire_at'])
+
+    set_notification_fire_at = (
+        'UPDATE {notification} SET fire_at = (SELECT ' + _fire_at('start_time', 'new.relative_start_time') +
+        ' FROM {task} WHERE id = new.task_id) WHERE id = new.id; END')
+    triggers = {
+        'insert': 'AFTER INSERT ON {notification} BEGIN ' + set_notification_fire_at,
+        'update': 'AFTER UPDATE OF relative_start_time, task_id ON {notification} BEGIN ' +
+                  set_notification_fire_at,
+        'task_update': 'AFTER UPDATE OF start_time ON {task} BEGIN '
+                       'UPDATE {notification} SET fire_at = ' +
+                       _fire_at('new.start_time', 'relative_start_time') +
+                       ' WHERE task_id = new.id; END'}
+    for event, body in triggers.items():
+        database.execute_sql('CREATE TRIGGER IF NOT EXISTS {notification}_fire_at_{event} {body}'.format(
+            notification=notification_table, event=event,
+            body=body.format(notification=notification_table, task=task_table)))
+    database.execute_sql(
+        'UPDATE {notification} SET fire_at = (SELECT {fire_at} FROM {task} WHERE {task}.id = task_id)'.format(
+            notification=notification_table, task=task_table,
+            fire_at=_fire_at('{}.start_time'.format(task_table), '{}.relative_start_time'.format(notification_table))))
+
+
+@migration(7, 'add_task_plan_next_due_at')
+def add_task_plan_next_due_at(database):
+    """Column with time when plan should create next task, so due plans are found by index"""
+
+    plan_table = TaskPlan._meta.table_name
+    columns = [column.name for column in database.get_columns(plan_table)]
+    if 'next_due_at' not in columns:
+        database.execute_sql('ALTER TABLE {} ADD COLUMN next_due_at DATETIME'.format(plan_table))
+    _create_index(database, plan_table, ['next_due_at'])
+    _create_index(database, plan_table, ['user_id', 'next_due_at'])
+    database.execute_sql("UPDATE {} SET next_due_at = strftime("
+                         "'%Y-%m-%d %H:%M:%f', last_created_at, '+' || interval || ' seconds')".format(plan_table))
+
+
+@migration(8, 'add_virtual_task_plans')
+def add_virtual_task_plans(database):
+    """
+    Flag of virtual task plans and column with occurrence of virtual plan that stored task represents.
+    Every occurrence is stored only once. Tasks that were created before have NULL occurrence, and SQLite
+    considers NULLs distinct in unique index, so they don't conflict
+    """
+
+    new_columns = (
+        (Task, 'occurrence_at', 'DATETIME'),
+        (TaskPlan, 'is_virtual', 'INTEGER NOT NULL DEFAULT 0'))
+    for model, column, definition in new_columns:
+        table = model._meta.table_name
+        if column not in [existing.name for existing in database.get_columns(table)]:
+            database.execute_sql('ALTER TABLE {} ADD COLUMN {} {}'.format(table, column, definition))
+    _create_index(database, Task._meta.table_name, ['plan_id', 'occurrence_at'], unique=True)
+
+
+@migration(9, 'add_task_plan_rule')
+def add_task_plan_rule(database):
+    """Cron-style recurrence rule of task plan"""
+
+    plan_table = TaskPlan._meta.table_name
+    if 'rule' not in [column.name for column in database.get_columns(plan_table)]:
+        database.execute_sql('ALTER TABLE {} ADD COLUMN rule VARCHAR(255)'.format(plan_table))
+
+
+@migration(10, 'fix_negative_notification_offsets')
+def fix_negative_notification_offsets(database):
+    """
+    Triggers of add_notification_fire_at migration left fire_at NULL for notifications with negative offset,
+    so they are created again with signed offset and fire_at of all notifications is computed again
+    """
+
+    for event in ('insert', 'update', 'task_update'):
+        database.execute_sql('DROP TRIGGER IF EXISTS {}_fire_at_{}'.format(Notification._meta.table_name, event))
+    add_notification_fire_at(database)
+
+
+@migration(11, 'add_cancelled_occurrences')
+def add_cancelled_occurrences(database):
+    """Table of deleted occurrences of virtual task plans"""
+
+    if not CancelledOccurrence.table_exists():
+        CancelledOccurrence.create_table()
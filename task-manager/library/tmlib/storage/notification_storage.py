@@ -1,12 +1,46 @@
 import datetime
-from peewee import DoesNotExist
-from tmlib.storage.storage_models import Notification, Task, DatabaseConnector
+from peewee import fn
+from tmlib.storage.storage_models import Notification, DatabaseConnector
+from tmlib.storage.pagination import paginate
+from tmlib.storage.task_storage import _chunks
+from tmlib.storage.read_cache import cached_read
+from tmlib.storage.signals import Action
 from tmlib.models.notification import Notification as NotificationInstance, Status as NotificationStatus
 
+# columns in order of Notification.__slots__, so selected rows are passed to from_row as they are
+NOTIFICATION_COLUMNS = (
+    Notification.task,
+    Notification.title,
+    Notification.relative_start_time,
+    Notification.status,
+    Notification.id,
+    Notification.user_id)
+
+# fields that notification lists can be ordered by
+NOTIFICATION_ORDERINGS = {
+    'id': Notification.id,
+    'relative_start_time': Notification.relative_start_time}
+
 
 class NotificationStorage(DatabaseConnector):
+    """
+    Storage of notifications. Every write sends change event to signals of engine (see tmlib.storage.signals
+    module). If engine has read cache, lists of user's notifications are cached
+    """
+
+    def _changed(self, *expressions):
+        """
+        Returns tuple (IDs, set of owners) of notifications that match expressions.
+        If nobody is subscribed to signals, returns empty ones without query
+        """
+
+        if not self.signals:
+            return [], set()
+        rows = Notification.select(Notification.id, Notification.user_id).where(*expressions).tuples()
+        return [id for id, user_id in rows], {user_id for id, user_id in rows}
+
     def create(self, notification):
-        return self.to_notification_instance(
+        created_notification = self.to_notification_instance(
             Notification.create(
                 id=notification.id,
                 title=notification.title,
@@ -14,16 +48,24 @@ class NotificationStorage(DatabaseConnector):
                 task_id=notification.task_id,
                 status=notification.status,
                 relative_start_time=notification.relative_start_time))
+        self._send(Notification, Action.CREATED, [created_notification.id], user_ids=[notification.user_id])
+        return created_notification
 
     def delete_by_id(self, notification_id):
+        ids, user_ids = self._changed(Notification.id == notification_id)
         Notification.delete().where(Notification.id == notification_id).execute()
+        self._send(Notification, Action.DELETED, ids, user_ids=user_ids)
 
     def update(self, notification):
-        Notification.update(
-            title=notification.title,
-            status=notification.status,
-            relative_start_time=notification.relative_start_time).where(
-            Notification.id == notification.id).execute()
+        """Writes fields of notification that were changed since it was loaded, nothing is written without changes"""
+
+        fields = notification.changed_fields(('title', 'status', 'relative_start_time'))
+        if not fields:
+            return
+        ids, user_ids = self._changed(Notification.id == notification.id)
+        Notification.update(**fields).where(Notification.id == notification.id).execute()
+        notification.mark_clean()
+        self._send(Notification, Action.UPDATED, ids, fields, user_ids)
 
     def to_notification_instance(self, notification):
         return NotificationInstance(
@@ -34,46 +76,113 @@ class NotificationStorage(DatabaseConnector):
             status=notification.status,
             relative_start_time=notification.relative_start_time)
 
+    def select_notifications(self, *expressions, page=None):
+        """
+        Returns list of notifications that match expressions. Rows are passed to from_row as they are.
+        If page (PageRequest from tmlib.storage.pagination module) is passed, returns Page of notifications
+        """
+
+        query = Notification.select(*NOTIFICATION_COLUMNS).where(*expressions)
+        if page is not None:
+            return paginate(
+                query, NOTIFICATION_COLUMNS, NOTIFICATION_ORDERINGS, page, NotificationInstance.from_row)
+        return list(map(NotificationInstance.from_row, query.tuples()))
+
     def get_by_id(self, notification_id):
-        try:
-            return self.to_notification_instance(
-                Notification.get(Notification.id == notification_id))
-        except DoesNotExist:
+        row = Notification.select(*NOTIFICATION_COLUMNS).where(
+            Notification.id == notification_id).tuples().first()
+        if row is None:
             return None
+        notification = NotificationInstance.from_row(row)
+        notification.mark_clean()
+        return notification
 
-    def pending(self, user_id):
+    # lists of PENDING and CREATED notifications aren't cached, because scheduler changes them in other process
+    def pending(self, user_id, page=None):
         """Returns notifications with PENDING status for user with ID == user_id"""
 
-        return list(map(self.to_notification_instance,
-                        list(Notification.select().where(Notification.user_id == user_id,
-                                                         Notification.status == NotificationStatus.PENDING.value))))
+        return self.select_notifications(
+            Notification.user_id == user_id,
+            Notification.status == NotificationStatus.PENDING.value,
+            page=page)
 
-    def created(self, user_id):
+    def pending_summary(self, user_id, limit):
+        """Returns tuple (number of PENDING notifications of user with ID == user_id, list of the first limit of them)"""
+
+        pending = (Notification.user_id == user_id,
+                   Notification.status == NotificationStatus.PENDING.value)
+        count = Notification.select().where(*pending).count()
+        if not count:
+            return 0, []
+        return count, list(map(NotificationInstance.from_row, Notification.select(
+            *NOTIFICATION_COLUMNS).where(*pending).order_by(Notification.id).limit(limit).tuples()))
+
+    def user_ids(self, task_ids):
+        """Returns set of IDs of users that have notifications of passed tasks"""
+
+        task_ids = list({int(task_id) for task_id in task_ids})
+        user_ids = set()
+        for chunk in _chunks(task_ids):
+            user_ids.update(user_id for (user_id,) in Notification.select(
+                Notification.user_id).where(Notification.task.in_(chunk)).distinct().tuples())
+        return user_ids
+
+    def created(self, user_id, page=None):
         """Returns notifications with CREATED status for user with ID == user_id"""
 
-        return list(map(self.to_notification_instance,
-                        list(Notification.select().where(Notification.user_id == user_id,
-                                                         Notification.status == NotificationStatus.CREATED.value))))
+        return self.select_notifications(
+            Notification.user_id == user_id,
+            Notification.status == NotificationStatus.CREATED.value,
+            page=page)
 
-    def shown(self, user_id):
+    @cached_read
+    def shown(self, user_id, page=None):
         """Returns notifications with SHOWN status for user with ID == user_id"""
 
-        return list(map(self.to_notification_instance,
-                        list(Notification.select().where(Notification.user_id == user_id,
-                                                         Notification.status == NotificationStatus.SHOWN.value))))
-
-    def all_user_notifications(self, user_id):
-        return list(map(self.to_notification_instance, list(
-            Notification.select().where(Notification.user_id == user_id))))
-
-    def process_notifications(self):
-        """Changes notification status from CREATED to PENDING if it's time to show notification"""
-
-        for notification in Notification.select().where(
-                Notification.status == NotificationStatus.CREATED.value).join(Task).where(
-                Task.id == Notification.task_id):
-            task = Task.get(Task.id == notification.task_id)
-            if (task.start_time -
-                    datetime.timedelta(seconds=notification.relative_start_time)) < datetime.datetime.now():
-                notification.status = NotificationStatus.PENDING.value
-                notification.save()
+        return self.select_notifications(
+            Notification.user_id == user_id,
+            Notification.status == NotificationStatus.SHOWN.value,
+            page=page)
+
+    @cached_read
+    def all_user_notifications(self, user_id, page=None):
+        return self.select_notifications(Notification.user_id == user_id, page=page)
+
+    def process_notifications(self, limit=None):
+        """
+        Changes notification status from CREATED to PENDING if it's time to show notification.
+        Due notifications are found by (status, fire_at) index and changed by one UPDATE.
+        If limit is passed, changes at most limit notifications that should have been shown earlier than others.
+        Returns number of changed notifications
+        """
+
+        due = [Notification.status == NotificationStatus.CREATED.value,
+               Notification.fire_at <= datetime.datetime.now()]
+        if limit is not None:
+            due = [Notification.id.in_(Notification.select(Notification.id).where(*due).order_by(
+                Notification.fire_at).limit(limit))]
+        if not self.signals:
+            return Notification.update(status=NotificationStatus.PENDING.value).where(*due).execute()
+        # notifications are selected first, so event contains the same notifications that are changed
+        ids, user_ids = self._changed(*due)
+        count = 0
+        with self.database.atomic():
+            for chunk in _chunks(ids):
+                count += Notification.update(status=NotificationStatus.PENDING.value).where(
+                    Notification.id.in_(chunk),
+                    Notification.status == NotificationStatus.CREATED.value).execute()
+            if ids:
+                self._send(Notification, Action.UPDATED, ids, ('status',), user_ids)
+        return count
+
+    def next_fire_at(self, user_id=None):
+        """
+        Returns time when the next CREATED notification should be shown or None if there are no such notifications.
+        If user_id is passed, only notifications of this user are checked
+        """
+
+        query = Notification.select(fn.MIN(Notification.fire_at)).where(
+            Notification.status == NotificationStatus.CREATED.value)
+        if user_id is not None:
+            query = query.where(Notification.user_id == user_id)
+        return query.scalar()
@@ -0,0 +1,131 @@
+"""
+This module provides keyset pagination for storage list queries.
+
+Page is selected by condition on the sort key of the last seen row instead of OFFSET, so every page costs
+the same and rows don't jump between pages when other rows are inserted. Rows are ordered by sort field
+and then by ID, so every row has unique position. Page contains cursors of next and previous pages:
+they are opaque strings that encode direction and sort key of the border row.
+
+    >>> page = commands.user_tasks(tasks_controller, page=PageRequest(order_by='priority', page_size=20))
+    >>> next_page = commands.user_tasks(
+    ...     tasks_controller, page=PageRequest('priority', 20, cursor=page.next_cursor))
+
+NULL values go first in ascending order and last in descending order, as SQLite sorts them.
+"""
+
+
+import base64
+import binascii
+import datetime
+import json
+from collections import namedtuple
+from tmlib.exceptions.exceptions import UnknownOrderingError, InvalidCursorError
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+_NEXT = 'next'
+_PREV = 'prev'
+_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+Page = namedtuple('Page', ['items', 'next_cursor', 'prev_cursor'])
+
+
+class PageRequest(namedtuple(
+        'PageRequest', ['order_by', 'page_size', 'cursor', 'descending'])):
+    """Describes requested page. Without cursor the first page is requested"""
+
+    __slots__ = ()
+
+    def __new__(cls, order_by='id', page_size=DEFAULT_PAGE_SIZE, cursor=None, descending=False):
+        return super().__new__(
+            cls, order_by, max(1, min(int(page_size), MAX_PAGE_SIZE)), cursor, bool(descending))
+
+
+def paginate(query, columns, orderings, page, from_row):
+    """
+    Returns Page of objects created by from_row from rows of query.
+    Query should select columns, orderings is dictionary {name: field} of fields that can be used for ordering,
+    all of them and primary key should be in columns
+    """
+
+    try:
+        field = orderings[page.order_by]
+    except KeyError:
+        raise UnknownOrderingError(page.order_by)
+    id_field = query.model._meta.primary_key
+    field_position = _position(columns, field)
+    id_position = _position(columns, id_field)
+
+    backwards = False
+    if page.cursor is not None:
+        direction, value, row_id = _decode_cursor(page)
+        backwards = direction == _PREV
+        query = query.where(_after(field, id_field, value, row_id, page.descending != backwards))
+    descending = page.descending != backwards
+    rows = list(query
+                .order_by(*_ordering(field, id_field, descending))
+                .limit(page.page_size + 1)
+                .tuples())
+    has_more = len(rows) > page.page_size
+    rows = rows[:page.page_size]
+    if backwards:
+        rows.reverse()
+
+    def cursor(direction, row):
+        return _encode_cursor(page, direction, row[field_position], row[id_position])
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if has_more or backwards:
+            next_cursor = cursor(_NEXT, rows[-1])
+        if (has_more and backwards) or (page.cursor is not None and not backwards):
+            prev_cursor = cursor(_PREV, rows[0])
+    return Page(list(map(from_row, rows)), next_cursor, prev_cursor)
+
+
+def _position(columns, field):
+    for position, column in enumerate(columns):
+        if column is field:
+            return position
+    raise ValueError('{} is not selected'.format(field.name))
+
+
+def _ordering(field, id_field, descending):
+    if descending:
+        return field.desc(), id_field.desc()
+    return field.asc(), id_field.asc()
+
+
+def _after(field, id_field, value, row_id, descending):
+    """Condition that selects rows placed after row with provided sort key"""
+
+    if descending:
+        if value is None:
+            return field.is_null() & (id_field < row_id)
+        return (field < value) | ((field == value) & (id_field < row_id)) | field.is_null()
+    if value is None:
+        return (field.is_null() & (id_field > row_id)) | field.is_null(False)
+    return (field > value) | ((field == value) & (id_field > row_id))
+
+
+def _encode_cursor(page, direction, value, row_id):
+    value_type = None
+    if isinstance(value, datetime.datetime):
+        value_type, value = 'datetime', value.strftime(_DATETIME_FORMAT)
+    key = [direction, page.order_by, page.descending, value_type, value, row_id]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def _decode_cursor(page):
+    try:
+        direction, order_by, descending, value_type, value, row_id = json.loads(
+            base64.urlsafe_b64decode(page.cursor.encode()).decode())
+        if value_type == 'datetime':
+            value = datetime.datetime.strptime(value, _DATETIME_FORMAT)
+        if (direction not in (_NEXT, _PREV) or not isinstance(row_id, int) or
+                order_by != page.order_by or descending != page.descending):
+            raise ValueError
+    except (ValueError, TypeError, UnicodeError, binascii.Error):
+        raise InvalidCursorError(page.cursor)
+    return direction, value, row_id
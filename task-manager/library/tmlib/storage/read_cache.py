@@ -0,0 +1,219 @@
+"""
+This module provides read cache of storage lists keyed by per-user data versions.
+
+Every user has data version number. Cached list is stored under key that contains version of user it was
+loaded for, so it's never invalidated directly: cache receives change events of storages (see tmlib.storage.signals
+module) and bumps versions of users affected by every write, so the next read of these users misses cache
+and loads data again. Old entries expire by themselves.
+
+Cache is disabled by default. Enable it for storage engine:
+
+    >>> engine = get_engine('/your/database/path/database_name')
+    >>> engine.set_read_cache(ReadCache(LocalCache(max_size=1024, timeout=60)))
+
+Cache backend is any object with get, set, add, incr and delete_many methods that work as methods
+of Django cache do, so Django cache can be passed as backend to share versions and lists between processes:
+
+    >>> from django.core.cache import cache
+    >>> engine.set_read_cache(ReadCache(cache, timeout=300))
+
+Writes made by processes without read cache don't bump versions, so lists they change are stale
+until cached entries expire.
+"""
+
+
+import collections
+import functools
+import hashlib
+import threading
+import time
+from tmlib.models.base_model import BaseModel
+from tmlib.storage.pagination import Page
+
+DEFAULT_MAX_SIZE = 1024  # number of entries in LocalCache
+DEFAULT_TIMEOUT = 300  # seconds
+
+CacheStats = collections.namedtuple('CacheStats', ['hits', 'misses'])
+
+_DEFAULT = object()
+
+
+def _copy(value):
+    """Copies models in cached value, so callers can't change cached lists"""
+
+    if isinstance(value, BaseModel):
+        return value.copy()
+    if isinstance(value, Page):
+        return value._replace(items=_copy(value.items))
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(_copy(item) for item in value)
+    return value
+
+
+class LocalCache:
+    """
+    In-process LRU cache with expiration time of entries. Stores copies of values, because they aren't pickled.
+    Timeout None means that entry expires only when it's evicted
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, timeout=DEFAULT_TIMEOUT):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expires_at(self, timeout):
+        if timeout is _DEFAULT:
+            timeout = self.timeout
+        return None if timeout is None else time.monotonic() + timeout
+
+    def _get_entry(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at = entry[1]
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _set_entry(self, key, value, timeout):
+        self._entries[key] = (_copy(value), self._expires_at(timeout))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._get_entry(key)
+        return default if entry is None else _copy(entry[0])
+
+    def set(self, key, value, timeout=_DEFAULT):
+        with self._lock:
+            self._set_entry(key, value, timeout)
+
+    def add(self, key, value, timeout=_DEFAULT):
+        """Sets value only if key isn't in cache. Returns True if value was set"""
+
+        with self._lock:
+            if self._get_entry(key) is not None:
+                return False
+            self._set_entry(key, value, timeout)
+            return True
+
+    def incr(self, key, delta=1):
+        """Increments number stored under key and returns new value. Raises ValueError if key isn't in cache"""
+
+        with self._lock:
+            entry = self._get_entry(key)
+            if entry is None:
+                raise ValueError("Key '{}' not found".format(key))
+            value = entry[0] + delta
+            self._entries[key] = (value, entry[1])
+            return value
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _new_version():
+    """
+    Version of user that has no version in cache. It's time in microseconds, so version that was evicted
+    and created again is bigger than versions of entries that were cached before
+    """
+
+    return int(time.time() * 1000000)
+
+
+class ReadCache:
+    """Caches results of storage reads for users until their data versions are bumped"""
+
+    def __init__(self, backend=None, timeout=DEFAULT_TIMEOUT, namespace='tmlib'):
+        self.backend = backend if backend is not None else LocalCache(timeout=timeout)
+        self.timeout = timeout
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def stats(self):
+        with self._stats_lock:
+            return CacheStats(self.hits, self.misses)
+
+    def _version_key(self, user_id):
+        return '{}:version:{}'.format(self.namespace, user_id)
+
+    def version(self, user_id):
+        """Returns data version of user with ID == user_id"""
+
+        key = self._version_key(user_id)
+        version = self.backend.get(key)
+        if version is None:
+            self.backend.add(key, _new_version(), None)
+            version = self.backend.get(key)
+        return version
+
+    def bump(self, user_ids):
+        """Changes data versions of users, so lists cached for them aren't used any more"""
+
+        for user_id in set(user_ids):
+            if user_id is None:
+                continue
+            key = self._version_key(user_id)
+            try:
+                self.backend.incr(key)
+            except ValueError:
+                self.backend.set(key, _new_version(), None)
+
+    def receive(self, event):
+        """Bumps versions of users affected by storage change event"""
+
+        self.bump(event.user_ids)
+
+    def get_or_load(self, user_id, name, args, load):
+        """
+        Returns value cached for user with ID == user_id by name and args.
+        If there is no such value for current user's version, calls load and caches its result
+        """
+
+        arguments = hashlib.sha1(repr(args).encode()).hexdigest()
+        key = '{}:{}:{}:{}:{}'.format(self.namespace, user_id, self.version(user_id), name, arguments)
+        value = self.backend.get(key, _DEFAULT)
+        if value is not _DEFAULT:
+            with self._stats_lock:
+                self.hits += 1
+            return value
+        with self._stats_lock:
+            self.misses += 1
+        value = load()
+        self.backend.set(key, value, self.timeout)
+        return value
+
+
+def cached_read(method):
+    """
+    Caches result of storage method in read cache of storage for user whose ID is the first argument.
+    Storage should send change events with users whose data the method returns on every write
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, user_id, *args, **kwargs):
+        read_cache = self.read_cache
+        if read_cache is None:
+            return method(self, user_id, *args, **kwargs)
+        return read_cache.get_or_load(
+            user_id, method.__qualname__, (args, sorted(kwargs.items())),
+            lambda: method(self, user_id, *args, **kwargs))
+    return wrapper
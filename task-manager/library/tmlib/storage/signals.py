@@ -0,0 +1,130 @@
+"""
+This module provides signals that storages send after every write, so caches, indexes and counters built on top
+of storages can follow changes instead of polling.
+
+Every write sends ChangeEvent(model, action, ids, fields, user_ids):
+    model - storage model that was changed: Task, UsersReadTasks, UsersWriteTasks, Notification, TaskPlan
+        or Category from tmlib.storage.storage_models module
+    action - Action.CREATED, Action.UPDATED or Action.DELETED
+    ids - tuple of IDs of changed objects. Rights events contain IDs of tasks which rights were changed
+    fields - frozenset of names of changed fields. It's empty for created and deleted objects
+    user_ids - frozenset of IDs of users whose data was changed: owners, assigned users and users with rights
+        of changed tasks, owners of changed notifications, plans and categories
+
+Receiver is a function that takes event. Synchronous receivers are called right after write, inside
+transaction if there is one. Deferred receivers are called after transaction is committed and aren't called
+if it's rolled back. Writes without transaction are committed at once, so deferred receivers get them at once:
+
+    >>> engine = get_engine('/your/database/path/database_name')
+    >>> engine.signals.connect(lambda event: print(event.action, event.ids), deferred=True)
+
+Storages find affected users only when somebody is connected, so writes cost nothing extra without receivers.
+Deferred receivers can get events of writes that were rolled back to savepoint of committed transaction.
+"""
+
+
+import enum
+import threading
+from collections import namedtuple
+from tmlib.storage.storage_models import Task, UsersReadTasks, UsersWriteTasks
+import tmlib.logger as log
+
+ChangeEvent = namedtuple('ChangeEvent', ['model', 'action', 'ids', 'fields', 'user_ids'])
+
+
+class Action(enum.Enum):
+    CREATED = 0
+    UPDATED = 1
+    DELETED = 2
+
+
+def task_user_ids(task_ids):
+    """Returns set of IDs of owners, assigned users and users with rights of tasks with IDs from task_ids"""
+
+    # task_storage module imports this one
+    from tmlib.storage.task_storage import _chunks
+
+    task_ids = list({int(task_id) for task_id in task_ids if task_id is not None})
+    user_ids = set()
+    for chunk in _chunks(task_ids):
+        for owner_id, assigned_user_id in Task.select(Task.user_id, Task.assigned_user_id).where(
+                Task.id.in_(chunk)).tuples():
+            user_ids.update((owner_id, assigned_user_id))
+        for model in (UsersReadTasks, UsersWriteTasks):
+            user_ids.update(user_id for (user_id,) in model.select(model.user_id).where(
+                model.task.in_(chunk)).distinct().tuples())
+    user_ids.discard(None)
+    return user_ids
+
+
+class StorageSignals:
+    """Receivers of change events of one database"""
+
+    def __init__(self, database=None):
+        self.database = database
+        self.receivers = []
+        self.deferred_receivers = []
+        self._local = threading.local()
+
+    def connect(self, receiver, deferred=False):
+        """Subscribes receiver to events. Deferred receiver gets events after transaction is committed"""
+
+        receivers = self.deferred_receivers if deferred else self.receivers
+        if receiver not in receivers:
+            receivers.append(receiver)
+        return receiver
+
+    def disconnect(self, receiver):
+        for receivers in (self.receivers, self.deferred_receivers):
+            if receiver in receivers:
+                receivers.remove(receiver)
+
+    def __bool__(self):
+        """True if somebody is subscribed"""
+
+        return bool(self.receivers or self.deferred_receivers)
+
+    def send_change(self, model, action, ids, fields=(), user_ids=()):
+        """Sends ChangeEvent. IDs can be passed in any iterable, None user IDs are dropped"""
+
+        self.send(ChangeEvent(
+            model, action, tuple(ids), frozenset(fields),
+            frozenset(user_id for user_id in user_ids if user_id is not None)))
+
+    def _pending(self):
+        pending = getattr(self._local, 'pending', None)
+        if pending is None:
+            pending = self._local.pending = []
+        return pending
+
+    def send(self, event):
+        for receiver in list(self.receivers):
+            receiver(event)
+        if not self.deferred_receivers:
+            return
+        if self.database is not None and self.database.in_transaction():
+            self._pending().append(event)
+        else:
+            self._send_deferred([event])
+
+    def _send_deferred(self, events):
+        for event in events:
+            for receiver in list(self.deferred_receivers):
+                try:
+                    receiver(event)
+                except Exception:
+                    # transaction is already committed, so error can't cancel it
+                    log.get_logger().exception('Receiver of committed change failed')
+
+    def committed(self):
+        """Sends events of committed transaction to deferred receivers"""
+
+        pending = self._pending()
+        if pending:
+            events, pending[:] = list(pending), []
+            self._send_deferred(events)
+
+    def rolled_back(self):
+        """Drops events of rolled back transaction"""
+
+        self._pending().clear()
@@ -8,12 +8,15 @@ from peewee import (
     ForeignKeyField,
     DateTimeField,
     BooleanField,
-    SqliteDatabase)
+    FloatField,
+    TextField)
 from tmlib.models.task import Status, Priority
 from tmlib.models.notification import Status as NotificationStatus
 
 database_proxy = Proxy() # Peewee doesn't allow to add database without global database object
 
+DEFAULT_DATABASE = './task-manager.db'
+
 
 class BaseModel(Model):
     """Base class for classes that work with peewee library"""
@@ -27,6 +30,11 @@ class Category(BaseModel):
     name = CharField()
     user_id = IntegerField(null=True)
 
+    class Meta:
+        indexes = (
+            (('user_id',), False),
+        )
+
 
 class Task(BaseModel):
     id = PrimaryKeyField(null=False)
@@ -44,6 +52,22 @@ class Task(BaseModel):
     created_at = DateTimeField(default=datetime.datetime.now)
     updated_at = DateTimeField(default=datetime.datetime.now)
     plan_id = IntegerField(null=True)
+    # time of virtual plan's occurrence that was stored because user changed it
+    occurrence_at = DateTimeField(null=True)
+
+    class Meta:
+        indexes = (
+            (('plan_id', 'occurrence_at'), True),
+            (('user_id', 'status'), False),
+            (('user_id', 'plan_id'), False),
+            (('user_id', 'priority'), False),
+            (('user_id', 'start_time'), False),
+            (('user_id', 'end_time'), False),
+            (('user_id', 'created_at'), False),
+            (('user_id', 'updated_at'), False),
+            (('assigned_user_id',), False),
+            (('parent_task_id',), False),
+        )
 
     def save(self, *args, **kwargs):
         self.updated_at = datetime.datetime.now()
@@ -56,6 +80,33 @@ class TaskPlan(BaseModel):
     task = ForeignKeyField(Task, null=True)
     interval = IntegerField()
     last_created_at = DateTimeField()
+    # last_created_at + interval, so due plans are found by index
+    next_due_at = DateTimeField(null=True, index=True)
+    is_virtual = BooleanField(default=False)
+    # cron-style recurrence rule, plan with rule doesn't use interval
+    rule = CharField(null=True)
+
+    class Meta:
+        indexes = (
+            (('user_id',), False),
+            (('user_id', 'next_due_at'), False),
+        )
+
+
+class CancelledOccurrence(BaseModel):
+    """
+    CancelledOccurrence model. Occurrence of virtual task plan which stored task was deleted,
+    so plan doesn't expand it again
+    """
+
+    id = PrimaryKeyField(null=False)
+    plan = ForeignKeyField(TaskPlan)
+    occurrence_at = DateTimeField()
+
+    class Meta:
+        indexes = (
+            (('plan', 'occurrence_at'), True),
+        )
 
 
 class Notification(BaseModel):
@@ -65,6 +116,14 @@ class Notification(BaseModel):
     title = CharField()
     relative_start_time = IntegerField()
     status = IntegerField(default=NotificationStatus.CREATED.value)
+    # task's start_time - relative_start_time. It's set by triggers, see add_notification_fire_at migration
+    fire_at = DateTimeField(null=True)
+
+    class Meta:
+        indexes = (
+            (('user_id', 'status'), False),
+            (('status', 'fire_at'), False),
+        )
 
 
 class UsersReadTasks(BaseModel):
@@ -73,6 +132,11 @@ class UsersReadTasks(BaseModel):
     user_id = IntegerField(null=True)
     task = ForeignKeyField(Task)
 
+    class Meta:
+        indexes = (
+            (('user_id', 'task'), True),
+        )
+
 
 class UsersWriteTasks(BaseModel):
     """UsersWriteTasks model. If there is an entry with user and task it means that user can read and change this task"""
@@ -80,30 +144,93 @@ class UsersWriteTasks(BaseModel):
     user_id = IntegerField(null=True)
     task = ForeignKeyField(Task)
 
+    class Meta:
+        indexes = (
+            (('user_id', 'task'), True),
+        )
+
+
+class TaskSearch(BaseModel):
+    """
+    TaskSearch model. Full-text index over titles and notes of tasks.
+    It's SQLite FTS5 table that takes content from Task table, so it's created by migration and kept in sync
+    by triggers. task_search is hidden column of FTS5 table that is used for MATCH queries and ranking
+    """
+
+    rowid = IntegerField(primary_key=True)
+    title = TextField()
+    note = TextField()
+    task_search = TextField()
+
+    class Meta:
+        table_name = 'task_search'
+
+
+class TaskWindow(BaseModel):
+    """
+    TaskWindow model. Time index of tasks that have start_time or end_time.
+    It's SQLite R*Tree table with interval [starts_at, ends_at] of every task in seconds since epoch,
+    so it's created by migration and kept in sync by triggers. Task with only one of times is stored as point.
+    R*Tree keeps coordinates as 32-bit floats rounded outwards, so it can return a bit more tasks than
+    overlap the window and selected tasks should be checked against Task times again
+    """
+
+    id = IntegerField(primary_key=True)
+    starts_at = FloatField()
+    ends_at = FloatField()
+
+    class Meta:
+        table_name = 'task_window'
+
+
+class SchemaMigration(BaseModel):
+    """SchemaMigration model. Stores versions of migrations that were applied to database"""
+
+    version = IntegerField(primary_key=True)
+    name = CharField()
+    applied_at = DateTimeField(default=datetime.datetime.now)
+
 
 class DatabaseConnector:
-    """Base class for establishing connection with database, creating and dropping tables"""
+    """
+    Base class for storages. Storages get shared engine for their database, so creating them is cheap
+    and doesn't touch database
+    """
+
+    def __init__(self, database_name=DEFAULT_DATABASE, engine=None):
+        from tmlib.storage.engine import get_engine
+
+        if engine is None:
+            engine = get_engine(database_name)
+        else:
+            engine.activate()
+        self.engine = engine
+        self.database_name = self.engine.database_name
+        self.database = self.engine.database
+
+    @property
+    def read_cache(self):
+        """ReadCache of engine or None if lists aren't cached (see tmlib.storage.read_cache module)"""
 
-    def __init__(self, database_name='./task-manager.db'):
-        self.database_name = database_name
-        self.database = SqliteDatabase(database_name)
-        self.connected = False
-        database_proxy.initialize(self.database)
-        self.create_tables()
+        return self.engine.read_cache
+
+    @property
+    def signals(self):
+        """StorageSignals of engine (see tmlib.storage.signals module)"""
+
+        return self.engine.signals
+
+    def _send(self, model, action, ids, fields=(), user_ids=()):
+        """Sends change event if somebody is subscribed to signals of engine"""
+
+        signals = self.engine.signals
+        if signals:
+            signals.send_change(model, action, ids, fields, user_ids)
 
     def create_tables(self):
-        if not self.connected:
-            self.database.connect()
-            self.connected = True
-        Category.create_table(True)
-        Notification.create_table(True)
-        Task.create_table(True)
-        TaskPlan.create_table(True)
-        UsersReadTasks.create_table(True)
-        UsersWriteTasks.create_table(True)
+        """Creates tables and upgrades existing ones by applying pending migrations"""
+
+        self.engine.create_tables()
 
     def drop_tables(self):
-        self.database.drop_tables(
-            [Task, UsersReadTasks, UsersWriteTasks, Category, Notification, TaskPlan])
-        self.database.close()
-        self.connected = False
+        self.engine.drop_tables()
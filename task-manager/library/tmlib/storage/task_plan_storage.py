@@ -1,28 +1,113 @@
 import datetime
-from peewee import DoesNotExist
-from tmlib.storage.storage_models import Task, TaskPlan, DatabaseConnector
-from tmlib.storage.task_storage import TaskStorage
+from itertools import islice
+from peewee import fn
+from tmlib.storage.storage_models import Task, TaskPlan, CancelledOccurrence, DatabaseConnector
+from tmlib.storage.task_storage import _chunks
+from tmlib.storage.read_cache import cached_read
+from tmlib.storage.signals import Action, task_user_ids
 from tmlib.models.task_plan import TaskPlan as TaskPlanInstance
 from tmlib.models.task import Status
 
+# columns in order of TaskPlan.__slots__, so selected rows are passed to from_row as they are
+TASK_PLAN_COLUMNS = (
+    TaskPlan.interval,
+    TaskPlan.user_id,
+    TaskPlan.task,
+    TaskPlan.last_created_at,
+    TaskPlan.id,
+    TaskPlan.is_virtual,
+    TaskPlan.rule)
+
+# plan attributes that can be changed by TaskPlanStorage.update
+PLAN_FIELDS = ('interval', 'last_created_at', 'next_due_at', 'is_virtual', 'rule')
+
+# number of missed occurrences that one plan catches up at once, the rest are caught up when plan is due again
+MAX_CATCH_UP = 1000
+
+
+def _next_due_at(plan):
+    """Virtual plans don't create tasks, so they are never due. Storage model of plan can be passed too"""
+
+    if plan.is_virtual:
+        return None
+    if not isinstance(plan, TaskPlanInstance):
+        plan = TaskPlanInstance(
+            plan.interval, plan.user_id, plan.task_id, plan.last_created_at, rule=plan.rule)
+    return plan.next_occurrence(plan.last_created_at)
+
+
+def _missed_occurrences(plan, now, catch_up=True):
+    """
+    Returns tuple (number of plan's occurrences after last_created_at before now, the last of them).
+    Occurrence that is exactly now isn't missed yet. With catch_up at most MAX_CATCH_UP occurrences are counted.
+    Occurrences of plan with rule are found one by one, so without catch_up they aren't counted at all:
+    plan is moved right before now and the number is 1 if anything was missed
+    """
+
+    if plan.rule is not None:
+        if not catch_up:
+            next_occurrence = plan.next_occurrence(plan.last_created_at)
+            if next_occurrence is None or next_occurrence >= now:
+                return 0, plan.last_created_at
+            # the next occurrence is the first one that isn't earlier than now
+            return 1, now - datetime.timedelta(microseconds=1)
+        missed, last_occurrence = 0, plan.last_created_at
+        for last_occurrence in islice(plan.occurrences(plan.last_created_at, now), MAX_CATCH_UP):
+            missed += 1
+        return missed, last_occurrence
+    interval = datetime.timedelta(seconds=plan.interval)
+    missed = -((plan.last_created_at - now) // interval) - 1
+    if catch_up:
+        missed = min(missed, MAX_CATCH_UP)
+    return missed, plan.last_created_at + missed * interval
+
 
 class TaskPlanStorage(DatabaseConnector):
+    """
+    Storage of task plans. Every write sends change event to signals of engine (see tmlib.storage.signals module)
+    with plan's owner and users that see occurrences of plan's template. If engine has read cache,
+    lists of user's plans are cached
+    """
+
+    def _plan_users(self, plan):
+        """Returns set of users affected by change of plan. If nobody is subscribed to signals, returns empty set"""
+
+        if not self.signals or plan is None:
+            return set()
+        return {plan.user_id} | task_user_ids([plan.task_id])
+
     def create(self, plan):
-        return self.to_plan_instance(
+        created_plan = self.to_plan_instance(
             TaskPlan.create(
                 id=plan.id,
                 interval=plan.interval,
                 user_id=plan.user_id,
                 task_id=plan.task_id,
-                last_created_at=plan.last_created_at))
+                last_created_at=plan.last_created_at,
+                next_due_at=_next_due_at(plan),
+                is_virtual=plan.is_virtual,
+                rule=plan.rule))
+        self._send(TaskPlan, Action.CREATED, [created_plan.id], user_ids=self._plan_users(created_plan))
+        return created_plan
 
     def delete_by_id(self, plan_id):
-        TaskPlan.delete().where(TaskPlan.id == plan_id).execute()
+        user_ids = self._plan_users(self.get_by_id(plan_id) if self.signals else None)
+        with self.database.atomic():
+            CancelledOccurrence.delete().where(CancelledOccurrence.plan == plan_id).execute()
+            TaskPlan.delete().where(TaskPlan.id == plan_id).execute()
+        self._send(TaskPlan, Action.DELETED, [plan_id], user_ids=user_ids)
 
     def update(self, plan):
+        self._update(plan)
+        self._send(TaskPlan, Action.UPDATED, [plan.id], PLAN_FIELDS, self._plan_users(plan))
+
+    def _update(self, plan):
         TaskPlan.update(
             interval=plan.interval,
-            last_created_at=plan.last_created_at).where(
+            last_created_at=plan.last_created_at,
+            next_due_at=_next_due_at(plan),
+            is_virtual=plan.is_virtual,
+            rule=plan.rule).where(
             TaskPlan.id == plan.id).execute()
 
     def to_plan_instance(self, plan):
@@ -31,49 +116,73 @@ class TaskPlanStorage(DatabaseConnector):
             interval=plan.interval,
             user_id=plan.user_id,
             task_id=plan.task_id,
-            last_created_at=plan.last_created_at)
+            last_created_at=plan.last_created_at,
+            is_virtual=plan.is_virtual,
+            rule=plan.rule)
 
     def get_by_id(self, plan_id):
-        try:
-            return self.to_plan_instance(
-                TaskPlan.get(TaskPlan.id == plan_id))
-        except DoesNotExist:
-            return None
+        row = TaskPlan.select(*TASK_PLAN_COLUMNS).where(
+            TaskPlan.id == plan_id).tuples().first()
+        return TaskPlanInstance.from_row(row) if row is not None else None
 
+    @cached_read
     def all_user_plans(self, user_id):
-        return list(map(self.to_plan_instance, list(
-            TaskPlan.select().where(TaskPlan.user_id == user_id))))
-
-    def process_plans(self, task_storage):
-        """Creates tasks according to task plans."""
-
-        for plan in TaskPlan.select():
-            if (plan.last_created_at + datetime.timedelta(seconds=plan.interval)
-                    ) < datetime.datetime.now():
-                try:
-                    task = task_storage.get_by_id(
-                        plan.task_id)  # template task
-                    task.id = None
-                    task.status = Status.TODO.value  # change status from TEMPLATE to TODO
-                    task.plan_id = plan.id
-                    task_storage.create(task)
-                    """
-                    last_created_at shouldn't offset the interval.
-                    E.g. user wants to plan task for every monday on 10:00.
-                    If this method called on tuesday in last_created_at should be monday
-                    in order to save the rule that it creates task every monday on 10:00.
-                    """
-                    last_created_at = (
-                        plan.last_created_at +
-                        datetime.timedelta(
-                            seconds=plan.interval))
-                    while (
-                        last_created_at +
-                        datetime.timedelta(
-                            seconds=plan.interval)) < datetime.datetime.now():
-                        last_created_at += datetime.timedelta(
-                            seconds=plan.interval)
-                    plan.last_created_at = last_created_at
-                    plan.save()
-                except DoesNotExist:
-                    pass
+        return list(map(TaskPlanInstance.from_row, TaskPlan.select(
+            *TASK_PLAN_COLUMNS).where(TaskPlan.user_id == user_id).tuples()))
+
+    def due_plans(self, now, user_id=None, limit=None):
+        """
+        Returns plans that should create task before now, the most overdue first.
+        If user_id is passed, returns only user's plans
+        """
+
+        expressions = [TaskPlan.next_due_at < now]
+        if user_id is not None:
+            expressions.append(TaskPlan.user_id == user_id)
+        query = TaskPlan.select(*TASK_PLAN_COLUMNS).where(*expressions).order_by(TaskPlan.next_due_at)
+        if limit is not None:
+            query = query.limit(limit)
+        return list(map(TaskPlanInstance.from_row, query.tuples()))
+
+    def next_due_at(self):
+        """Returns time when the next task plan should create task or None if there are no plans"""
+
+        return TaskPlan.select(fn.MIN(TaskPlan.next_due_at)).scalar()
+
+    def process_plans(self, task_storage, user_id=None, catch_up=False, limit=None):
+        """
+        Creates tasks from templates of due task plans in one transaction and returns number of created tasks.
+        If user_id is passed, processes only user's plans. If limit is passed, processes at most limit plans.
+        By default plan creates one task however many occurrences were missed. If catch_up is True,
+        plan creates task for every missed occurrence, at most MAX_CATCH_UP at once. Plans which template task was deleted are moved
+        forward without creating tasks.
+
+        last_created_at shouldn't offset the interval.
+        E.g. user wants to plan task for every monday on 10:00.
+        If this method called on tuesday in last_created_at should be monday
+        in order to save the rule that it creates task every monday on 10:00.
+        """
+
+        now = datetime.datetime.now()
+        plans = self.due_plans(now, user_id, limit)
+        if not plans:
+            return 0
+        templates = {}
+        for chunk in _chunks([plan.task_id for plan in plans]):
+            templates.update((task.id, task) for task in task_storage.filter(Task.id.in_(chunk)))
+        tasks = []
+        with self.database.atomic():
+            for plan in plans:
+                missed, plan.last_created_at = _missed_occurrences(plan, now, catch_up)
+                template_task = templates.get(plan.task_id)
+                if template_task is not None:
+                    tasks.extend(template_task.replace(
+                        id=None,
+                        status=Status.TODO.value,  # change status from TEMPLATE to TODO
+                        plan_id=plan.id) for i in range(missed if catch_up else 1))
+                self._update(plan)
+            task_storage.bulk_create(tasks)
+            # due plans aren't virtual, so only owners see them
+            self._send(TaskPlan, Action.UPDATED, [plan.id for plan in plans],
+                       ('last_created_at', 'next_due_at'), {plan.user_id for plan in plans})
+        return len(tasks)
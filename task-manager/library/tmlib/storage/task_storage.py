@@ -1,14 +1,256 @@
 import datetime
-from collections import deque
-from peewee import DoesNotExist
+import functools
+import math
+from collections import namedtuple
+from itertools import islice
+from peewee import Value, Case, SQL, Expression, JOIN, fn
 from tmlib.storage.storage_models import (
-    Task, UsersReadTasks, UsersWriteTasks, TaskPlan, DatabaseConnector)
-from tmlib.models.task import Task as TaskInstance
+    Task, UsersReadTasks, UsersWriteTasks, TaskPlan, CancelledOccurrence, TaskSearch, TaskWindow, DatabaseConnector)
+from tmlib.models.task import Task as TaskInstance, AccessLevel, Status
+from tmlib.models.task_plan import TaskPlan as TaskPlanInstance
+from tmlib.storage.unit_of_work import current_unit_of_work, unit_of_work, TRACKED_FIELDS
+from tmlib.storage.read_cache import cached_read
+from tmlib.storage.signals import Action, task_user_ids
+from tmlib.storage.pagination import paginate
+from tmlib.exceptions.exceptions import UnknownOrderingError
+
+SQLITE_MAX_VARIABLES = 999  # default limit of host parameters in one SQLite statement
+FETCH_BATCH_SIZE = 500  # number of rows that TaskQuery decodes at once
+
+SubtreeNode = namedtuple('SubtreeNode', ['task', 'depth', 'path'])
+SearchResult = namedtuple('SearchResult', ['task', 'rank', 'snippet'])
+
+# weights of title and note columns in bm25 ranking
+SEARCH_WEIGHTS = (10.0, 1.0)
+SEARCH_SNIPPET_TOKENS = 10
+
+EPOCH = datetime.datetime(1970, 1, 1)  # SQLite converts dates to seconds since epoch as UTC
+
+# columns in order of Task.__slots__, so selected rows are passed to from_row as they are
+TASK_COLUMNS = (
+    Task.title,
+    Task.note,
+    Task.user_id,
+    Task.id,
+    Task.start_time,
+    Task.end_time,
+    Task.assigned_user_id,
+    Task.parent_task_id,
+    Task.is_event,
+    Task.category,
+    Task.priority,
+    Task.status,
+    Task.plan_id,
+    Task.created_at,
+    Task.updated_at,
+    Task.occurrence_at)
+
+_COLUMNS_BY_NAME = dict(zip(TaskInstance.__slots__, TASK_COLUMNS))
+
+# fields that task lists can be ordered by
+TASK_ORDERINGS = {
+    'id': Task.id,
+    'priority': Task.priority,
+    'start_time': Task.start_time,
+    'end_time': Task.end_time,
+    'created_at': Task.created_at,
+    'updated_at': Task.updated_at}
+
+
+def _chunks(items, size=SQLITE_MAX_VARIABLES):
+    """Splits list into parts that fit into one SQLite statement"""
+
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _match_expression(text):
+    """
+    Turns user's text into FTS5 query: every word is quoted, so FTS5 operators are searched as plain words,
+    and the last word matches as prefix
+    """
+
+    terms = ['"{}"'.format(term.replace('"', '""')) for term in text.split()]
+    if not terms:
+        return None
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _duration(task):
+    if task.start_time is not None and task.end_time is not None:
+        return task.end_time - task.start_time
+    return datetime.timedelta()
+
+
+def _occurrence(plan, template_task, time):
+    """Copy of template task for plan's occurrence at time. Task's times are moved, so it starts at time"""
+
+    start_time = end_time = time
+    if template_task.start_time is None and template_task.end_time is not None:
+        start_time = None
+    elif template_task.end_time is None:
+        end_time = None
+    else:
+        end_time = time + _duration(template_task)
+    return template_task.replace(
+        id=None,
+        status=Status.TODO.value,
+        plan_id=plan.id,
+        start_time=start_time,
+        end_time=end_time,
+        created_at=None,
+        updated_at=None,
+        occurrence_at=time)
+
+
+def _seconds_since_epoch(time):
+    return (time - EPOCH).total_seconds()
+
+
+def _flushes_unit_of_work(method):
+    """Writes pending updates of current unit of work before method, so it works with actual data"""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        current = self.current_unit_of_work()
+        if current is not None:
+            current.flush()
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+class TaskQuery:
+    """
+    Lazy query returned by TaskStorage.filter. Query is run only when it's iterated or when
+    count, exists, first or page is called, and every call returns new query, so it can be chained:
+
+        >>> query = task_storage.filter(Task.user_id == user_id)
+        >>> query.order_by('-priority', 'start_time').limit(10).only('id', 'title')
+        >>> query.exists()
+
+    Iteration fetches rows in batches of FETCH_BATCH_SIZE and decodes only one batch at a time
+    """
+
+    def __init__(self, storage, query, names=TaskInstance.__slots__):
+        self._storage = storage
+        self._query = query
+        self._names = names
+
+    def _clone(self, query, names=None):
+        return TaskQuery(self._storage, query, names or self._names)
+
+    def order_by(self, *fields):
+        """
+        Orders tasks by fields. Field is a name from TASK_ORDERINGS (with '-' prefix for descending order)
+        or peewee field or expression
+        """
+
+        ordering = []
+        for field in fields:
+            if isinstance(field, str):
+                name = field.lstrip('-')
+                if name not in TASK_ORDERINGS:
+                    raise UnknownOrderingError(name)
+                field = TASK_ORDERINGS[name].desc() if field.startswith('-') else TASK_ORDERINGS[name]
+            ordering.append(field)
+        return self._clone(self._query.order_by(*ordering))
+
+    def limit(self, count):
+        return self._clone(self._query.limit(count))
+
+    def only(self, *names):
+        """Selects only passed task attributes (and ID). Other attributes of returned tasks are None"""
+
+        unknown = set(names) - set(TaskInstance.__slots__)
+        if unknown:
+            raise AttributeError('Task has no attributes {}'.format(', '.join(sorted(unknown))))
+        names = tuple(name for name in TaskInstance.__slots__
+                      if name in names or name == 'id')
+        columns = [_COLUMNS_BY_NAME[name] for name in names]
+        return self._clone(self._query.select(*columns), names)
+
+    def count(self):
+        self._flush()
+        return self._query.order_by().count()
+
+    def exists(self):
+        self._flush()
+        return self._query.exists()
+
+    def first(self):
+        for task in self.limit(1):
+            return task
+        return None
+
+    def page(self, page_request):
+        """Returns Page of tasks (see tmlib.storage.pagination module). Query ordering is replaced by page one"""
+
+        self._flush()
+        return paginate(
+            self._query.order_by(),
+            tuple(_COLUMNS_BY_NAME[name] for name in self._names),
+            TASK_ORDERINGS,
+            page_request,
+            self._from_row)
+
+    def iter_batches(self, batch_size=FETCH_BATCH_SIZE):
+        """Yields lists of at most batch_size tasks"""
+
+        self._flush()
+        rows = self._query.tuples().iterator()
+        while True:
+            batch = list(map(self._from_row, islice(rows, batch_size)))
+            if not batch:
+                return
+            yield batch
+
+    def __iter__(self):
+        for batch in self.iter_batches():
+            yield from batch
+
+    def __bool__(self):
+        return self.exists()
+
+    def _from_row(self, row):
+        if self._names is TaskInstance.__slots__:
+            return TaskInstance.from_row(row)
+        values = dict.fromkeys(TaskInstance.__slots__)
+        values.update(zip(self._names, row))
+        return TaskInstance.from_row(values.values())
+
+    def _flush(self):
+        current = self._storage.current_unit_of_work()
+        if current is not None:
+            current.flush()
 
 
 class TaskStorage(DatabaseConnector):
+    """
+    Storage of tasks and their access rights. Every write sends change event to signals of engine
+    (see tmlib.storage.signals module). If engine has read cache, lists of user's tasks are cached
+    """
+
+    def unit_of_work(self):
+        """Starts unit of work for database of this storage. See tmlib.storage.unit_of_work module"""
+
+        return unit_of_work(self.database)
+
+    def current_unit_of_work(self):
+        return current_unit_of_work(self.database)
+
+    def _task_users(self, task_ids, user_ids=()):
+        """
+        Returns set of users affected by change of tasks with IDs from task_ids and users from user_ids.
+        If nobody is subscribed to signals, returns empty set without query
+        """
+
+        if not self.signals:
+            return set()
+        return task_user_ids(task_ids) | set(user_ids)
+
     def create(self, task):
-        return self.to_task_instance(
+        created_task = self.to_task_instance(
             Task.create(
                 id=task.id,
                 user_id=task.user_id,
@@ -22,26 +264,160 @@ class TaskStorage(DatabaseConnector):
                 category_id=task.category_id,
                 priority=task.priority,
                 status=task.status,
-                plan_id=task.plan_id))
+                plan_id=task.plan_id,
+                occurrence_at=task.occurrence_at))
+        created_task.mark_clean()
+        self._send(Task, Action.CREATED, [created_task.id],
+                   user_ids=(task.user_id, task.assigned_user_id))
+        return created_task
+
+    def bulk_create(self, tasks, batch_size=50):
+        """
+        Creates tasks using multi-row inserts in one transaction and returns their IDs in the same order.
+        Created tasks get their IDs too.
+        Inner task can reference parent task from the same list: pass parent task object as its parent_task_id.
+        Parent task should be placed before inner task in the list or be already stored, otherwise raises ValueError
+        """
 
+        tasks = list(tasks)
+        positions = {id(task): position for position, task in enumerate(tasks)}
+        for position, task in enumerate(tasks):
+            parent_task = task.parent_task_id
+            if (isinstance(parent_task, TaskInstance) and parent_task.id is None and
+                    positions.get(id(parent_task), position) >= position):
+                raise ValueError('Parent of task {!r} is neither stored nor placed before it'.format(task.title))
+        now = datetime.datetime.now()
+        batch_size = max(1, min(batch_size, SQLITE_MAX_VARIABLES // len(Task._meta.fields)))
+        batch = []
+
+        def insert_batch():
+            if batch:
+                last_id = Task.insert_many(
+                    [self._to_row(task, now) for task in batch]).execute()
+                # IDs of rows inserted by one statement are contiguous: Task.id is INTEGER PRIMARY KEY without
+                # AUTOINCREMENT, so SQLite gives every new row max(id) + 1, and other connections can't insert
+                # rows in between while transaction holds write lock. RETURNING doesn't help, because it returns
+                # rows in arbitrary order
+                for offset, task in enumerate(batch):
+                    task.id = last_id - len(batch) + offset + 1
+                    task.created_at = task.updated_at = now
+                batch.clear()
+
+        with self.database.atomic():
+            for task in tasks:
+                if isinstance(task.parent_task_id, TaskInstance):
+                    if task.parent_task_id.id is None:
+                        insert_batch()  # parent task is waiting in current batch
+                    task.parent_task_id = task.parent_task_id.id
+                if task.id is not None:
+                    insert_batch()
+                    Task.insert(self._to_row(task, now)).execute()
+                    task.created_at = task.updated_at = now
+                    continue
+                batch.append(task)
+                if len(batch) >= batch_size:
+                    insert_batch()
+            insert_batch()
+        self._send(Task, Action.CREATED, [task.id for task in tasks],
+                   user_ids={user_id for task in tasks for user_id in (task.user_id, task.assigned_user_id)})
+        return [task.id for task in tasks]
+
+    def _to_row(self, task, now):
+        return {
+            Task.id: task.id,
+            Task.user_id: task.user_id,
+            Task.title: task.title,
+            Task.note: task.note,
+            Task.start_time: task.start_time,
+            Task.end_time: task.end_time,
+            Task.assigned_user_id: task.assigned_user_id,
+            Task.parent_task_id: task.parent_task_id,
+            Task.is_event: task.is_event,
+            Task.category: task.category_id,
+            Task.priority: task.priority,
+            Task.status: task.status,
+            Task.plan_id: task.plan_id,
+            Task.occurrence_at: task.occurrence_at,
+            Task.created_at: now,
+            Task.updated_at: now}
+
+    @_flushes_unit_of_work
     def delete_by_id(self, task_id):
-        Task.delete().where(Task.id == task_id).execute()
-        TaskPlan.delete().where(TaskPlan.task_id == task_id).execute()
+        """
+        Deletes task and plans which template it is. Deleted occurrence of virtual plan is remembered as cancelled,
+        so plan doesn't expand it again
+        """
+
+        current = self.current_unit_of_work()
+        if current is not None:
+            current.forget_task(task_id)
+        user_ids = self._task_users([task_id])
+        plan_ids = []
+        if self.signals:
+            plan_ids = [plan_id for (plan_id,) in TaskPlan.select(TaskPlan.id).where(
+                TaskPlan.task_id == task_id).tuples()]
+        occurrence = Task.select(Task.plan_id, Task.occurrence_at).where(
+            Task.id == task_id, Task.occurrence_at.is_null(False)).tuples().first()
+        with self.database.atomic():
+            Task.delete().where(Task.id == task_id).execute()
+            if occurrence is not None:
+                CancelledOccurrence.insert(
+                    plan=occurrence[0], occurrence_at=occurrence[1]).on_conflict_ignore().execute()
+            CancelledOccurrence.delete().where(CancelledOccurrence.plan.in_(
+                TaskPlan.select(TaskPlan.id).where(TaskPlan.task_id == task_id))).execute()
+            TaskPlan.delete().where(TaskPlan.task_id == task_id).execute()
+        self._send(Task, Action.DELETED, [task_id], user_ids=user_ids)
+        if plan_ids:
+            self._send(TaskPlan, Action.DELETED, plan_ids, user_ids=user_ids)
 
     def update(self, task):
-        Task.update(
-            title=task.title,
-            note=task.note,
-            start_time=task.start_time,
-            end_time=task.end_time,
-            assigned_user_id=task.assigned_user_id,
-            is_event=task.is_event,
-            category_id=task.category_id,
-            priority=task.priority,
-            status=task.status,
-            parent_task_id=task.parent_task_id,
-            updated_at=datetime.datetime.now()).where(
-            Task.id == task.id).execute()
+        """
+        Writes fields of task that were changed since it was loaded by storage, nothing is written if there are
+        no such fields. Task that wasn't loaded by storage (e.g. copy) is written whole
+        """
+
+        current = self.current_unit_of_work()
+        if current is not None:
+            current.register_update(task)
+            return
+        fields = task.changed_fields(TRACKED_FIELDS)
+        if not fields:
+            return
+        user_ids = self._task_users([task.id], [task.assigned_user_id])
+        now = datetime.datetime.now()
+        Task.update(updated_at=now, **fields).where(Task.id == task.id).execute()
+        task.updated_at = now
+        task.mark_clean()
+        self._send(Task, Action.UPDATED, [task.id], fields, user_ids)
+
+    def set_status(self, task_id, status):
+        """Sets status of task with ID == task_id by one UPDATE without loading task"""
+
+        self._set_field(task_id, 'status', status)
+
+    def assign(self, task_id, user_id):
+        """Assigns task with ID == task_id on user with ID == user_id by one UPDATE without loading task"""
+
+        self._forget_access_levels([task_id])
+        self._set_field(task_id, 'assigned_user_id', user_id)
+
+    def _set_field(self, task_id, name, value):
+        """Writes one field of task if its value differs. Task loaded by unit of work is updated with it"""
+
+        current = self.current_unit_of_work()
+        if current is not None and current.get_task(task_id) is not None:
+            task = current.get_task(task_id)
+            setattr(task, name, value)
+            current.register_update(task)
+            return
+        if current is not None:
+            current.flush()
+        field = _COLUMNS_BY_NAME[name]
+        user_ids = self._task_users([task_id], [value] if name == 'assigned_user_id' else [])
+        changed = Task.update({field: value, Task.updated_at: datetime.datetime.now()}).where(
+            Task.id == task_id, Expression(field, 'IS NOT', value)).execute()
+        if changed:
+            self._send(Task, Action.UPDATED, [task_id], [name], user_ids)
 
     def to_task_instance(self, task):
         return TaskInstance(
@@ -59,112 +435,250 @@ class TaskStorage(DatabaseConnector):
             status=task.status,
             created_at=task.created_at,
             updated_at=task.updated_at,
-            plan_id=task.plan_id)
-
-    def get_by_id(self, task_id):
-        try:
-            return self.to_task_instance(Task.get(Task.id == task_id))
-        except DoesNotExist:
-            return None
+            plan_id=task.plan_id,
+            occurrence_at=task.occurrence_at)
 
-    def user_tasks(self, user_id):
-        return list(map(self.to_task_instance, list(
-            Task.select().where(Task.user_id == user_id))))
-
-    def assigned(self, user_id):
-        return list(map(self.to_task_instance, list(
-            Task.select().where(Task.assigned_user_id == user_id))))
+    def select_tasks(self, query, page=None):
+        """
+        Runs query that selects TASK_COLUMNS and returns list of tasks.
+        Rows are fetched as tuples and passed to Task.from_row directly without building peewee models.
+        If page (PageRequest from tmlib.storage.pagination module) is passed, returns Page of tasks
+        """
 
-    def with_status(self, user_id, status):
-        return list(map(self.to_task_instance, list(
-            Task.select().where(Task.user_id == user_id, Task.status == status))))
+        if page is not None:
+            return paginate(query, TASK_COLUMNS, TASK_ORDERINGS, page, TaskInstance.from_row)
+        return list(map(TaskInstance.from_row, query.tuples()))
 
-    def can_read(self, user_id):
+    def get_by_id(self, task_id):
+        current = self.current_unit_of_work()
+        if current is not None and current.get_task(task_id) is not None:
+            return current.get_task(task_id)
+        row = Task.select(*TASK_COLUMNS).where(Task.id == task_id).tuples().first()
+        if row is None:
+            return None
+        task = TaskInstance.from_row(row)
+        if current is not None:
+            return current.register(task)
+        task.mark_clean()
+        return task
+
+    @_flushes_unit_of_work
+    @cached_read
+    def user_tasks(self, user_id, page=None):
+        return self.select_tasks(
+            Task.select(*TASK_COLUMNS).where(Task.user_id == user_id), page)
+
+    @_flushes_unit_of_work
+    @cached_read
+    def active(self, user_id, page=None):
+        """Returns user's tasks that aren't archived and aren't templates"""
+
+        return self.select_tasks(Task.select(*TASK_COLUMNS).where(
+            Task.user_id == user_id,
+            Task.status.not_in([Status.ARCHIVED.value, Status.TEMPLATE.value])), page)
+
+    @_flushes_unit_of_work
+    @cached_read
+    def with_category(self, user_id, category_id, page=None):
+        """Returns user's tasks with category with ID == category_id that aren't archived and aren't templates"""
+
+        return self.select_tasks(Task.select(*TASK_COLUMNS).where(
+            Task.user_id == user_id,
+            Task.category == category_id,
+            Task.status.not_in([Status.ARCHIVED.value, Status.TEMPLATE.value])), page)
+
+    @_flushes_unit_of_work
+    @cached_read
+    def assigned(self, user_id, page=None):
+        return self.select_tasks(
+            Task.select(*TASK_COLUMNS).where(Task.assigned_user_id == user_id), page)
+
+    @_flushes_unit_of_work
+    @cached_read
+    def with_status(self, user_id, status, page=None):
+        return self.select_tasks(
+            Task.select(*TASK_COLUMNS).where(Task.user_id == user_id, Task.status == status), page)
+
+    @_flushes_unit_of_work
+    @cached_read
+    def can_read(self, user_id, page=None):
         """Returns tasks that user can read"""
 
-        return list(map(self.to_task_instance, list(Task.select().join(UsersReadTasks).where(
-            UsersReadTasks.task_id == Task.id, UsersReadTasks.user_id == user_id))))
+        return self.select_tasks(Task.select(*TASK_COLUMNS).join(UsersReadTasks).where(
+            UsersReadTasks.task_id == Task.id, UsersReadTasks.user_id == user_id), page)
 
-    def can_write(self, user_id):
+    @_flushes_unit_of_work
+    @cached_read
+    def can_write(self, user_id, page=None):
         """Returns tasks that user can read and change"""
 
-        return list(map(self.to_task_instance, list(Task.select().join(UsersWriteTasks).where(
-            UsersWriteTasks.task_id == Task.id, UsersWriteTasks.user_id == user_id))))
+        return self.select_tasks(Task.select(*TASK_COLUMNS).join(UsersWriteTasks).where(
+            UsersWriteTasks.task_id == Task.id, UsersWriteTasks.user_id == user_id), page)
+
+    @_flushes_unit_of_work
+    def inner(self, task_id, recursive=False, max_depth=None):
+        """
+        Returns inner tasks for task with ID == task_id.
+        If recursive is True, returns all tasks from subtree (level by level) but not deeper than max_depth
+        """
 
-    def inner(self, task_id, recursive=False):
-        """Returns inner tasks for task with ID == task_id"""
         if recursive:
-            queue = deque()
-            queue.append(self.get_by_id(task_id))
-            inner_tasks = []
-            return self.recursive_inner(queue, inner_tasks)
+            return [node.task for node in self.iter_subtree(task_id, max_depth)]
 
-        return list(map(self.to_task_instance, list(
-            Task.select().where(Task.parent_task_id == task_id))))
+        return self.select_tasks(
+            Task.select(*TASK_COLUMNS).where(Task.parent_task_id == task_id))
 
-    def recursive_inner(self, queue, inner_tasks):
-        """
-        Returns all inner tasks using BFS
-        """
+    @_flushes_unit_of_work
+    def subtree(self, task_id, max_depth=None):
+        """Returns list of SubtreeNode for all inner tasks of task with ID == task_id"""
 
-        if not queue:
-            return inner_tasks
+        return list(self.iter_subtree(task_id, max_depth))
 
-        task = queue.popleft()
-        for inner_task in self.inner(task.id):
-            inner_tasks.append(inner_task)
-            queue.append(inner_task)
+    @_flushes_unit_of_work
+    def iter_subtree(self, task_id, max_depth=None):
+        """
+        Yields SubtreeNode for every inner task of task with ID == task_id level by level.
+        Whole subtree is selected by one recursive query and rows are decoded while they are fetched.
+        Depth of direct inner tasks is 1. Path contains IDs of tasks from task with ID == task_id to inner task
+        """
 
-        return self.recursive_inner(queue, inner_tasks)
+        for row in self._subtree_query(task_id, max_depth).tuples().iterator():
+            yield SubtreeNode(
+                task=TaskInstance.from_row(row[:-2]),
+                depth=row[-2],
+                path=tuple(int(id) for id in row[-1].split('/')))
+
+    def _subtree_query(self, task_id, max_depth):
+        base = (Task
+                .select(
+                    Task.id,
+                    Value(1).alias('depth'),
+                    (Task.parent_task_id.cast('TEXT').concat('/').concat(Task.id)).alias('path'))
+                .where(Task.parent_task_id == task_id)
+                .cte('subtree', recursive=True, columns=('id', 'depth', 'path')))
+        InnerTask = Task.alias()
+        recursive_part = (InnerTask
+                          .select(
+                              InnerTask.id,
+                              base.c.depth + 1,
+                              base.c.path.concat('/').concat(InnerTask.id))
+                          .join(base, on=(InnerTask.parent_task_id == base.c.id))
+                          .where(fn.instr(  # protects from cycles
+                              Value('/').concat(base.c.path).concat('/'),
+                              Value('/').concat(InnerTask.id).concat('/')) == 0))
+        if max_depth is not None:
+            recursive_part = recursive_part.where(base.c.depth < max_depth)
+        subtree = base.union_all(recursive_part)
+        return (Task
+                .select(*TASK_COLUMNS, subtree.c.depth, subtree.c.path)
+                .join(subtree, on=(Task.id == subtree.c.id))
+                .with_cte(subtree)
+                .order_by(subtree.c.depth, Task.id))
 
     def add_user_for_read(self, user_id, task_id):
         """Allows user with ID == user_id to read task with ID == task_id"""
 
-        if UsersReadTasks.select().where(
-                UsersReadTasks.task_id == task_id,
-                UsersReadTasks.user_id == user_id).count() == 0:
-            UsersReadTasks.create(user_id=user_id, task_id=task_id)
+        self._forget_access_levels([task_id])
+        UsersReadTasks.insert(
+            user_id=user_id, task_id=task_id).on_conflict_ignore().execute()
+        self._send(UsersReadTasks, Action.CREATED, [task_id], user_ids=self._task_users([task_id]))
 
     def add_user_for_write(self, user_id, task_id):
         """Allows user with ID == user_id to read and change task with ID == task_id"""
 
-        if UsersWriteTasks.select().where(
-                UsersWriteTasks.task_id == task_id,
-                UsersWriteTasks.user_id == user_id).count() == 0:
-            UsersWriteTasks.create(user_id=user_id, task_id=task_id)
+        self._forget_access_levels([task_id])
+        UsersWriteTasks.insert(
+            user_id=user_id, task_id=task_id).on_conflict_ignore().execute()
+        self._send(UsersWriteTasks, Action.CREATED, [task_id], user_ids=self._task_users([task_id]))
 
     def remove_user_for_read(self, user_id, task_id):
         """Removes permission to read task with ID == task_id from user with ID == user_id"""
 
+        self._forget_access_levels([task_id])
+        user_ids = self._task_users([task_id])
         UsersReadTasks.delete().where(
             UsersReadTasks.user_id == user_id,
             UsersReadTasks.task_id == task_id).execute()
+        self._send(UsersReadTasks, Action.DELETED, [task_id], user_ids=user_ids)
 
     def remove_all_users_for_read(self, task_id):
+        self._forget_access_levels([task_id])
+        user_ids = self._task_users([task_id])
         UsersReadTasks.delete().where(
             UsersReadTasks.task_id == task_id).execute()
+        self._send(UsersReadTasks, Action.DELETED, [task_id], user_ids=user_ids)
 
     def remove_user_for_write(self, user_id, task_id):
         """Removes permission to read and change task with ID == task_id from user with ID == user_id"""
 
+        self._forget_access_levels([task_id])
+        user_ids = self._task_users([task_id])
         UsersWriteTasks.delete().where(
             UsersWriteTasks.user_id == user_id,
             UsersWriteTasks.task_id == task_id).execute()
+        self._send(UsersWriteTasks, Action.DELETED, [task_id], user_ids=user_ids)
 
     def remove_all_users_for_write(self, task_id):
+        self._forget_access_levels([task_id])
+        user_ids = self._task_users([task_id])
         UsersWriteTasks.delete().where(
             UsersWriteTasks.task_id == task_id).execute()
+        self._send(UsersWriteTasks, Action.DELETED, [task_id], user_ids=user_ids)
 
+    def set_acl(self, task_ids, readers, writers):
+        """
+        Makes users with IDs from readers the only users that can read tasks with IDs from task_ids
+        and users with IDs from writers the only users that can read and change them.
+        Compares new users with current ones and writes only the difference in one transaction
+        """
+
+        task_ids = [int(task_id) for task_id in task_ids]
+        self._forget_access_levels(task_ids)
+        user_ids = self._task_users(task_ids, set(readers) | set(writers))
+        with self.database.atomic():
+            self._replace_rights(UsersReadTasks, task_ids, readers)
+            self._replace_rights(UsersWriteTasks, task_ids, writers)
+            self._send(UsersReadTasks, Action.UPDATED, task_ids, user_ids=user_ids)
+            self._send(UsersWriteTasks, Action.UPDATED, task_ids, user_ids=user_ids)
+
+    def _forget_access_levels(self, task_ids):
+        current = self.current_unit_of_work()
+        if current is not None:
+            current.forget(task_ids)
+
+    def _replace_rights(self, model, task_ids, user_ids):
+        user_ids = {int(user_id) for user_id in user_ids}
+        current_rights = {}
+        for chunk in _chunks(task_ids):
+            query = (model
+                     .select(model.id, model.task, model.user_id)
+                     .where(model.task.in_(chunk))
+                     .tuples())
+            for right_id, task_id, user_id in query:
+                current_rights[(task_id, user_id)] = right_id
+        removed_rights = [right_id for (task_id, user_id), right_id in current_rights.items()
+                          if user_id not in user_ids]
+        new_rights = [{model.task: task_id, model.user_id: user_id}
+                      for task_id in task_ids for user_id in user_ids
+                      if (task_id, user_id) not in current_rights]
+        for chunk in _chunks(removed_rights):
+            model.delete().where(model.id.in_(chunk)).execute()
+        for chunk in _chunks(new_rights, SQLITE_MAX_VARIABLES // 2):
+            model.insert_many(chunk).on_conflict_ignore().execute()
+
+    @_flushes_unit_of_work
     def get_users_can_read_task(self, task_id):
         users_list = list(UsersReadTasks.select(
             UsersReadTasks.user_id).where(UsersReadTasks.task_id == task_id))
         return [element.user_id for element in users_list]
 
+    @_flushes_unit_of_work
     def get_users_can_write_task(self, task_id):
         users_list = list(UsersWriteTasks.select(
             UsersWriteTasks.user_id).where(UsersWriteTasks.task_id == task_id))
         return [element.user_id for element in users_list]
 
+    @_flushes_unit_of_work
     def user_can_read(self, user_id, task_id):
         """
         Returns True if user with ID == user_id can read task with ID == task_id.
@@ -175,6 +689,7 @@ class TaskStorage(DatabaseConnector):
             UsersReadTasks.task_id == task_id,
             UsersReadTasks.user_id == user_id).count() == 1
 
+    @_flushes_unit_of_work
     def user_can_write(self, user_id, task_id):
         """
         Returns True if user with ID == user_id can read and change task with ID == task_id.
@@ -185,19 +700,288 @@ class TaskStorage(DatabaseConnector):
             UsersWriteTasks.task_id == task_id,
             UsersWriteTasks.user_id == user_id).count() == 1
 
-    def filter(self, *args):
+    def access_level(self, user_id, task_id):
+        """Returns AccessLevel of user with ID == user_id for task with ID == task_id using one query"""
+
+        current = self.current_unit_of_work()
+        if current is not None and current.get_access_level(user_id, task_id) is not None:
+            return current.get_access_level(user_id, task_id)
+        return self.get_with_access_level(user_id, task_id)[1]
+
+    def get_with_access_level(self, user_id, task_id):
+        """
+        Returns tuple (task, AccessLevel of user with ID == user_id) for task with ID == task_id using one query.
+        If task doesn't exist returns (None, AccessLevel.NONE)
+        """
+
+        if user_id is None:
+            return None, AccessLevel.NONE
+        current = self.current_unit_of_work()
+        if current is not None:
+            task = current.get_task(task_id)
+            access_level = current.get_access_level(user_id, task_id)
+            if task is not None and access_level is not None:
+                return task, access_level
+            current.flush()
+        row = (Task
+               .select(*TASK_COLUMNS, self._access_level_expression(user_id))
+               .where(Task.id == task_id)
+               .tuples()
+               .first())
+        if row is None:
+            return None, AccessLevel.NONE
+        task, access_level = TaskInstance.from_row(row[:-1]), AccessLevel(row[-1])
+        if current is not None:
+            task = current.register(task)
+            current.register_access_level(user_id, task_id, access_level)
+        else:
+            task.mark_clean()
+        return task, access_level
+
+    @_flushes_unit_of_work
+    def access_levels(self, user_id, task_ids):
+        """
+        Returns dictionary {task_id: AccessLevel} of user with ID == user_id for all passed task IDs.
+        Uses one query per SQLITE_MAX_VARIABLES task IDs. Nonexistent tasks get AccessLevel.NONE
+        """
+
+        task_ids = list({int(task_id) for task_id in task_ids})
+        access_levels = {task_id: AccessLevel.NONE for task_id in task_ids}
+        if user_id is None:
+            return access_levels
+        for chunk in _chunks(task_ids, SQLITE_MAX_VARIABLES - 10):  # leave place for user_id parameters
+            query = (Task
+                     .select(Task.id, self._access_level_expression(user_id))
+                     .where(Task.id.in_(chunk))
+                     .tuples())
+            for task_id, access_level in query:
+                access_levels[task_id] = AccessLevel(access_level)
+        return access_levels
+
+    def titles(self, user_id, task_ids):
+        """
+        Returns dictionary {task_id: title} for passed tasks that user with ID == user_id can read.
+        Uses one query per SQLITE_MAX_VARIABLES task IDs
+        """
+
+        task_ids = list({int(task_id) for task_id in task_ids if task_id is not None})
+        titles = {}
+        for chunk in _chunks(task_ids, SQLITE_MAX_VARIABLES - 10):  # leave place for user_id parameters
+            titles.update(Task.select(Task.id, Task.title).where(
+                Task.id.in_(chunk),
+                self._access_level_expression(user_id) >= AccessLevel.READ.value).tuples())
+        return titles
+
+    def _access_level_expression(self, user_id):
+        """SQL expression that evaluates access level of user with ID == user_id for selected task"""
+
+        def has_right(model):
+            return fn.EXISTS(model.select(SQL('1')).where(
+                model.task == Task.id, model.user_id == user_id))
+
+        return Case(None, (
+            (Task.user_id == user_id, AccessLevel.OWNER.value),
+            (Task.assigned_user_id == user_id, AccessLevel.ASSIGNEE.value),
+            (has_right(UsersWriteTasks), AccessLevel.WRITE.value),
+            (has_right(UsersReadTasks), AccessLevel.READ.value)),
+            AccessLevel.NONE.value)
+
+    @_flushes_unit_of_work
+    def search(self, user_id, text, limit=20):
+        """
+        Searches words from text in titles and notes of tasks that user with ID == user_id can read.
+        Returns list of SearchResult(task, rank, snippet) ordered by relevance, matches in title go first.
+        Rank is bm25 score, so smaller rank means better match. Found words are marked with [] in snippet.
+        If database has no FTS5 index, tasks are searched with LIKE and aren't ranked
+        """
+
+        match = _match_expression(text)
+        if match is None:
+            return []
+        visible = self._access_level_expression(user_id) >= AccessLevel.READ.value
+        if not self.engine.has_search_index:
+            return self._search_without_index(text, visible, limit)
+        rank = fn.bm25(TaskSearch.task_search, *SEARCH_WEIGHTS).coerce(False)
+        snippet = fn.snippet(TaskSearch.task_search, -1, '[', ']', '...', SEARCH_SNIPPET_TOKENS)
+        query = (Task
+                 .select(*TASK_COLUMNS, rank, snippet)
+                 .join(TaskSearch, on=(TaskSearch.rowid == Task.id))
+                 .where(Expression(TaskSearch.task_search, 'MATCH', match), visible)
+                 .order_by(rank, Task.id)
+                 .limit(limit)
+                 .tuples())
+        return [SearchResult(TaskInstance.from_row(row[:-2]), row[-2], row[-1]) for row in query]
+
+    def _search_without_index(self, text, visible, limit):
+        words = text.split()
+        matches = [Task.title.contains(word) | Task.note.contains(word) for word in words]
+        query = (Task
+                 .select(*TASK_COLUMNS)
+                 .where(visible, *matches)
+                 .order_by(Task.id)
+                 .limit(limit)
+                 .tuples())
+        return [SearchResult(task, 0.0, task.note or task.title)
+                for task in map(TaskInstance.from_row, query)]
+
+    @_flushes_unit_of_work
+    @cached_read
+    def tasks_in_window(self, user_id, start, end, include_shared=True, plan_id=None):
+        """
+        Returns tasks which time overlaps window [start, end) ordered by time.
+        Task's time is interval from start_time to end_time. Task with only one of them is point in time,
+        tasks without both, archived tasks and templates are never returned.
+        If include_shared is True, returns all tasks that user with ID == user_id can read, otherwise only
+        tasks created by user. If plan_id is passed, returns only tasks of this plan.
+        Stored tasks are found by R*Tree index, so query doesn't depend on number of tasks outside of window.
+        Occurrences of virtual plans that weren't stored are merged into result, they have no ID
+        """
+
+        starts_at = fn.COALESCE(Task.start_time, Task.end_time)
+        ends_at = fn.COALESCE(Task.end_time, Task.start_time)
+        if self.engine.has_window_index:
+            # CROSS JOIN makes SQLite search index first instead of scanning user's tasks.
+            # Index stores whole seconds, so window is widened to whole seconds too
+            query = TaskWindow.select(*TASK_COLUMNS).join(Task, JOIN.CROSS).where(
+                TaskWindow.id == Task.id,
+                TaskWindow.starts_at <= math.ceil(_seconds_since_epoch(end)),
+                TaskWindow.ends_at >= math.floor(_seconds_since_epoch(start)))
+        else:
+            query = Task.select(*TASK_COLUMNS)
+        query = query.where(
+            starts_at < end, ends_at >= start, self._visible(user_id, include_shared),
+            Task.status.not_in([Status.ARCHIVED.value, Status.TEMPLATE.value]))
+        if plan_id is not None:
+            query = query.where(Task.plan_id == plan_id)
+        tasks = self.select_tasks(query.order_by(starts_at, Task.id))
+        occurrences = self.virtual_occurrences(user_id, start, end, include_shared, plan_id)
+        if not occurrences:
+            return tasks
+        return sorted(tasks + occurrences, key=lambda task: (
+            task.start_time or task.end_time, task.id is None, task.id or 0))
+
+    def _visible(self, user_id, include_shared):
+        if include_shared:
+            return self._access_level_expression(user_id) >= AccessLevel.READ.value
+        return Task.user_id == user_id
+
+    def _virtual_plans(self, user_id, include_shared, plan_id=None):
+        """Returns list of (plan, template task) for virtual plans which templates user can read"""
+
+        # task_plan_storage module imports this one
+        from tmlib.storage.task_plan_storage import TASK_PLAN_COLUMNS
+
+        query = (TaskPlan
+                 .select(*TASK_PLAN_COLUMNS, *TASK_COLUMNS)
+                 .join(Task, on=(TaskPlan.task == Task.id))
+                 .where(TaskPlan.is_virtual == True, self._visible(user_id, include_shared)))
+        if plan_id is not None:
+            query = query.where(TaskPlan.id == plan_id)
+        plan_columns_count = len(TASK_PLAN_COLUMNS)
+        return [(TaskPlanInstance.from_row(row[:plan_columns_count]),
+                 TaskInstance.from_row(row[plan_columns_count:]))
+                for row in query.tuples()]
+
+    def virtual_occurrences(self, user_id, start, end, include_shared=True, plan_id=None):
+        """
+        Returns occurrences of virtual plans that overlap window [start, end) and weren't stored or cancelled.
+        Occurrence is copy of plan's template task that is moved to occurrence's time and has no ID
+        """
+
+        occurrences = []
+        for plan, template_task in self._virtual_plans(user_id, include_shared, plan_id):
+            duration = _duration(template_task)
+            occurrences.extend(
+                _occurrence(plan, template_task, time)
+                for time in plan.occurrences(start - duration, end))
+        if not occurrences:
+            return occurrences
+        stored = set()
+        first_time = min(task.occurrence_at for task in occurrences)
+        for chunk in _chunks(list({task.plan_id for task in occurrences})):
+            stored.update(Task.select(Task.plan_id, Task.occurrence_at).where(
+                Task.plan_id.in_(chunk),
+                Task.occurrence_at >= first_time,
+                Task.occurrence_at < end).tuples())
+            stored.update(CancelledOccurrence.select(
+                CancelledOccurrence.plan, CancelledOccurrence.occurrence_at).where(
+                CancelledOccurrence.plan.in_(chunk),
+                CancelledOccurrence.occurrence_at >= first_time,
+                CancelledOccurrence.occurrence_at < end).tuples())
+        return [task for task in occurrences
+                if (task.plan_id, task.occurrence_at) not in stored]
+
+    def get_occurrence(self, user_id, plan_id, occurrence_at):
+        """
+        Returns tuple (task, AccessLevel of user with ID == user_id) for occurrence of plan with ID == plan_id
+        at occurrence_at. Stored occurrence is returned if there is one. Otherwise virtual occurrence is returned
+        with user's AccessLevel for plan's template task.
+        If plan isn't virtual, doesn't occur at this time or occurrence was cancelled returns (None, AccessLevel.NONE)
+        """
+
+        row = Task.select(Task.id).where(
+            Task.plan_id == plan_id, Task.occurrence_at == occurrence_at).tuples().first()
+        if row is not None:
+            return self.get_with_access_level(user_id, row[0])
+        plans = self._virtual_plans(user_id, include_shared=True, plan_id=plan_id)
+        if not plans:
+            return None, AccessLevel.NONE
+        plan, template_task = plans[0]
+        if not plan.occurs_at(occurrence_at):
+            return None, AccessLevel.NONE
+        if CancelledOccurrence.select().where(
+                CancelledOccurrence.plan == plan_id, CancelledOccurrence.occurrence_at == occurrence_at).exists():
+            return None, AccessLevel.NONE
+        return (_occurrence(plan, template_task, occurrence_at),
+                self.access_level(user_id, template_task.id))
+
+    @_flushes_unit_of_work
+    def materialize(self, task):
+        """
+        Stores virtual occurrence of plan and returns stored task. Stored task gets rights of plan's template task.
+        If occurrence was already stored, returns stored task
+        """
+
+        if not task.is_virtual:
+            return task
+        now = datetime.datetime.now()
+        with self.database.atomic():
+            Task.insert(self._to_row(task, now)).on_conflict_ignore().execute()
+            row = Task.select(*TASK_COLUMNS).where(
+                Task.plan_id == task.plan_id, Task.occurrence_at == task.occurrence_at).tuples().first()
+            stored_task = TaskInstance.from_row(row)
+            if stored_task.created_at == now:  # rights aren't copied again if occurrence was already stored
+                template_task_id = TaskPlan.select(TaskPlan.task).where(TaskPlan.id == task.plan_id)
+                for model in (UsersReadTasks, UsersWriteTasks):
+                    model.insert_from(
+                        model.select(model.user_id, Value(stored_task.id)).where(
+                            model.task == template_task_id),
+                        fields=[model.user_id, model.task]).execute()
+                self._send(Task, Action.CREATED, [stored_task.id], user_ids=self._task_users([stored_task.id]))
+        current = self.current_unit_of_work()
+        if current is not None:
+            return current.register(stored_task)
+        stored_task.mark_clean()
+        return stored_task
+
+    def filter(self, *args, page=None):
         """
         Before usage you should import Task from tmlib.storage.storage_models module.
         Then you can pass filter query.
         If you want to filter multiple fields use bitwise operators (& and |) rather than logical operators (and and or).
+        Returns lazy TaskQuery or Page of tasks if page is passed.
 
         Example:
         filter(Task.title.contains('title') & Task.created_at > datetime.datetime.now())
         """
 
-        return list(map(self.to_task_instance,
-                        list(Task.select().where(args))))
+        query = TaskQuery(self, Task.select(*TASK_COLUMNS).where(*args))
+        if page is not None:
+            return query.page(page)
+        return query
 
+    @_flushes_unit_of_work
+    @cached_read
     def created_by_task_plan(self, user_id, plan_id):
-        return list(map(self.to_task_instance, list(Task.select().where(
-            Task.user_id == user_id, Task.plan_id == plan_id))))
+        return self.select_tasks(Task.select(*TASK_COLUMNS).where(
+            Task.user_id == user_id, Task.plan_id == plan_id))
@@ -0,0 +1,164 @@
+"""
+This module provides unit of work that caches tasks during one web request or one CLI command.
+
+Inside unit of work TaskStorage works as identity map: task with the same ID is loaded from database only once
+and then the same object is returned. Users' access levels for loaded tasks are remembered too.
+Updates of tasks are postponed: unit of work compares updated tasks with their loaded state and writes only
+changed fields of changed tasks, all in one transaction, when it's finished. Pending updates are also written
+before any other TaskStorage query, so queries always see actual data.
+
+    >>> with tasks_controller.unit_of_work():
+    ...     task = commands.get_task_by_id(tasks_controller, task_id)
+    ...     task.status = Status.DONE.value
+    ...     commands.update_task(tasks_controller, task)
+
+Unit of work belongs to current thread, so all storages working with the same database share it.
+If block is finished with exception, pending updates are discarded.
+"""
+
+
+import datetime
+import threading
+from contextlib import contextmanager
+from tmlib.storage.storage_models import Task
+from tmlib.storage.signals import Action, task_user_ids
+from tmlib.exceptions.exceptions import UnitOfWorkIsActiveError
+
+# task attributes that can be changed by TaskStorage.update
+TRACKED_FIELDS = (
+    'title',
+    'note',
+    'start_time',
+    'end_time',
+    'assigned_user_id',
+    'parent_task_id',
+    'is_event',
+    'category_id',
+    'priority',
+    'status')
+
+_local = threading.local()
+
+
+class UnitOfWork:
+    def __init__(self, database):
+        self.database = database
+        self.tasks = {}
+        self.access_levels = {}
+        self._dirty = {}
+
+    def get_task(self, task_id):
+        return self.tasks.get(_task_key(task_id))
+
+    def register(self, task):
+        """Adds loaded task to identity map. Returns object that is already mapped to its ID if there is one"""
+
+        if task is None:
+            return None
+        mapped_task = self.tasks.get(task.id)
+        if mapped_task is not None:
+            return mapped_task
+        self.tasks[task.id] = task
+        task.mark_clean()
+        return task
+
+    def get_access_level(self, user_id, task_id):
+        return self.access_levels.get((user_id, _task_key(task_id)))
+
+    def register_access_level(self, user_id, task_id, access_level):
+        self.access_levels[(user_id, _task_key(task_id))] = access_level
+
+    def forget(self, task_ids):
+        """Forgets remembered access levels for tasks with IDs from task_ids"""
+
+        task_ids = {_task_key(task_id) for task_id in task_ids}
+        self.access_levels = {
+            key: access_level for key, access_level in self.access_levels.items()
+            if key[1] not in task_ids}
+
+    def forget_task(self, task_id):
+        """Removes task with ID == task_id from identity map"""
+
+        task_id = _task_key(task_id)
+        self.tasks.pop(task_id, None)
+        self._dirty.pop(task_id, None)
+        self.forget([task_id])
+
+    def register_update(self, task):
+        """Postpones update of task until flush"""
+
+        task_id = _task_key(task.id)
+        self.tasks[task_id] = task
+        self._dirty[task_id] = task
+        self.forget([task_id])  # assigned user could be changed
+
+    def changed_fields(self, task):
+        """Returns dictionary {field: new value} of fields that were changed since task was loaded"""
+
+        return task.changed_fields(TRACKED_FIELDS)
+
+    def flush(self):
+        """Writes changed fields of all updated tasks in one transaction"""
+
+        if not self._dirty:
+            return
+        now = datetime.datetime.now()
+        changes = {task_id: self.changed_fields(task) for task_id, task in self._dirty.items()}
+        changes = {task_id: fields for task_id, fields in changes.items() if fields}
+        signals = self.database.signals
+        if signals:
+            # users that lose tasks are found before update, users that get them are in new fields
+            user_ids = {task_id: task_user_ids([task_id]) | {fields.get('assigned_user_id')}
+                        for task_id, fields in changes.items()}
+        with self.database.atomic():
+            for task_id, fields in changes.items():
+                task = self._dirty[task_id]
+                Task.update(updated_at=now, **fields).where(
+                    Task.id == task_id).execute()
+                task.updated_at = now
+                task.mark_clean()
+            if signals:
+                for task_id, fields in changes.items():
+                    signals.send_change(Task, Action.UPDATED, [task_id], fields, user_ids[task_id])
+        self._dirty.clear()
+
+    def discard(self):
+        """Drops pending updates"""
+
+        self._dirty.clear()
+
+
+def _task_key(task_id):
+    return int(task_id)
+
+
+def current_unit_of_work(database):
+    """Returns unit of work started in current thread for database or None"""
+
+    unit_of_work = getattr(_local, 'unit_of_work', None)
+    if unit_of_work is not None and unit_of_work.database is database:
+        return unit_of_work
+    return None
+
+
+@contextmanager
+def unit_of_work(database):
+    """
+    Starts unit of work for database in current thread and finishes it after block.
+    If unit of work for the same database is already started, block joins it.
+    Raises UnitOfWorkIsActiveError if unit of work for another database is started
+    """
+
+    active_unit_of_work = getattr(_local, 'unit_of_work', None)
+    if active_unit_of_work is not None:
+        if active_unit_of_work.database is not database:
+            raise UnitOfWorkIsActiveError(active_unit_of_work.database)
+        yield active_unit_of_work
+        return
+    _local.unit_of_work = UnitOfWork(database)
+    try:
+        yield _local.unit_of_work
+        _local.unit_of_work.flush()
+    finally:
+        _local.unit_of_work.discard()
+        _local.unit_of_work = None
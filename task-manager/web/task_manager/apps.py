@@ -1,5 +1,42 @@
 from django.apps import AppConfig
+from django.conf import settings
+
+# Django cache backends that keep entries in memory of one process
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache')
+
+
+def has_shared_cache():
+    """True if Django cache is shared by all processes, so entries can be invalidated by any of them"""
+
+    return settings.CACHES['default']['BACKEND'] not in LOCAL_CACHE_BACKENDS
+
+
+def create_read_cache():
+    """
+    Returns ReadCache over Django cache or None if lists shouldn't be cached. Lists are cached only in shared
+    cache backend, because scheduler and other web processes must bump data versions that this process reads
+    """
+
+    from django.core.cache import cache
+    from tmlib.storage.read_cache import ReadCache
+    if not settings.TASK_MANAGER_READ_CACHE_TIMEOUT:
+        return None
+    if not has_shared_cache():
+        return None
+    return ReadCache(cache, settings.TASK_MANAGER_READ_CACHE_TIMEOUT)
 
 
 class TaskManagerConfig(AppConfig):
     name = 'task_manager'
+
+    def ready(self):
+        # bootstrap shared task manager storage engine once per process
+        from tmlib.storage.engine import get_engine
+        from .context_processors import forget_changed_notifications
+        engine = get_engine(
+            settings.TASK_MANAGER_DATABASE_PATH,
+            settings.TASK_MANAGER_DATABASE_PROFILE)
+        engine.set_read_cache(create_read_cache())
+        engine.signals.connect(forget_changed_notifications, deferred=True)
@@ -0,0 +1,85 @@
+"""
+Context processors that add data shown on every page.
+
+Header shows pending notifications of user. If Django cache is shared by all processes, their summary is kept
+in it until something changes it: it's forgotten when storages send events about changed notifications, tasks
+or rights of user, and it expires when the next user's notification should be shown, because scheduler can make
+notifications pending in other process. Per-process cache isn't used, because other processes can't invalidate it.
+"""
+
+
+import datetime
+from collections import namedtuple
+from django.conf import settings
+from django.core.cache import cache
+from tmlib.controllers.notifications_controller import create_notifications_controller
+from tmlib.controllers.tasks_controller import create_tasks_controller
+from tmlib.storage.storage_models import Notification, Task, UsersReadTasks, UsersWriteTasks
+import tmlib.commands
+from .apps import has_shared_cache
+
+# seconds to wait before checking again if scheduler hasn't made due notification pending yet
+MIN_TIMEOUT = 5
+
+PendingNotification = namedtuple('PendingNotification', ['id', 'title', 'task_id', 'task_title'])
+PendingNotifications = namedtuple('PendingNotifications', ['count', 'items'])
+
+
+def _cache_key(user_id):
+    return 'task_manager:pending_notifications:{}'.format(user_id)
+
+
+def _load_pending_notifications(user_id):
+    """Returns tuple (PendingNotifications, seconds while they don't change by themselves)"""
+
+    notifications_controller = create_notifications_controller(user_id, settings.TASK_MANAGER_DATABASE_PATH)
+    count, notifications = tmlib.commands.pending_notifications_summary(
+        create_tasks_controller(user_id, settings.TASK_MANAGER_DATABASE_PATH),
+        notifications_controller,
+        settings.TASK_MANAGER_HEADER_NOTIFICATIONS)
+    summary = PendingNotifications(count, [
+        PendingNotification(notification.id, notification.title, notification.task_id, task_title)
+        for notification, task_title in notifications])
+    timeout = settings.TASK_MANAGER_NOTIFICATIONS_CACHE_TIMEOUT
+    next_fire_at = tmlib.commands.next_notification_time(notifications_controller)
+    if next_fire_at is not None:
+        seconds = (next_fire_at - datetime.datetime.now()).total_seconds()
+        timeout = min(timeout, max(seconds, MIN_TIMEOUT))
+    return summary, timeout
+
+
+def get_pending_notifications(user_id):
+    """Returns PendingNotifications(count, the first items with titles of their tasks) of user"""
+
+    if not has_shared_cache():
+        return _load_pending_notifications(user_id)[0]
+    key = _cache_key(user_id)
+    summary = cache.get(key)
+    if summary is None:
+        summary, timeout = _load_pending_notifications(user_id)
+        cache.set(key, summary, timeout)
+    return summary
+
+
+def forget_pending_notifications(user_ids):
+    """Removes cached pending notifications of users, call it after changing their notifications or tasks"""
+
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
+
+
+def forget_changed_notifications(event):
+    """
+    Receiver of storage change events, forgets pending notifications of users whose notifications, tasks
+    or rights changed. Rights decide which titles of tasks are shown
+    """
+
+    if event.model in (Notification, Task, UsersReadTasks, UsersWriteTasks):
+        forget_pending_notifications(event.user_ids)
+
+
+def pending_notifications(request):
+    if not request.user.is_authenticated:
+        return {}
+    summary = get_pending_notifications(request.user.id)
+    return {'pending_notifications': summary.items,
+            'pending_notifications_count': summary.count}
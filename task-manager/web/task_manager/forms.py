@@ -26,7 +26,7 @@ class TaskForm(forms.Form):
             create_tasks_controller(
                 user_id,
                 settings.TASK_MANAGER_DATABASE_PATH),
-            (Task.status != Status.TEMPLATE.value) & (Task.user_id == user_id))
+            (Task.status != Status.TEMPLATE.value) & (Task.user_id == user_id)).only('title')
         tasks_tuple = [(task.id, task.title) for task in tasks]
         tasks_tuple.insert(0, ('', '---------'))  # required for default value
         self.fields['category'] = forms.ChoiceField(
@@ -96,7 +96,7 @@ class PlanForm(forms.Form):
         tasks = tmlib.commands.filter_tasks(
             create_tasks_controller(
                 user_id, settings.TASK_MANAGER_DATABASE_PATH),
-            (Task.status == Status.TEMPLATE.value) & (Task.user_id == user_id))
+            (Task.status == Status.TEMPLATE.value) & (Task.user_id == user_id)).only('title')
         tasks_tuple = [(task.id, task.title) for task in tasks]
         self.fields['task_template'] = forms.ChoiceField(
             choices=tasks_tuple)
@@ -104,9 +104,18 @@ class PlanForm(forms.Form):
     task_template = forms.ChoiceField(required=False)
     interval = forms.CharField(
         max_length=50,
+        required=False,
         widget=forms.TextInput(
             attrs={
                 'placeholder': '1 day'}))
+    rule = forms.CharField(
+        max_length=100,
+        required=False,
+        help_text="Cron-style rule 'minute hour day month weekday' instead of interval. "
+                  "E.g. '0 10 * * 1-5' for every weekday at 10:00",
+        widget=forms.TextInput(
+            attrs={
+                'placeholder': '0 10 * * 1-5'}))
     last_created_at = forms.DateTimeField(
         widget=DateTimePicker(
             options={
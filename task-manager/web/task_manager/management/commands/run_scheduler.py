@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from tmlib.scheduler import Scheduler, BATCH_SIZE, MAX_SLEEP
+from tmlib.exceptions.exceptions import SchedulerIsRunningError
+from task_manager.apps import create_read_cache
+
+
+class Command(BaseCommand):
+    help = 'Promotes due notifications and creates tasks from due task plans until it is stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='number of notifications or plans processed in one transaction')
+        parser.add_argument(
+            '--max-sleep',
+            type=int,
+            default=MAX_SLEEP,
+            help='maximal number of seconds between checks of database')
+        parser.add_argument(
+            '--catch-up',
+            action='store_true',
+            help='creates task for every missed interval of task plan instead of only one')
+
+    def handle(self, *args, **options):
+        scheduler = Scheduler(
+            settings.TASK_MANAGER_DATABASE_PATH,
+            batch_size=options['batch_size'],
+            max_sleep=options['max_sleep'],
+            catch_up=options['catch_up'],
+            read_cache=create_read_cache())
+        self.stdout.write('Scheduler is running, press Ctrl+C to stop it')
+        try:
+            scheduler.run()
+        except SchedulerIsRunningError as error:
+            raise CommandError(str(error))
+        except KeyboardInterrupt:
+            scheduler.stop()
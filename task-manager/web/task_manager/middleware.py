@@ -0,0 +1,21 @@
+from django.conf import settings
+from tmlib.storage.engine import get_engine
+from tmlib.storage.unit_of_work import unit_of_work
+
+
+class UnitOfWorkMiddleware:
+    """
+    Wraps every request in task manager unit of work, so tasks loaded by views are cached during request
+    and their updates are written in one transaction after view. Updates are discarded if view fails
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        engine = get_engine(settings.TASK_MANAGER_DATABASE_PATH)
+        with unit_of_work(engine.database) as current:
+            response = self.get_response(request)
+            if response.status_code >= 500:
+                current.discard()
+        return response
@@ -0,0 +1,11 @@
+from django import template
+
+
+register = template.Library()
+
+
+@register.filter
+def name_of(names, id):
+    """Usage: {{ category_names|name_of:task.category_id }}. Names are prefetched by view"""
+
+    return names.get(id)
@@ -29,10 +29,13 @@ tasks_patterns = [
     url(r'^assigned/$', views.assigned_tasks, name='assigned_tasks'),
     url(r'^can_read/$', views.can_read_tasks, name='can_read_tasks'),
     url(r'^can_write/$', views.can_write_tasks, name='can_write_tasks'),
+    url(r'^search/$', views.search_tasks, name='search_tasks'),
+    url(r'^calendar/$', views.calendar, name='calendar'),
     url(r'^category/(?P<id>[0-9]+)/$', views.tasks_by_category, name='tasks_by_category'),
     url(r'^status/(?P<id>[0-9]+)/$', views.tasks_by_status, name='tasks_by_status'),
     url(r'^priority/(?P<id>[0-9]+)/$', views.tasks_by_priority, name='tasks_by_priority'),
     url(r'^plan/(?P<id>[0-9]+)/$', views.tasks_by_plan, name='tasks_by_plan'),
+    url(r'^plan/(?P<id>[0-9]+)/occurrence/(?P<time>[0-9T:.\-]+)/$', views.task_occurrence, name='task_occurrence'),
 ]
 
 notifications_patterns = [
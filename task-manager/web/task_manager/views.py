@@ -1,4 +1,6 @@
 import datetime
+from django.utils.http import urlencode
+from django.utils.dateparse import parse_date, parse_datetime
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
@@ -10,11 +12,21 @@ from tmlib.controllers.tasks_controller import create_tasks_controller
 from tmlib.controllers.notifications_controller import create_notifications_controller
 from tmlib.controllers.task_plans_controller import create_task_plans_controller
 from tmlib.models.category import Category
-from tmlib.models.task import Task, Status, Priority
+from tmlib.models.task import Task, Status, Priority, AccessLevel
 from tmlib.models.notification import Notification, Status as NotificationStatus
 from tmlib.models.task_plan import TaskPlan
 from tmlib.storage.storage_models import Task as TaskFilter
-from tmlib.exceptions.exceptions import InvalidTaskTimeError
+from tmlib.storage.pagination import PageRequest
+from tmlib.storage.task_storage import TASK_ORDERINGS
+from tmlib.storage.notification_storage import NOTIFICATION_ORDERINGS
+from tmlib.models.validator import validate_task_plan_rule
+from tmlib.exceptions.exceptions import (
+    InvalidTaskTimeError,
+    UnknownOrderingError,
+    InvalidCursorError,
+    UserHasNoRightError,
+    InvalidRecurrenceRuleError,
+    InvalidTaskPlanIntervalError)
 import tmlib.commands
 from pytimeparse import parse
 from .forms import CategoryForm, TaskForm, TaskFormWithoutStatus, NotificationForm, PlanForm
@@ -28,8 +40,7 @@ def home(request):
         username = request.user.username
     return render(
         request, 'home.html',
-        {'username': username,
-         'pending_notifications': _get_pending_notifications(request.user.id)})
+        {'username': username})
 
 
 def signup(request):
@@ -54,8 +65,7 @@ def users(request):
                   'users/index.html',
                   {'users': users,
                    'user': request.user,
-                   'nav_bar': 'users',
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'nav_bar': 'users'})
 
 
 def _create_categories_controller(user_id):
@@ -78,18 +88,57 @@ def _create_notifications_controller(user_id):
         user_id, settings.TASK_MANAGER_DATABASE_PATH)
 
 
-def _get_pending_notifications(user_id):
-    notifications_controller = _create_notifications_controller(user_id)
-    return tmlib.commands.pending_notifications(notifications_controller)
+def _get_access_levels(user_id, task_ids):
+    tasks_controller = _create_tasks_controller(user_id)
+    return tmlib.commands.get_tasks_access_levels(tasks_controller, task_ids)
 
 
-def process_plans(function):
-    def wrap(request, *args, **kwargs):
-        _create_task_plans_controller(
-            request.user.id).process_plans(_create_tasks_controller(
-                request.user.id))
-        return function(request, *args, **kwargs)
-    return wrap
+def _get_category_names(user_id, tasks):
+    return tmlib.commands.get_category_names(
+        _create_categories_controller(user_id), [task.category_id for task in tasks])
+
+
+def _get_task_titles(user_id, task_ids):
+    return tmlib.commands.get_task_titles(_create_tasks_controller(user_id), task_ids)
+
+
+def _get_page(request, list_command, *args):
+    """
+    Calls list command with page requested by GET parameters order_by, page_size, cursor and descending.
+    Returns tuple (page, page request). Invalid parameters give the first page
+    """
+
+    try:
+        page_request = PageRequest(
+            order_by=request.GET.get('order_by', 'id'),
+            page_size=request.GET.get('page_size', settings.TASK_MANAGER_PAGE_SIZE),
+            cursor=request.GET.get('cursor'),
+            descending=request.GET.get('descending') == '1')
+        return list_command(*args, page=page_request), page_request
+    except (ValueError, UnknownOrderingError, InvalidCursorError):
+        page_request = PageRequest(page_size=settings.TASK_MANAGER_PAGE_SIZE)
+        return list_command(*args, page=page_request), page_request
+
+
+def _pagination(page, page_request, orderings):
+    """Returns context for pagination.html template: links to previous and next pages and to other orderings"""
+
+    def url(**changes):
+        parameters = {
+            'order_by': page_request.order_by,
+            'page_size': page_request.page_size,
+            'descending': 1 if page_request.descending else None}
+        parameters.update(changes)
+        return '?' + urlencode(
+            {key: value for key, value in parameters.items() if value is not None})
+
+    return {
+        'prev_url': url(cursor=page.prev_cursor) if page.prev_cursor else None,
+        'next_url': url(cursor=page.next_cursor) if page.next_cursor else None,
+        'orderings': [(order_by, url(order_by=order_by), order_by == page_request.order_by)
+                      for order_by in orderings],
+        'descending': page_request.descending,
+        'reverse_url': url(descending=None if page_request.descending else 1)}
 
 
 @login_required
@@ -100,8 +149,7 @@ def categories(request):
                   'categories/index.html',
                   {'categories': categories,
                    'user': request.user,
-                   'nav_bar': 'categories',
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'nav_bar': 'categories'})
 
 
 @login_required
@@ -121,8 +169,7 @@ def create_category(request):
                   'categories/new.html',
                   {'form': form,
                    'user': request.user,
-                   'nav_bar': 'categories',
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'nav_bar': 'categories'})
 
 
 @login_required
@@ -143,8 +190,7 @@ def edit_category(request, id):
                   'categories/edit.html',
                   {'form': form,
                    'user': request.user,
-                   'nav_bar': 'categories',
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'nav_bar': 'categories'})
 
 
 @login_required
@@ -156,58 +202,69 @@ def delete_category(request, id):
 
 
 @login_required
-@process_plans
 def tasks(request):
     tasks_controller = _create_tasks_controller(request.user.id)
-    tasks = tmlib.commands.filter_tasks(
-        tasks_controller,
-        (TaskFilter.status != Status.TEMPLATE.value) & (
-            TaskFilter.user_id == request.user.id) & (
-            TaskFilter.status != Status.ARCHIVED.value))
+    page, page_request = _get_page(
+        request,
+        tmlib.commands.active_tasks,
+        tasks_controller)
+    tasks = page.items
     return render(request,
                   'tasks/index.html',
                   {'tasks': tasks,
+                   'pagination': _pagination(page, page_request, TASK_ORDERINGS),
+                   'permissions': _get_access_levels(
+                       request.user.id, [task.id for task in tasks]),
+                   'category_names': _get_category_names(request.user.id, tasks),
                    'user': request.user,
                    'nav_bar': 'tasks',
-                   'header': 'My tasks',
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'header': 'My tasks'})
 
 
 @login_required
-@process_plans
 def tasks_by_category(request, id):
     tasks_controller = _create_tasks_controller(request.user.id)
-    tasks = tmlib.commands.filter_tasks(
-        tasks_controller, (TaskFilter.category_id == int(id)) & (
-            TaskFilter.user_id == request.user.id) & (
-            TaskFilter.status != Status.ARCHIVED.value) & (
-            TaskFilter.status != Status.TEMPLATE.value))
+    page, page_request = _get_page(
+        request,
+        tmlib.commands.tasks_with_category,
+        tasks_controller,
+        int(id))
+    tasks = page.items
     categories_controller = _create_categories_controller(request.user.id)
     category = tmlib.commands.get_category_by_id(categories_controller, id)
     query = '?category={}'.format(id)
     return render(request,
                   'tasks/index.html',
                   {'tasks': tasks,
+                   'pagination': _pagination(page, page_request, TASK_ORDERINGS),
+                   'permissions': _get_access_levels(
+                       request.user.id, [task.id for task in tasks]),
+                   'category_names': _get_category_names(request.user.id, tasks),
                    'user': request.user,
                    'nav_bar': 'tasks',
                    'header': 'Tasks with category "{}"'.format(category.name),
-                   'query': query,
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'query': query})
 
 
 @login_required
-@process_plans
 def tasks_by_status(request, id):
     tasks_controller = _create_tasks_controller(request.user.id)
-    tasks = tmlib.commands.filter_tasks(
-        tasks_controller, (TaskFilter.status == int(id)) & (
-            TaskFilter.user_id == request.user.id))
+    page, page_request = _get_page(
+        request,
+        tmlib.commands.tasks_with_status,
+        tasks_controller,
+        int(id))
+    tasks = page.items
     query = '?status={}'.format(id)
     return render(
         request,
         'tasks/index.html',
         {
             'tasks': tasks,
+            'pagination': _pagination(page, page_request, TASK_ORDERINGS),
+            'permissions': _get_access_levels(
+                request.user.id, [task.id for task in tasks]),
+            'category_names': _get_category_names(request.user.id, tasks),
             'user': request.user,
             'nav_bar': 'tasks',
             'header': 'Tasks with status <span class="badge badge-' + task_tags.get_status_badge_class(
@@ -215,101 +272,235 @@ def tasks_by_status(request, id):
                 Status(
                     int(id)).name),
             'query': query,
-            'status_id': id,
-            'pending_notifications': _get_pending_notifications(
-                request.user.id)})
+            'status_id': id})
 
 
 @login_required
-@process_plans
 def tasks_by_priority(request, id):
     tasks_controller = _create_tasks_controller(request.user.id)
-    tasks = tmlib.commands.filter_tasks(
-        tasks_controller, (TaskFilter.priority == int(id)) & (
+    page, page_request = _get_page(
+        request,
+        tmlib.commands.filter_tasks,
+        tasks_controller,
+        (TaskFilter.priority == int(id)) & (
             TaskFilter.user_id == request.user.id) & (
             TaskFilter.status != Status.ARCHIVED.value) & (
             TaskFilter.status != Status.TEMPLATE.value))
+    tasks = page.items
     query = '?priority={}'.format(id)
     return render(
         request,
         'tasks/index.html',
         {
             'tasks': tasks,
+            'pagination': _pagination(page, page_request, TASK_ORDERINGS),
+            'permissions': _get_access_levels(
+                request.user.id, [task.id for task in tasks]),
+            'category_names': _get_category_names(request.user.id, tasks),
             'user': request.user,
             'nav_bar': 'tasks',
             'header': 'Tasks with priority <span class="badge badge-' + task_tags.get_priority_badge_class(
                 int(id)) + '">{}</span>'.format(
                 Priority(
                     int(id)).name),
-            'query': query,
-            'pending_notifications': _get_pending_notifications(
-                request.user.id)})
+            'query': query})
 
 
 @login_required
-@process_plans
 def tasks_by_plan(request, id):
     tasks_controller = _create_tasks_controller(request.user.id)
-    tasks = tmlib.commands.filter_tasks(
-        tasks_controller, (TaskFilter.plan_id == int(id)) & (
+    page, page_request = _get_page(
+        request,
+        tmlib.commands.filter_tasks,
+        tasks_controller,
+        (TaskFilter.plan_id == int(id)) & (
             TaskFilter.user_id == request.user.id))
+    tasks = page.items
+    now = datetime.datetime.now()
+    occurrences = [task for task in tmlib.commands.plan_occurrences(
+        tasks_controller, int(id), now, now + datetime.timedelta(days=settings.TASK_MANAGER_PLAN_PREVIEW_DAYS))
+        if task.is_virtual]
     return render(request,
                   'tasks/index.html',
                   {'tasks': tasks,
+                   'occurrences': occurrences,
+                   'pagination': _pagination(page, page_request, TASK_ORDERINGS),
+                   'permissions': _get_access_levels(
+                       request.user.id, [task.id for task in tasks]),
+                   'category_names': _get_category_names(request.user.id, tasks),
                    'user': request.user,
                    'nav_bar': 'tasks',
-                   'header': 'Tasks created by plan with ID {}'.format(id),
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'header': 'Tasks created by plan with ID {}'.format(id)})
 
 
 @login_required
-@process_plans
 def assigned_tasks(request):
     tasks_controller = _create_tasks_controller(request.user.id)
-    tasks = tmlib.commands.assigned_tasks(tasks_controller)
+    page, page_request = _get_page(
+        request,
+        tmlib.commands.assigned_tasks,
+        tasks_controller)
+    tasks = page.items
     return render(request,
                   'tasks/index.html',
                   {'tasks': tasks,
+                   'pagination': _pagination(page, page_request, TASK_ORDERINGS),
+                   'permissions': _get_access_levels(
+                       request.user.id, [task.id for task in tasks]),
+                   'category_names': _get_category_names(request.user.id, tasks),
                    'user': request.user,
                    'nav_bar': 'tasks',
                    'header': 'Assigned on me tasks',
-                   'foreign_category': True,
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'foreign_category': True})
 
 
 @login_required
-@process_plans
 def can_read_tasks(request):
     tasks_controller = _create_tasks_controller(request.user.id)
-    tasks = tmlib.commands.can_read_tasks(tasks_controller)
+    page, page_request = _get_page(
+        request,
+        tmlib.commands.can_read_tasks,
+        tasks_controller)
+    tasks = page.items
     return render(request,
                   'tasks/index.html',
                   {'tasks': tasks,
+                   'pagination': _pagination(page, page_request, TASK_ORDERINGS),
+                   'permissions': _get_access_levels(
+                       request.user.id, [task.id for task in tasks]),
+                   'category_names': _get_category_names(request.user.id, tasks),
                    'user': request.user,
                    'nav_bar': 'tasks',
                    'header': 'Other tasks that I can read',
                    'view': 'can_read',
-                   'foreign_category': True,
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'foreign_category': True})
 
 
 @login_required
-@process_plans
 def can_write_tasks(request):
     tasks_controller = _create_tasks_controller(request.user.id)
-    tasks = tmlib.commands.can_write_tasks(tasks_controller)
+    page, page_request = _get_page(
+        request,
+        tmlib.commands.can_write_tasks,
+        tasks_controller)
+    tasks = page.items
     return render(request,
                   'tasks/index.html',
                   {'tasks': tasks,
+                   'pagination': _pagination(page, page_request, TASK_ORDERINGS),
+                   'permissions': _get_access_levels(
+                       request.user.id, [task.id for task in tasks]),
+                   'category_names': _get_category_names(request.user.id, tasks),
                    'user': request.user,
                    'nav_bar': 'tasks',
                    'foreign_category': True,
-                   'header': 'Other tasks that I can write',
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'header': 'Other tasks that I can write'})
+
+
+def _calendar_window(view, date):
+    """Returns (first day, number of days) of calendar: whole weeks of date's month or date's week"""
+
+    if view == 'week':
+        return date - datetime.timedelta(days=date.weekday()), 7
+    first_day = date.replace(day=1)
+    next_month = (first_day + datetime.timedelta(days=32)).replace(day=1)
+    start = first_day - datetime.timedelta(days=first_day.weekday())
+    end = next_month + datetime.timedelta(days=(7 - next_month.weekday()) % 7)
+    return start, (end - start).days
+
+
+def _calendar_weeks(start, days_count, tasks, month):
+    """Splits days of calendar into weeks. Every day gets list of tasks that take place on it"""
+
+    days = [{'date': start + datetime.timedelta(days=i), 'tasks': []} for i in range(days_count)]
+    for task in tasks:
+        task_start = (task.start_time or task.end_time).date()
+        task_end = (task.end_time or task.start_time).date()
+        first = max((task_start - start).days, 0)
+        last = min((task_end - start).days, days_count - 1)
+        for day in days[first:last + 1]:
+            day['tasks'].append(task)
+    for day in days:
+        day['in_month'] = month is None or day['date'].month == month
+        day['is_today'] = day['date'] == datetime.date.today()
+    return [days[i:i + 7] for i in range(0, days_count, 7)]
+
+
+@login_required
+def calendar(request):
+    view = 'week' if request.GET.get('view') == 'week' else 'month'
+    date = parse_date(request.GET.get('date') or '') or datetime.date.today()
+    start, days_count = _calendar_window(view, date)
+    window_start = datetime.datetime.combine(start, datetime.time())
+    tasks = tmlib.commands.tasks_in_window(
+        _create_tasks_controller(request.user.id),
+        window_start,
+        window_start + datetime.timedelta(days=days_count))
+    if view == 'week':
+        previous_date = date - datetime.timedelta(days=7)
+        next_date = date + datetime.timedelta(days=7)
+    else:
+        previous_date = (date.replace(day=1) - datetime.timedelta(days=1)).replace(day=1)
+        next_date = (date.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+    return render(request,
+                  'tasks/calendar.html',
+                  {'weeks': _calendar_weeks(
+                      start, days_count, tasks, date.month if view == 'month' else None),
+                   'view': view,
+                   'date': date,
+                   'previous_date': previous_date.isoformat(),
+                   'next_date': next_date.isoformat(),
+                   'user': request.user,
+                   'nav_bar': 'tasks'})
+
+
+@login_required
+def task_occurrence(request, id, time):
+    """Shows occurrence of virtual plan. POST stores it, then opens edit form or marks it as done"""
+
+    tasks_controller = _create_tasks_controller(request.user.id)
+    occurrence_at = parse_datetime(time)
+    if occurrence_at is None:
+        return redirect('task_manager:calendar')
+    task, access_level = tasks_controller.get_occurrence(int(id), occurrence_at)
+    if access_level.value < AccessLevel.READ.value:
+        return redirect('task_manager:calendar')
+    if not task.is_virtual:
+        return redirect('task_manager:show_task', task.id)
+    if request.method == 'POST':
+        try:
+            task = tmlib.commands.materialize_occurrence(tasks_controller, int(id), occurrence_at)
+        except UserHasNoRightError:
+            return redirect('task_manager:calendar')
+        if request.POST.get('action') == 'done':
+            tmlib.commands.set_task_status(tasks_controller, task.id, Status.DONE.value)
+            return redirect('task_manager:calendar')
+        return redirect('task_manager:edit_task', task.id)
+    return render(request,
+                  'tasks/occurrence.html',
+                  {'task': task,
+                   'can_write': access_level.value >= AccessLevel.WRITE.value,
+                   'user': request.user,
+                   'nav_bar': 'tasks'})
+
+
+@login_required
+def search_tasks(request):
+    query = request.GET.get('q', '').strip()
+    results = []
+    if query:
+        tasks_controller = _create_tasks_controller(request.user.id)
+        results = tmlib.commands.search_tasks(
+            tasks_controller, query, settings.TASK_MANAGER_SEARCH_LIMIT)
+    return render(request,
+                  'tasks/search.html',
+                  {'results': results,
+                   'search_query': query,
+                   'user': request.user,
+                   'nav_bar': 'tasks'})
 
 
 @login_required
-@process_plans
 def create_task(request):
     if request.method == 'POST':
         form = TaskForm(request.user.id, request.POST)
@@ -350,24 +541,14 @@ def create_task(request):
                     {
                         'form': form,
                         'user': request.user,
-                        'nav_bar': 'tasks',
-                        'pending_notifications': _get_pending_notifications(
-                            request.user.id)})
+                        'nav_bar': 'tasks'})
             can_read_users = form.cleaned_data['can_read']
             can_write_users = form.cleaned_data['can_write']
-            tmlib.commands.remove_all_users_for_read(tasks_controller, task.id)
-            if can_read_users is not None:
-                user_ids = [user.id for user in can_read_users]
-                for user_id in user_ids:
-                    tmlib.commands.add_user_for_read(
-                        tasks_controller, user_id, task.id)
-            tmlib.commands.remove_all_users_for_write(
-                tasks_controller, task.id)
-            if can_write_users is not None:
-                user_ids = [user.id for user in can_write_users]
-                for user_id in user_ids:
-                    tmlib.commands.add_user_for_write(
-                        tasks_controller, user_id, task.id)
+            tmlib.commands.set_task_acl(
+                tasks_controller,
+                task.id,
+                [user.id for user in can_read_users or []],
+                [user.id for user in can_write_users or []])
             return redirect('task_manager:tasks')
     else:
         status = Status.TODO.value,
@@ -393,8 +574,7 @@ def create_task(request):
                   'tasks/new.html',
                   {'form': form,
                    'user': request.user,
-                   'nav_bar': 'tasks',
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'nav_bar': 'tasks'})
 
 
 @login_required
@@ -434,12 +614,10 @@ def show_task(request, id):
                    'assigned_user': assigned_user,
                    'inner_tasks': inner_tasks,
                    'creator': creator.username,
-                   'foreign_category': category.user_id != request.user.id,
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'foreign_category': category.user_id != request.user.id})
 
 
 @login_required
-@process_plans
 def edit_task(request, id):
     tasks_controller = _create_tasks_controller(request.user.id)
     task = tmlib.commands.get_task_by_id(tasks_controller, id)
@@ -476,24 +654,14 @@ def edit_task(request, id):
                     {
                         'form': form,
                         'user': request.user,
-                        'nav_bar': 'tasks',
-                        'pending_notifications': _get_pending_notifications(
-                            request.user.id)})
+                        'nav_bar': 'tasks'})
             can_read_users = form.cleaned_data['can_read']
             can_write_users = form.cleaned_data['can_write']
-            tmlib.commands.remove_all_users_for_read(tasks_controller, task.id)
-            if can_read_users is not None:
-                user_ids = [user.id for user in can_read_users]
-                for user_id in user_ids:
-                    tmlib.commands.add_user_for_read(
-                        tasks_controller, user_id, task.id)
-            tmlib.commands.remove_all_users_for_write(
-                tasks_controller, task.id)
-            if can_write_users is not None:
-                user_ids = [user.id for user in can_write_users]
-                for user_id in user_ids:
-                    tmlib.commands.add_user_for_write(
-                        tasks_controller, user_id, task.id)
+            tmlib.commands.set_task_acl(
+                tasks_controller,
+                task.id,
+                [user.id for user in can_read_users or []],
+                [user.id for user in can_write_users or []])
             return redirect('task_manager:tasks')
     else:
         users_can_read_ids = tmlib.commands.get_users_can_read_task(
@@ -522,12 +690,10 @@ def edit_task(request, id):
                   'tasks/edit.html',
                   {'form': form,
                    'user': request.user,
-                   'nav_bar': 'tasks',
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'nav_bar': 'tasks'})
 
 
 @login_required
-@process_plans
 def update_task(request, id):
     tasks_controller = _create_tasks_controller(request.user.id)
     task = tmlib.commands.get_task_by_id(tasks_controller, id)
@@ -545,7 +711,6 @@ def update_task(request, id):
 
 
 @login_required
-@process_plans
 def delete_task(request, id):
     tasks_controller = _create_tasks_controller(request.user.id)
     if request.method == 'POST' and tmlib.commands.user_can_write_task(
@@ -557,7 +722,6 @@ def delete_task(request, id):
 
 
 @login_required
-@process_plans
 def delete_archived_task(request, id):
     tasks_controller = _create_tasks_controller(request.user.id)
     if request.method == 'POST' and tmlib.commands.user_can_write_task(
@@ -566,32 +730,22 @@ def delete_archived_task(request, id):
     return redirect('task_manager:tasks')
 
 
-def process_notifications(function):
-    def wrap(request, *args, **kwargs):
-        _create_notifications_controller(
-            request.user.id).process_notifications()
-        return function(request, *args, **kwargs)
-    return wrap
-
-
 @login_required
-@process_notifications
-@process_plans
 def notifications(request):
     tasks_controller = _create_tasks_controller(request.user.id)
-    tasks_with_start_time = tmlib.commands.filter_tasks(
-        tasks_controller, (TaskFilter.start_time > datetime.datetime.now()) & (
-            TaskFilter.user_id == request.user.id))
+    tasks_with_start_time = list(tmlib.commands.filter_tasks(
+        tasks_controller,
+        (TaskFilter.start_time > datetime.datetime.now()) & (
+            TaskFilter.user_id == request.user.id)).order_by('start_time'))
     return render(request,
                   'notifications/tasks.html',
                   {'tasks': tasks_with_start_time,
+                   'category_names': _get_category_names(request.user.id, tasks_with_start_time),
                    'user': request.user,
-                   'nav_bar': 'notifications',
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'nav_bar': 'notifications'})
 
 
 @login_required
-@process_notifications
 def create_notification(request, id):
     if request.method == 'POST':
         form = NotificationForm(request.POST)
@@ -620,12 +774,10 @@ def create_notification(request, id):
                   'notifications/new.html',
                   {'form': form,
                    'user': request.user,
-                   'nav_bar': 'notifications',
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'nav_bar': 'notifications'})
 
 
 @login_required
-@process_notifications
 def edit_notification(request, id):
     notifications_controller = _create_notifications_controller(
         request.user.id)
@@ -658,76 +810,103 @@ def edit_notification(request, id):
                   'notifications/edit.html',
                   {'form': form,
                    'user': request.user,
-                   'nav_bar': 'notifications',
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'nav_bar': 'notifications'})
 
 
 @login_required
-@process_notifications
 def all_notifications(request):
     notifications_controller = _create_notifications_controller(
         request.user.id)
-    notifications = tmlib.commands.user_notifications(notifications_controller)
+    page, page_request = _get_page(
+        request,
+        tmlib.commands.user_notifications,
+        notifications_controller)
+    notifications = page.items
     return render(request,
                   'notifications/index.html',
                   {'notifications': notifications,
+                   'pagination': _pagination(page, page_request, NOTIFICATION_ORDERINGS),
+                   'permissions': _get_access_levels(
+                       request.user.id,
+                       [notification.task_id for notification in notifications]),
+                   'task_titles': _get_task_titles(
+                       request.user.id, [notification.task_id for notification in notifications]),
                    'user': request.user,
                    'nav_bar': 'notifications',
-                   'header': 'All notifications',
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'header': 'All notifications'})
 
 
 @login_required
-@process_notifications
 def created_notifications(request):
     notifications_controller = _create_notifications_controller(
         request.user.id)
-    notifications = tmlib.commands.user_created_notifications(
+    page, page_request = _get_page(
+        request,
+        tmlib.commands.user_created_notifications,
         notifications_controller)
+    notifications = page.items
     return render(request,
                   'notifications/index.html',
                   {'notifications': notifications,
+                   'pagination': _pagination(page, page_request, NOTIFICATION_ORDERINGS),
+                   'permissions': _get_access_levels(
+                       request.user.id,
+                       [notification.task_id for notification in notifications]),
+                   'task_titles': _get_task_titles(
+                       request.user.id, [notification.task_id for notification in notifications]),
                    'user': request.user,
                    'nav_bar': 'notifications',
-                   'header': 'Created notifications',
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'header': 'Created notifications'})
 
 
 @login_required
-@process_notifications
 def pending_notifications(request):
     notifications_controller = _create_notifications_controller(
         request.user.id)
-    notifications = tmlib.commands.pending_notifications(
+    page, page_request = _get_page(
+        request,
+        tmlib.commands.pending_notifications,
         notifications_controller)
+    notifications = page.items
     return render(request,
                   'notifications/index.html',
                   {'notifications': notifications,
+                   'pagination': _pagination(page, page_request, NOTIFICATION_ORDERINGS),
+                   'permissions': _get_access_levels(
+                       request.user.id,
+                       [notification.task_id for notification in notifications]),
+                   'task_titles': _get_task_titles(
+                       request.user.id, [notification.task_id for notification in notifications]),
                    'user': request.user,
                    'nav_bar': 'notifications',
                    'header': 'Pending notifications',
-                   'view': 'pending',
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'view': 'pending'})
 
 
 @login_required
-@process_notifications
 def shown_notifications(request):
     notifications_controller = _create_notifications_controller(
         request.user.id)
-    notifications = tmlib.commands.user_shown_notifications(
+    page, page_request = _get_page(
+        request,
+        tmlib.commands.user_shown_notifications,
         notifications_controller)
+    notifications = page.items
     return render(request,
                   'notifications/index.html',
                   {'notifications': notifications,
+                   'pagination': _pagination(page, page_request, NOTIFICATION_ORDERINGS),
+                   'permissions': _get_access_levels(
+                       request.user.id,
+                       [notification.task_id for notification in notifications]),
+                   'task_titles': _get_task_titles(
+                       request.user.id, [notification.task_id for notification in notifications]),
                    'user': request.user,
                    'nav_bar': 'notifications',
-                   'header': 'Shown notifications',
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'header': 'Shown notifications'})
 
 
 @login_required
-@process_notifications
 def delete_notification(request, id):
     if request.method == 'POST':
         notifications_controller = _create_notifications_controller(
@@ -753,9 +932,9 @@ def templates(request):
     return render(request,
                   'plans/templates.html',
                   {'tasks': tasks,
+                   'category_names': _get_category_names(request.user.id, tasks),
                    'user': request.user,
-                   'nav_bar': 'plans',
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'nav_bar': 'plans'})
 
 
 @login_required
@@ -789,19 +968,11 @@ def create_template_task(request):
             task.id = tmlib.commands.add_task(tasks_controller, task).id
             can_read_users = form.cleaned_data['can_read']
             can_write_users = form.cleaned_data['can_write']
-            tmlib.commands.remove_all_users_for_read(tasks_controller, task.id)
-            if can_read_users is not None:
-                user_ids = [user.id for user in can_read_users]
-                for user_id in user_ids:
-                    tmlib.commands.add_user_for_read(
-                        tasks_controller, user_id, task.id)
-            tmlib.commands.remove_all_users_for_write(
-                tasks_controller, task.id)
-            if can_write_users is not None:
-                user_ids = [user.id for user in can_write_users]
-                for user_id in user_ids:
-                    tmlib.commands.add_user_for_write(
-                        tasks_controller, user_id, task.id)
+            tmlib.commands.set_task_acl(
+                tasks_controller,
+                task.id,
+                [user.id for user in can_read_users or []],
+                [user.id for user in can_write_users or []])
             return redirect('task_manager:templates')
     else:
         form = TaskFormWithoutStatus(request.user.id)
@@ -809,36 +980,48 @@ def create_template_task(request):
                   'tasks/new.html',
                   {'form': form,
                    'user': request.user,
-                   'nav_bar': 'plans',
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'nav_bar': 'plans'})
 
 
 @login_required
-@process_plans
 def plans(request):
     task_plans_controller = _create_task_plans_controller(request.user.id)
     plans = tmlib.commands.get_task_plans(task_plans_controller)
     return render(request,
                   'plans/index.html',
                   {'plans': plans,
+                   'task_titles': _get_task_titles(request.user.id, [plan.task_id for plan in plans]),
                    'user': request.user,
-                   'nav_bar': 'plans',
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'nav_bar': 'plans'})
+
+
+def _parse_plan_schedule(form):
+    """Returns (interval, rule) of plan form. Rule replaces interval if it's passed. Adds errors to form"""
+
+    rule = form.data.get('rule', '').strip() or None
+    if rule is not None:
+        try:
+            validate_task_plan_rule(rule)
+        except InvalidRecurrenceRuleError:
+            form.add_error('rule', "Rule is incorrect")
+        except InvalidTaskPlanIntervalError:
+            form.add_error('rule', "Rule should occur not more often than every 5 minutes")
+        return 0, rule
+    interval = parse(form.data.get('interval', ''))
+    if interval is None:
+        form.add_error('interval', "Interval is incorrect")
+    elif interval < 300:  # 5 minutes
+        form.add_error(
+            'interval',
+            "Interval should be more than 5 minutes")
+    return interval, None
 
 
 @login_required
-@process_plans
 def create_plan(request):
     if request.method == 'POST':
         form = PlanForm(request.user.id, request.POST)
-        str_interval = form.data['interval']
-        interval = parse(str_interval)
-        if interval is None:
-            form.add_error('interval', "Interval is incorrect")
-        elif interval < 300:  # 5 minutes
-            form.add_error(
-                'interval',
-                "Interval should be more than 5 minutes")
+        interval, rule = _parse_plan_schedule(form)
         if form.is_valid():
             last_created_at = form.cleaned_data['last_created_at']
             if last_created_at is None:
@@ -850,7 +1033,9 @@ def create_plan(request):
                 interval=interval,
                 last_created_at=last_created_at,
                 user_id=request.user.id,
-                task_id=task_id)
+                task_id=task_id,
+                is_virtual=True,
+                rule=rule)
             tmlib.commands.add_task_plan(
                 task_plans_controller, plan)
             return redirect('task_manager:plans')
@@ -865,12 +1050,10 @@ def create_plan(request):
                   'plans/new.html',
                   {'form': form,
                    'user': request.user,
-                   'nav_bar': 'plans',
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'nav_bar': 'plans'})
 
 
 @login_required
-@process_plans
 def edit_plan(request, id):
     task_plans_controller = _create_task_plans_controller(
         request.user.id)
@@ -880,20 +1063,14 @@ def edit_plan(request, id):
         return redirect('task_manager:plans')
     if request.method == 'POST':
         form = PlanForm(request.user.id, request.POST)
-        str_interval = form.data['interval']
-        interval = parse(str_interval)
-        if interval is None:
-            form.add_error('interval', "Interval is incorrect")
-        elif interval < 300:  # 5 minutes
-            form.add_error(
-                'interval',
-                "Interval should be more than 5 minutes")
+        interval, rule = _parse_plan_schedule(form)
         if form.is_valid():
             last_created_at = form.cleaned_data['last_created_at']
             if last_created_at is None:
                 last_created_at = datetime.datetime.now() - datetime.timedelta(seconds=interval)
             plan.last_created_at = last_created_at
             plan.interval = interval
+            plan.rule = rule
             tmlib.commands.update_task_plan(
                 task_plans_controller, plan)
             return redirect('task_manager:plans')
@@ -902,17 +1079,16 @@ def edit_plan(request, id):
                         initial={
                             'last_created_at': plan.last_created_at,
                             'interval': datetime.timedelta(
-                                seconds=plan.interval)})
+                                seconds=plan.interval) if plan.rule is None else '',
+                            'rule': plan.rule})
     return render(request,
                   'plans/edit.html',
                   {'form': form,
                    'user': request.user,
-                   'nav_bar': 'plans',
-                   'pending_notifications': _get_pending_notifications(request.user.id)})
+                   'nav_bar': 'plans'})
 
 
 @login_required
-@process_plans
 def delete_plan(request, id):
     if request.method == 'POST':
         task_plans_controller = _create_task_plans_controller(
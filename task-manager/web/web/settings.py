@@ -15,6 +15,22 @@ import os
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 TASK_MANAGER_DATABASE_PATH = os.path.join(BASE_DIR, 'db.sqlite3')
+# SQLite performance profile of task manager database: 'durable', 'balanced' or 'bulk-load'
+TASK_MANAGER_DATABASE_PROFILE = 'balanced'
+# number of tasks and notifications on one page of lists
+TASK_MANAGER_PAGE_SIZE = 50
+# maximal number of tasks found by search
+TASK_MANAGER_SEARCH_LIMIT = 50
+# number of days of upcoming occurrences shown on page of task plan
+TASK_MANAGER_PLAN_PREVIEW_DAYS = 14
+# number of pending notifications shown in header
+TASK_MANAGER_HEADER_NOTIFICATIONS = 10
+# maximal number of seconds that pending notifications in header are cached for, if CACHES has shared backend
+TASK_MANAGER_NOTIFICATIONS_CACHE_TIMEOUT = 300
+# seconds that lists of tasks and plans are cached for until user's data changes, 0 disables cache.
+# Lists are cached only if CACHES has shared backend (e.g. memcached), so run_scheduler and all web processes
+# bump data versions in it. Default per-process LocMemCache leaves cache disabled
+TASK_MANAGER_READ_CACHE_TIMEOUT = 300
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/1.11/howto/deployment/checklist/
@@ -52,6 +68,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'task_manager.middleware.UnitOfWorkMiddleware',
 ]
 
 ROOT_URLCONF = 'web.urls'
@@ -67,6 +84,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'task_manager.context_processors.pending_notifications',
             ],
         },
     },